@@ -39,54 +39,18 @@ for TASK in "${TASKS[@]}"
         #IDSPLIT=( $(grep -Eo '[^[:digit:]]+|[[:digit:]]+' <<<"SUB_ID") )
         #NEW_ID="${IDSPLIT[0]}$(printf %04d ${IDSPLIT[1]})"
 
-        if [ -d "$OUTPUT_DIR/$SUB_ID" ]
-        then
-            # shellcheck disable=SC2115
-            rm -rf "$OUTPUT_DIR/$SUB_ID"
+        #link (or copy if linking is not possible) the CT, T1, electrode
+        #locations, stim corrections, eeg and .mat files under the names
+        #data2bids expects, then write an inventory of them
+        STAGE_ARGS=()
+        if $ZIP ; then
+            STAGE_ARGS+=(--zip)
         fi
-        mkdir -p "$OUTPUT_DIR/$SUB_ID"
-
-        #CT scan .nii "[(pos)c]tI[(nPre)(Nt1)]"
-        find "$ORIG_DATA_DIR/ECoG_Recon_Full/$SUB_ID/elec_recon" -regex ".*[(postInPre)(ctINt1)]\.nii\.gz" -type f -exec cp -v {} "$OUTPUT_DIR/$SUB_ID/${SUB_ID}_CT.nii.gz" \;
-        #electrode locations .txt
-        find "$ORIG_DATA_DIR/../ECoG_Recon/$SUB_ID/elec_recon" -name "${SUB_ID}_elec_locations_RAS.txt" -type f -exec cp -v {} "$OUTPUT_DIR/$SUB_ID/" \;
-        #T1 MRI file .mgz
-        find "$ORIG_DATA_DIR/ECoG_Recon_Full/$SUB_ID/elec_recon" -name "T1.nii.gz" -type f -exec cp {} "$OUTPUT_DIR/$SUB_ID/${SUB_ID}_T1w.nii.gz" \; | head -1
-        #stim file corrections
-        if [ $TASK == "Phoneme_sequencing" ]
-        then
-            cp "$ORIG_DATA_DIR/ECoG_Task_Data/response_coding/PhonemeSequencingStimStarts.txt" "$OUTPUT_DIR/$SUB_ID/${SUB_ID}_PhonemeSequencingStimStarts.txt"
-        fi
-        #eeg files
-        if ! find "$ORIG_DATA_DIR/D_Data/$TASK/$SUB_ID" -regex ".*\.edf" -exec false {} +  ; then #search for edf files
-            find "$ORIG_DATA_DIR/D_Data/$TASK/$SUB_ID" -regex ".*\.edf" -exec cp -v -t "$OUTPUT_DIR/$SUB_ID/" {} +
-            if $ZIP ; then
-                find "$ORIG_DATA_DIR/D_Data/$TASK/$SUB_ID" -regex ".*\.edf" | xargs -I{} basename {} | xargs -I{} echo "$OUTPUT_DIR/$SUB_ID/{}" | xargs -I{} gzip -6 -v {}
-            fi
-        else #if no edf files find binary files
-            x=( $(find "$ORIG_DATA_DIR/D_Data/$TASK/$SUB_ID" -regex ".*$SUB_ID.*\.ieeg.dat" -type f | rev | sed -r "s|/|_|" | sed -r "s|/|noisseS/|" | rev | xargs -n 1 basename | sed -r "s|${SUB_ID}_||") )
-            y=( $(find "$ORIG_DATA_DIR/D_Data/$TASK/$SUB_ID" -regex ".*$SUB_ID.*\.ieeg.dat") )
-            z=${#x[@]}
-            if $ZIP ; then
-                for((i=0;i<=$z-1;i+=1));  do gzip -c -6 -v ${y[$i]} > "$OUTPUT_DIR/$SUB_ID/${SUB_ID}_${x[$i]}.gz" ; done
-            else 
-                for((i=0;i<=$z-1;i+=1));  do cp -v ${y[$i]} "$OUTPUT_DIR/$SUB_ID/${SUB_ID}_${x[$i]}" ; done
-            fi
-        fi
-        #find "$ORIG_DATA_DIR/D_Data/$TASK/$SUB_ID" -type f -regex ".*$SUB_ID.*\.ieeg\.dat" | xargs -n 1 basename | xargs -I{} cp "$OUTPUT_DIR/$SUB_ID/{}" "$OUTPUT_DIR/$SUB_ID/${SUB_ID}_{}"
-        find "$ORIG_DATA_DIR/D_Data/$TASK/$SUB_ID" -regex ".*experiment\.mat" -exec cp -v -t "$OUTPUT_DIR/$SUB_ID/" {} +
-        #event .mat
-        find "$ORIG_DATA_DIR/D_Data/$TASK/$SUB_ID" -regex ".*\/mat\/.*[tT]rial[(Info)s].*\.mat" -exec cp -v -t "$OUTPUT_DIR/$SUB_ID/" {} +
-        #triggers
-        #find "$ORIG_DATA_DIR/D_Data/$TASK/$SUB_ID" -regex ".*[Tt]rigger[0-9]?[0-9]?\.mat$" -exec cp -t "$OUTPUT_DIR/$SUB_ID/" {} +
-        #rename .mat
-        find "$OUTPUT_DIR/$SUB_ID" -type f -regex ".*\.mat" | xargs -n 1 basename | xargs -I{} mv -v "$OUTPUT_DIR/$SUB_ID/{}" "$OUTPUT_DIR/$SUB_ID/${SUB_ID}_{}"
-        #rename .dat
-        #find "$OUTPUT_DIR/$SUB_ID" -type f -regex "\.mat" | xargs -n 1 basename | xargs -I{} mv "$OUTPUT_DIR/$SUB_ID/{}" "$OUTPUT_DIR/$SUB_ID/${SUB_ID}_{}"
+        python3 data2bids.py stage -s "$SUB_ID" -t "$TASK" -i "$ORIG_DATA_DIR" -o "$OUTPUT_DIR" -c config.json -v "${STAGE_ARGS[@]}" || { echo "staging for $SUB_ID failed, trying next subject" ; continue; }
         #the big bad python code to convert the renamed files to BIDS
         #requires numpy, nibabel, and pathlib modules
-        python3 data2bids.py -c config.json -i "$OUTPUT_DIR/$SUB_ID" -o $BIDS_DIR -v || { echo "BIDS conversion for $SUB_ID failed, trying next subject" ; continue; }
-        rm -rf "$OUTPUT_DIR/$SUB_ID"
+        python3 data2bids.py -c config.json -i "$OUTPUT_DIR/$SUB_ID" -o $BIDS_DIR --inventory "$OUTPUT_DIR/${SUB_ID}_inventory.json" -v || { echo "BIDS conversion for $SUB_ID failed, trying next subject" ; continue; }
+        rm -rf "$OUTPUT_DIR/$SUB_ID" "$OUTPUT_DIR/${SUB_ID}_inventory.json"
 
         [[ $RAN_SUBS =~ (^| )$SUB_ID( |$) ]] || RAN_SUBS+=${SUB_ID}" "
         [[ $RAN_TASKS =~ (^| )$TASK( |$) ]] || RAN_TASKS+=${TASK}" "
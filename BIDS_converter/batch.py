@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import contextlib
+import gzip
+import itertools
+import json
+import os
+import os.path as op
+import sys
+import time
+import traceback
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                wait)
+from pathlib import Path
+from typing import List, Dict, Iterable
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from BIDS_converter.data2bids import Data2Bids, IEEG_FORMATS
+from BIDS_converter.utils import archive
+from BIDS_converter.utils import edf
+from BIDS_converter.utils import fileutils as fls
+from BIDS_converter.utils.instrument import PeakMemory
+from BIDS_converter.utils.utils import lazy_import
+
+np = lazy_import("numpy")
+
+# peak bytes per sample of a recording while it is converted, measured on
+# synthetic recordings and rounded up: the values read_edf holds, float64 or
+# int32 when digital, and the runs the split encodes from them
+BYTES_PER_SAMPLE = dict(physical=16, digital=8)
+# the interpreter with the converter and its imports
+BASE_BYTES = 128 << 20
+
+
+def get_parser():  # parses flags at onset of command
+    parser = argparse.ArgumentParser(
+        prog="data2bids batch",
+        formatter_class=argparse.RawDescriptionHelpFormatter, description="""
+        Runs Data2Bids over a subject by task matrix in a pool of worker proc
+        esses. Each worker imports the converter once and is then reused for
+        many subjects. A failed subject does not stop the batch, every job is
+        summarized in a json report at the end.
+
+        With a memory budget, the peak memory of every job is estimated from
+        the headers and sizes of its recordings, and jobs are only started
+        while the estimates of the running ones add up to at most the
+        budget. Smaller jobs are started ahead of a larger one that does not
+        fit yet.
+
+        Input directories are found with the input template, which is filled
+        with {root}, {task} and {sub}. One BIDS directory is written per task
+        at {output_root}/{task}/BIDS.""",
+        epilog="""
+        Made by Aaron Earle-Richardson (ae166@duke.edu)
+        """)
+
+    add_job_arguments(parser)
+    parser.add_argument("-j", "--n_jobs", type=int, default=os.cpu_count(),
+                        help="number of worker processes. Default: all cores")
+    parser.add_argument("--memory_budget", type=float, default=None,
+                        help="GB of memory the estimates of the running jobs"
+                             " add up to at most. Default: no limit")
+    parser.add_argument("-ow", "--overwrite", action='store_true',
+                        help="remove each task's BIDS directory once before "
+                             "converting")
+    parser.add_argument("-r", "--report", default=None,
+                        help="json summary report. Default: "
+                             "{output_root}/batch_report.json")
+    return parser
+
+
+def add_job_arguments(parser: argparse.ArgumentParser,
+                      required: bool = True):
+    """the arguments that define the jobs, shared with data2bids worker
+
+    :param required: whether --input_root is
+    :type required: bool
+    """
+    parser.add_argument("-s", "--subjects", nargs='*', default=[],
+                        help="subject IDs, for example D48 D52")
+    parser.add_argument("-t", "--tasks", nargs='*', default=[],
+                        help="task folder names, crossed with --subjects")
+    parser.add_argument("-m", "--matrix", default=None,
+                        help="json file mapping each task to a list of "
+                             "subjects, added to the --subjects x --tasks "
+                             "jobs")
+    parser.add_argument("-i", "--input_root", required=required,
+                        help="top directory of the staged input data")
+    parser.add_argument("--input_template", default="{root}/{task}/{sub}",
+                        help="input directory of one job. Default: "
+                             "{root}/{task}/{sub}")
+    parser.add_argument("-o", "--output_root", required=True,
+                        help="directory the per task BIDS folders go in")
+    parser.add_argument("-c", "--config", default=None,
+                        help="JSON configuration file")
+    parser.add_argument("--stim_template", default=None,
+                        help="stimuli directory of one job, filled like "
+                             "--input_template. Default: found by Data2Bids")
+    parser.add_argument("--stim_store", default=None,
+                        help="content addressed store for the stimuli of "
+                             "every task, so stimuli shared between tasks are "
+                             "stored once and hardlinked into each BIDS "
+                             "directory")
+    parser.add_argument("-f", "--format", dest="ieeg_format", default="edf",
+                        choices=list(IEEG_FORMATS),
+                        help="format the iEEG recordings are split into. "
+                             "Default: edf")
+    parser.add_argument("--profile", action='store_true',
+                        help="have every job write a data2bids --profile "
+                             "report next to its task's BIDS directory")
+    parser.add_argument("-v", "--verbose", action='store_true',
+                        help="verbosity")
+
+
+def make_jobs(subjects: List[str], tasks: List[str], matrix: Dict[
+        str, List[str]] = None) -> List[Dict[str, str]]:
+    """builds the list of subject/task jobs without duplicates
+
+    :param subjects: subjects crossed with every task
+    :type subjects: list
+    :param tasks: tasks crossed with every subject
+    :type tasks: list
+    :param matrix: extra jobs as a task to subject list mapping
+    :type matrix: dict
+    :return: jobs as dicts with 'sub' and 'task' keys
+    :rtype: list
+    """
+    pairs = list(itertools.product(tasks, subjects))
+    for task, subs in (matrix or {}).items():
+        pairs.extend((task, sub) for sub in subs)
+    jobs = []
+    for task, sub in dict.fromkeys(pairs):
+        jobs.append(dict(sub=sub, task=task))
+    return jobs
+
+
+def job_kwargs(job: Dict[str, str], input_root: str, input_template: str,
+               output_root: str, config: str = None,
+               stim_template: str = None, verbose: bool = False,
+               stim_store: str = None, profile: bool = False,
+               ieeg_format: str = "edf", n_jobs: int = 1) -> dict:
+    """Data2Bids keyword arguments for one job
+
+    :param n_jobs: processes and threads of the job itself, the cores left
+        to each of the jobs running at once
+    :type n_jobs: int
+    """
+    fill = dict(root=input_root, **job)
+    kwargs = dict(input_dir=input_template.format(**fill),
+                  output_dir=op.join(output_root, job["task"]),
+                  config=config, verbose=verbose, stim_store=stim_store,
+                  profile=profile or None, ieeg_format=ieeg_format,
+                  n_jobs=n_jobs)
+    if stim_template is not None:
+        kwargs["stim_dir"] = stim_template.format(**fill)
+    return kwargs
+
+
+def recording_bytes(filename: str, itemsize: int = 4,
+                    per_sample: int = BYTES_PER_SAMPLE["physical"]) -> int:
+    """estimated peak bytes of converting one recording, read from its EDF
+    header or from the size of a binary recording
+
+    :param filename: .edf or .dat file, gzipped or in a tar archive
+    :type filename: str
+    :param itemsize: bytes of a value of a binary recording
+    :type itemsize: int
+    :param per_sample: peak bytes per sample, see BYTES_PER_SAMPLE
+    :type per_sample: int
+    """
+    if archive.is_archive(filename):
+        with archive.open_member(filename, (".edf", ".dat"),
+                                 drain=False) as (info, fobj):
+            if info.name.lower().endswith(".edf"):
+                return edf.header_samples(fobj) * per_sample
+            size = info.size
+    elif filename.lower().endswith((".edf", ".edf.gz")):
+        with (gzip.open if filename.lower().endswith(".gz") else open)(
+                filename, "rb") as fobj:
+            return edf.header_samples(fobj) * per_sample
+    elif filename.lower().endswith(".gz"):
+        with open(filename, "rb") as fobj:
+            # the gzip trailer ends with the size modulo 4 GB
+            fobj.seek(-4, os.SEEK_END)
+            size = int.from_bytes(fobj.read(4), "little")
+    else:
+        size = op.getsize(filename)
+    # force_to_edf holds the raw values too
+    return size // itemsize * per_sample + size
+
+
+def estimate_job(input_dir: str, n_jobs: int = 1, itemsize: int = 4,
+                 per_sample: int = BYTES_PER_SAMPLE["physical"]) -> int:
+    """estimated peak bytes of one job, without reading any samples
+
+    The largest recordings of the job are counted as converted at once, as
+    many as the job has processes.
+
+    :param input_dir: input directory of the job
+    :type input_dir: str
+    :param n_jobs: processes and threads of the job itself
+    :type n_jobs: int
+    :param itemsize: bytes of a value of a binary recording
+    :type itemsize: int
+    :param per_sample: peak bytes per sample, see BYTES_PER_SAMPLE
+    :type per_sample: int
+    """
+    recordings = []
+    for dirpath, _, filenames in os.walk(input_dir):
+        for name in filenames:
+            lower = name.lower()
+            if not (archive.is_archive(lower) or lower.endswith(
+                    (".edf", ".edf.gz", ".dat", ".dat.gz"))):
+                continue
+            try:
+                recordings.append(recording_bytes(
+                    op.join(dirpath, name), itemsize, per_sample))
+            except (OSError, ValueError, EOFError):
+                # left for the conversion to fail on, or not a recording
+                continue
+    recordings.sort(reverse=True)
+    return BASE_BYTES + sum(recordings[:max(n_jobs, 1)])
+
+
+def prepare_output(bids_dir: str, overwrite: bool = False):
+    # done once in the parent so that workers never race to create or wipe
+    # the shared BIDS directory
+    if overwrite and op.isdir(bids_dir):
+        fls.force_remove(bids_dir)
+    os.makedirs(op.join(bids_dir, "stimuli"), exist_ok=True)
+
+
+def convert(job: dict) -> dict:
+    """Runs one Data2Bids conversion and reports instead of raising
+
+    Output of the conversion goes to the job's log file so that concurrent
+    jobs do not interleave on the terminal.
+    """
+    result = dict(sub=job["sub"], task=job["task"], status="ok", error=None,
+                  log=job.get("log"), estimated_mb=_mb(job.get("estimate")))
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        memory = stack.enter_context(PeakMemory())
+        if job.get("log") is not None:
+            log = stack.enter_context(open(job["log"], "w"))
+            stack.enter_context(contextlib.redirect_stdout(log))
+            stack.enter_context(contextlib.redirect_stderr(log))
+        try:
+            Data2Bids(**job["kwargs"]).run()
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = repr(e)
+            traceback.print_exc()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["peak_mb"] = _mb(memory.peak)
+    return result
+
+
+def _mb(size: int = None):
+    return None if size is None else round(size / (1 << 20))
+
+
+def admit(pending: List[dict], running: List[dict], budget: float = None,
+          workers: int = 1) -> List[dict]:
+    """takes the jobs to start now out of pending
+
+    Jobs are taken in order while a worker is free and the estimates of
+    the running jobs add up to at most budget. A job that does not fit
+    leaves the room to later, smaller ones, unless nothing runs, in which
+    case it runs alone.
+
+    :param pending: jobs not started yet, with their estimate in bytes
+    :type pending: list
+    :param running: jobs started and not finished
+    :type running: list
+    :param budget: bytes, no limit if None
+    :type budget: float
+    :param workers: jobs that may run at once
+    :type workers: int
+    :return: the jobs to start
+    :rtype: list
+    """
+    budget = float("inf") if budget is None else budget
+    used = sum(job.get("estimate", 0) for job in running)
+    started = []
+    for job in list(pending):
+        if len(running) + len(started) >= workers:
+            break
+        if used + job.get("estimate", 0) <= budget or not (
+                running or started):
+            pending.remove(job)
+            started.append(job)
+            used += job.get("estimate", 0)
+    return started
+
+
+def run_jobs(jobs: List[dict], n_jobs: int = 1, budget: float = None
+             ) -> Iterable[dict]:
+    """yields job results as they finish
+
+    :param budget: bytes the estimates of the running jobs add up to at
+        most, see admit
+    :type budget: float
+    """
+    if n_jobs is None or n_jobs <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield convert(job)
+        return
+    workers = min(n_jobs, len(jobs))
+    pending, running = list(jobs), {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for job in admit(pending, list(running.values()), budget,
+                             workers):
+                running[pool.submit(convert, job)] = job
+            done = wait(running, return_when=FIRST_COMPLETED)[0]
+            for future in done:
+                job = running.pop(future)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    # the worker itself died, for example killed when out of
+                    # memory
+                    yield dict(sub=job["sub"], task=job["task"],
+                               status="failed", error=repr(e),
+                               log=job.get("log"), seconds=None,
+                               estimated_mb=_mb(job.get("estimate")),
+                               peak_mb=None)
+
+
+def summarize(results: List[dict], seconds: float) -> dict:
+    failed = [r for r in results if r["status"] != "ok"]
+    return dict(jobs=len(results), succeeded=len(results) - len(failed),
+                failed=len(failed), seconds=round(seconds, 3),
+                results=sorted(results, key=lambda r: (r["task"], r["sub"])))
+
+
+def build_jobs(args: argparse.Namespace, concurrent: int = 1
+               ) -> List[dict]:
+    """the jobs of the parsed arguments, with their Data2Bids keyword
+    arguments, log file and memory estimate
+
+    :param args: arguments of add_job_arguments
+    :type args: argparse.Namespace
+    :param concurrent: jobs run at once, which share the cores
+    :type concurrent: int
+    :return: jobs as dicts
+    :rtype: list
+    """
+    matrix = None
+    if args.matrix is not None:
+        with open(args.matrix, "r") as fst:
+            matrix = json.load(fst)
+    jobs = make_jobs(args.subjects, args.tasks, matrix)
+    if not jobs:
+        raise ValueError("No jobs given, use --subjects and --tasks or "
+                         "--matrix")
+
+    log_dir = op.join(args.output_root, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    # every job would use all the cores otherwise, each with a recording
+    # in memory
+    n_jobs = max(1, (os.cpu_count() or 1) // max(min(concurrent or 1,
+                                                     len(jobs)), 1))
+    # the configuration each job finds, like Data2Bids.set_config_path
+    config = args.config
+    if config is None:
+        config = "config.json" if op.isfile("config.json") else op.join(
+            parent, "config.json")
+    with open(config, "r") as fst:
+        ieeg = json.load(fst).get("ieeg", {})
+    itemsize = np.dtype(ieeg.get("binaryEncoding", "float32")).itemsize
+    per_sample = BYTES_PER_SAMPLE["digital" if ieeg.get("digital") else
+                                  "physical"]
+    for job in jobs:
+        job["kwargs"] = job_kwargs(job, args.input_root, args.input_template,
+                                   args.output_root, args.config,
+                                   args.stim_template, args.verbose,
+                                   args.stim_store, args.profile,
+                                   args.ieeg_format, n_jobs)
+        job["log"] = op.join(log_dir, "{}_{}.log".format(job["task"],
+                                                          job["sub"]))
+        job["estimate"] = estimate_job(job["kwargs"]["input_dir"], n_jobs,
+                                       itemsize, per_sample)
+    return jobs
+
+
+def main(argv: List[str] = None) -> dict:
+    args = get_parser().parse_args(argv)
+    jobs = build_jobs(args, args.n_jobs)
+    for task in dict.fromkeys(job["task"] for job in jobs):
+        prepare_output(op.join(args.output_root, task, "BIDS"),
+                       args.overwrite)
+
+    start = time.perf_counter()
+    results = []
+    budget = None if args.memory_budget is None else \
+        args.memory_budget * (1 << 30)
+    for result in run_jobs(jobs, args.n_jobs, budget):
+        results.append(result)
+        print("{status:>6} {task} {sub} ({seconds}s, {estimated_mb} MB "
+              "estimated, {peak_mb} MB peak)".format(**result))
+    report = summarize(results, time.perf_counter() - start)
+    report_file = args.report or op.join(args.output_root,
+                                         "batch_report.json")
+    fls.write_json(report_file, report)
+    print("{succeeded}/{jobs} conversions succeeded in {seconds}s, report "
+          "written to {file}".format(file=report_file, **report))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+from BIDS_converter.benchmarks.suite import main
+
+main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compression throughput of gzip.open against ParallelGzipWriter
+
+Usage: python -m BIDS_converter.benchmarks.bench_gzip [-s MB] [-l LEVEL]
+"""
+
+import argparse
+import gzip
+import io
+import os
+import os.path as op
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+file = Path(__file__).resolve()
+sys.path.append(str(file.parents[2]))
+
+from BIDS_converter.utils import fileutils as fls
+
+
+def volume(size: int) -> bytes:
+    """int16 noise around a smooth signal, about as compressible as a T1"""
+    rng = np.random.default_rng(0)
+    n = size // 2
+    signal = 1000 * np.sin(np.linspace(0, 200 * np.pi, n))
+    return (signal + rng.normal(0, 20, n)).astype(np.int16).tobytes()
+
+
+def serial(data: bytes, filename: str, level: int):
+    # the path mri_file_transfer took before ParallelGzipWriter
+    with gzip.open(filename, "wb", level) as f_out:
+        fls.copy_file(io.BytesIO(data), f_out, is_obj=True)
+
+
+def parallel(data: bytes, filename: str, level: int, n_threads: int = None):
+    with fls.ParallelGzipWriter(filename, level, n_threads) as f_out:
+        fls.copy_file(io.BytesIO(data), f_out, is_obj=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-s", "--size", type=int, default=256,
+                        help="uncompressed MB")
+    parser.add_argument("-l", "--level", type=int, default=6,
+                        help="compression level")
+    parser.add_argument("-j", "--n_threads", type=int, default=None,
+                        help="compression threads, default all cores")
+    args = parser.parse_args(argv)
+
+    data = volume(args.size << 20)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, func, kwargs in (
+                ("gzip.open", serial, {}),
+                ("ParallelGzipWriter", parallel,
+                 dict(n_threads=args.n_threads))):
+            out = op.join(tmp, name + ".gz")
+            start = time.perf_counter()
+            func(data, out, args.level, **kwargs)
+            elapsed = time.perf_counter() - start
+            with gzip.open(out, "rb") as f_in:
+                assert f_in.read() == data, name + " did not round trip"
+            print("{:>20}: {:8.1f} MB/s, ratio {:.3f}".format(
+                name, len(data) / elapsed / 1e6,
+                op.getsize(out) / len(data)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmarks of the conversion hot paths with a history of past results
+
+Every benchmark builds its inputs in a scratch directory, from the bundled
+Phoneme_Sequencing metadata and the synthetic dataset generator, so the
+suite runs offline. Results are appended to a JSON lines history and
+compared with the median of the last runs on the same machine and scale;
+a metric that got worse by more than the threshold is a regression and
+makes the run exit with status 1, so a nightly rebuild can stop before
+deployment.
+
+Usage: python -m BIDS_converter.benchmarks [-b NAME...] [-s SCALE]
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import os.path as op
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+from typing import Callable, Dict, List
+
+file = Path(__file__).resolve()
+sys.path.append(str(file.parents[2]))
+
+from BIDS_converter import synthetic
+from BIDS_converter.utils import fileutils as fls
+from BIDS_converter.utils.utils import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+REPO = str(file.parents[2])
+SOURCEDATA = op.join(REPO, "Data", "Phoneme_Sequencing", "sourcedata")
+CONFIG = op.join(REPO, "BIDS_converter", "config.json")
+# bundled subjects with task metadata
+SUBJECTS = ("D48", "D52")
+# whether a larger value of a unit is better
+HIGHER_IS_BETTER = {"s": False, "MB/s": True}
+
+BENCHMARKS = {}
+
+
+def benchmark(func: Callable) -> Callable:
+    """registers func(workdir, scale, repeat) -> {metric: (value, unit)}
+    under its name without the bench_ prefix"""
+    BENCHMARKS[func.__name__.replace("bench_", "", 1)] = func
+    return func
+
+
+def best_of(func: Callable, repeat: int = 1) -> float:
+    """shortest wall time of func over repeat calls"""
+    times = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def write_config(filename: str, workbook: str = "Trigger") -> str:
+    """the packaged config pointed at a workbook, "Trigger" to use none"""
+    with open(CONFIG, "r") as fst:
+        config = json.load(fst)
+    config["ieeg"]["headerData"]["default"] = workbook
+    with open(filename, "w") as fst:
+        json.dump(config, fst)
+    return filename
+
+
+def bundled_data(workdir: str, subjects: List[str] = SUBJECTS,
+                 n_channels: int = None) -> Dict[str, str]:
+    """copies the bundled metadata of subjects into workdir/data
+
+    With n_channels, a synthetic EDF recording of that many of each
+    subject's channels is written for every Rec of its Trials.mat, long
+    enough for its trials and with trigger pulses at their onsets, since
+    the recordings themselves are not part of the repository.
+    """
+    data_dir = op.join(workdir, "data")
+    workbook = "Trigger"
+    for sub in subjects:
+        shutil.copytree(op.join(SOURCEDATA, sub), op.join(data_dir, sub))
+    if n_channels is not None:
+        from BIDS_converter.utils import organize as org
+        workbook = op.join(workdir, "Timestamps.xlsx")
+        synthetic.write_workbook(workbook, list(subjects))
+        for sub in subjects:
+            sub_dir = op.join(data_dir, sub)
+            experiment = op.join(sub_dir, sub + "_experiment.mat")
+            labels = org.mat2df(experiment, "channels.name").tolist()
+            rate = int(org.mat2df(experiment, "recording.sample_rate"
+                                  ).iloc[0])
+            trials = org.mat2df(op.join(sub_dir, sub + "_Trials.mat"))
+            recs = trials["Rec"].unique()
+            for rec in recs:
+                rec_trials = trials[trials["Rec"] == rec]
+                onsets = rec_trials["Start"] / synthetic.TASK_RATE
+                seconds = rec_trials["ResponseEnd"].max() / \
+                    synthetic.TASK_RATE + synthetic.MARGIN
+                suffix = "" if len(recs) == 1 else "_Session{}".format(
+                    int(rec))
+                synthetic.write_edf(
+                    op.join(sub_dir, "{} {} COGAN_PHONEMESEQUENCING{}.edf"
+                            "".format(sub, rec_trials["Day"].iloc[0],
+                                      suffix)),
+                    labels[:n_channels] + [synthetic.TRIGGER],
+                    synthetic.signal_blocks(n_channels, rate,
+                                            int(seconds * rate),
+                                            onsets.tolist()), rate)
+    os.makedirs(op.join(workdir, "out"))
+    return dict(input_dir=data_dir, output_dir=op.join(workdir, "out"),
+                config=write_config(op.join(workdir, "config.json"),
+                                    workbook),
+                stim_dir=op.join(SOURCEDATA, "stimuli"))
+
+
+def convert(**kwargs) -> Dict[str, dict]:
+    """runs a profiled conversion and returns its totals per stage"""
+    from BIDS_converter.data2bids import Data2Bids
+    os.makedirs(kwargs["output_dir"], exist_ok=True)
+    profile = op.join(kwargs["output_dir"], "profile.json")
+    Data2Bids(profile=profile, **kwargs).run()
+    with open(profile, "r") as fst:
+        return json.load(fst)["totals"]
+
+
+@benchmark
+def bench_names(workdir: str, scale: float = 1., repeat: int = 3):
+    """org.match_regexp and Data2Bids.generate_names over many filenames"""
+    from BIDS_converter.data2bids import Data2Bids
+    from BIDS_converter.utils import organize as org
+    kwargs = bundled_data(workdir, ["D48"])
+    with open(kwargs["config"], "r") as fst:
+        part = json.load(fst)["partLabel"]
+    d2b = Data2Bids(lazy=True, **kwargs)
+    d2b.prepare()
+    names = ["D48 2009{:02d} COGAN_PHONEMESEQUENCING_Session{}.edf".format(
+        i % 12 + 1, i % 9 + 1) for i in range(max(int(20000 * scale), 1))]
+    return {"match_regexp": (best_of(lambda: [org.match_regexp(
+                part, name) for name in names], repeat), "s"),
+            "generate_names": (best_of(lambda: [d2b.generate_names(
+                name, verbose=False) for name in names], repeat), "s")}
+
+
+@benchmark
+def bench_events(workdir: str, scale: float = 1., repeat: int = 3):
+    """Data2Bids.events2tsv and org.frame2bids on a long trial table"""
+    from BIDS_converter.data2bids import Data2Bids
+    from BIDS_converter.utils import organize as org
+    kwargs = bundled_data(workdir, ["D48"])
+    with open(kwargs["config"], "r") as fst:
+        event_format = json.load(fst)["eventFormat"]
+    d2b = Data2Bids(lazy=True, **kwargs)
+    d2b.prepare()
+    sub_dir = op.join(d2b.get_data_dir(), "D48")
+    mat_files = [op.join(sub_dir, f) for f in ("D48_Trials.mat",
+                                               "D48_trialInfo.mat")]
+    trials = org.gather_metadata(mat_files)
+    trials = pd.concat([trials] * max(int(100 * scale), 1),
+                       ignore_index=True)
+    ieeg_dir = op.join(d2b.get_bids_dir(), "sub-D0048", "ieeg")
+    os.makedirs(ieeg_dir, exist_ok=True)
+    results = {"events2tsv": (best_of(lambda: d2b.events2tsv(
+        trials, mat_files[0]), repeat), "s")}
+    events = pd.concat([pd.read_csv(op.join(ieeg_dir, f), sep="\t")
+                        for f in sorted(os.listdir(ieeg_dir))],
+                       ignore_index=True).replace("[]", np.NaN)
+    results["frame2bids"] = (best_of(lambda: org.frame2bids(
+        events, event_format, d2b.stim_dir, 2048), repeat),
+        "s")
+    return results
+
+
+@benchmark
+def bench_split(workdir: str, scale: float = 1., repeat: int = 1):
+    """read_edf and the split write_edf of a synthetic EDF recording, into
+    EDF, BrainVision and, if h5py is installed, NWB"""
+    dataset = synthetic.make_dataset(op.join(workdir, "data"),
+                                     n_channels=64,
+                                     hours=max(0.2 * scale, 0.01))
+    formats = ["edf", "brainvision"]
+    if importlib.util.find_spec("h5py") is not None:
+        formats.append("nwb")
+    wall = dict(read_edf=[], split=[])
+    for i in range(max(repeat, 1)):
+        for ieeg_format in formats:
+            totals = convert(input_dir=dataset["subjects"]["D1"],
+                             config=dataset["config"],
+                             output_dir=op.join(workdir, "out{}{}".format(
+                                 ieeg_format, i)),
+                             stim_dir=dataset["stim_dir"],
+                             ieeg_format=ieeg_format)
+            if ieeg_format == "edf":
+                wall["read_edf"].append(totals["read_edf"]["wall"])
+                wall["split"].append(totals["split"]["wall"])
+            else:
+                wall.setdefault("split_" + ieeg_format, []).append(
+                    totals["split"]["wall"])
+    wall["read_split"] = [sum(w) for w in zip(wall["read_edf"],
+                                              wall["split"])]
+    return {stage: (dataset["bytes"] / min(w) / 1e6, "MB/s") for stage, w
+            in wall.items()}
+
+
+@benchmark
+def bench_force_to_edf(workdir: str, scale: float = 1., repeat: int = 1):
+    """force_to_edf conversion of a synthetic binary .ieeg.dat recording"""
+    dataset = synthetic.make_dataset(op.join(workdir, "data"),
+                                     n_channels=64,
+                                     hours=max(0.1 * scale, 0.01),
+                                     fmt="dat")
+    wall = []
+    for i in range(max(repeat, 1)):
+        totals = convert(input_dir=dataset["subjects"]["D1"],
+                         config=dataset["config"],
+                         output_dir=op.join(workdir, "out{}".format(i)),
+                         stim_dir=dataset["stim_dir"])
+        wall.append(totals["force_to_edf"]["wall"])
+        # the converted EDF is written next to the source
+        for root, _, files in os.walk(dataset["subjects"]["D1"]):
+            for f in files:
+                if f.endswith(".edf"):
+                    os.remove(op.join(root, f))
+    return {"force_to_edf": (dataset["bytes"] / min(wall) / 1e6, "MB/s")}
+
+
+@benchmark
+def bench_mri(workdir: str, scale: float = 1., repeat: int = 3):
+    """fls.mri_file_transfer gzip of a .nii and conversion of a .mgh"""
+    import nibabel as nib
+    n = max(int(256 * scale ** (1 / 3)), 8)
+    rng = np.random.default_rng(0)
+    signal = np.sin(np.linspace(0, 20 * np.pi, n ** 3)).reshape((n,) * 3)
+    data = (1000 * signal + rng.normal(0, 20, (n,) * 3)).astype(np.int16)
+    config = dict(compress=True, compressLevel=6, repetitionTimeInSec=1)
+    out = op.join(workdir, "out")
+    os.makedirs(out)
+    results = {}
+    for ext, img in ((".nii", nib.Nifti1Image), (".mgh", nib.MGHImage)):
+        src = op.join(workdir, "T1" + ext)
+        nib.save(img(data, np.eye(4)), src)
+        seconds = best_of(lambda: fls.mri_file_transfer(
+            src, out, "sub-01_T1w", config), repeat)
+        results["transfer" + ext.replace(".", "_")] = (
+            data.nbytes / seconds / 1e6, "MB/s")
+    return results
+
+
+@benchmark
+def bench_run(workdir: str, scale: float = 1., repeat: int = 1):
+    """end to end Data2Bids.run of the bundled D48 and D52 metadata with
+    synthetic recordings of some of their channels"""
+    kwargs = bundled_data(workdir, n_channels=max(int(8 * scale), 1))
+    wall = []
+    for i in range(max(repeat, 1)):
+        kwargs["output_dir"] = op.join(workdir, "out{}".format(i))
+        start = time.perf_counter()
+        convert(**kwargs)
+        wall.append(time.perf_counter() - start)
+    return {"D48_D52": (min(wall), "s")}
+
+
+def run(names: List[str] = None, scale: float = 1., repeat: int = None,
+        tmp: str = None, verbose: bool = False) -> Dict[str, dict]:
+    """runs the benchmarks in names, all by default
+
+    :return: "{benchmark}.{metric}" to value and unit
+    :rtype: dict
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        kwargs = dict(scale=scale)
+        if repeat is not None:
+            kwargs["repeat"] = repeat
+        with tempfile.TemporaryDirectory(dir=tmp) as workdir, \
+                warnings.catch_warnings(), contextlib.ExitStack() as stack:
+            warnings.simplefilter("ignore")
+            if not verbose:
+                # the converter reports every file it writes
+                stack.enter_context(contextlib.redirect_stdout(
+                    io.StringIO()))
+            metrics = BENCHMARKS[name](workdir, **kwargs)
+        for metric, (value, unit) in metrics.items():
+            results["{}.{}".format(name, metric)] = dict(value=value,
+                                                          unit=unit)
+            print("{:>32}: {:10.4g} {}".format(name + "." + metric, value,
+                                               unit))
+    return results
+
+
+def git_commit() -> str:
+    """commit of the checkout being benchmarked, None outside of git"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine() -> str:
+    """results are only compared between runs on the same machine"""
+    return "{} {} {} {}cpu py{}".format(
+        platform.node(), platform.system(), platform.machine(),
+        os.cpu_count(), platform.python_version())
+
+
+def load_history(filename: str) -> List[dict]:
+    if not op.isfile(filename):
+        return []
+    with open(filename, "r") as fst:
+        return [json.loads(line) for line in fst if line.strip()]
+
+
+def append_history(filename: str, entry: dict):
+    os.makedirs(op.dirname(op.abspath(filename)), exist_ok=True)
+    with open(filename, "a") as fst:
+        fst.write(json.dumps(entry) + "\n")
+
+
+def find_regressions(entry: dict, history: List[dict],
+                     threshold: float = 0.25, window: int = 5
+                     ) -> Dict[str, dict]:
+    """metrics of entry worse than the median of comparable past runs
+
+    :param entry: results of this run with its machine and scale
+    :type entry: dict
+    :param history: earlier entries, oldest first
+    :type history: list
+    :param threshold: tolerated relative change, 0.25 for 25 %
+    :type threshold: float
+    :param window: number of latest comparable runs in the baseline
+    :type window: int
+    :return: metric to its value, baseline and relative change
+    :rtype: dict
+    """
+    past = [e for e in history if e["machine"] == entry["machine"] and
+            e["scale"] == entry["scale"]]
+    regressions = {}
+    for metric, result in entry["results"].items():
+        values = [e["results"][metric]["value"] for e in past
+                  if metric in e["results"]][-window:]
+        if not values:
+            continue
+        baseline = statistics.median(values)
+        change = (result["value"] - baseline) / baseline if baseline \
+            else 0.
+        if HIGHER_IS_BETTER[result["unit"]]:
+            change = -change
+        if change > threshold:
+            regressions[metric] = dict(value=result["value"],
+                                       baseline=baseline, change=change)
+    return regressions
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog="data2bids benchmark",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument("-b", "--benchmarks", nargs='*', default=None,
+                        choices=list(BENCHMARKS),
+                        help="benchmarks to run. Default: all")
+    parser.add_argument("-s", "--scale", type=float, default=1.,
+                        help="size of the inputs relative to the default, "
+                             "only runs of the same scale are compared")
+    parser.add_argument("-r", "--repeat", type=int, default=None,
+                        help="repetitions, the best is kept. Default: 3 "
+                             "for the fast benchmarks, 1 for conversions")
+    parser.add_argument("--history", default=op.join(
+        REPO, ".benchmarks", "history.jsonl"),
+                        help="JSON lines file of past results. Default: "
+                             ".benchmarks/history.jsonl in the repository")
+    parser.add_argument("-t", "--threshold", type=float, default=0.25,
+                        help="tolerated relative slowdown. Default: 0.25")
+    parser.add_argument("-w", "--window", type=int, default=5,
+                        help="latest runs the baseline is the median of. "
+                             "Default: 5")
+    parser.add_argument("--no_save", action='store_true',
+                        help="do not append this run to the history")
+    parser.add_argument("--tmp", default=None,
+                        help="scratch directory for the inputs")
+    parser.add_argument("-v", "--verbose", action='store_true',
+                        help="show the converter output")
+    return parser
+
+
+def main(argv: List[str] = None) -> dict:
+    args = get_parser().parse_args(argv)
+    entry = dict(time=time.time(), commit=git_commit(), machine=machine(),
+                 scale=args.scale)
+    entry["results"] = run(args.benchmarks, args.scale, args.repeat,
+                           args.tmp, args.verbose)
+    regressions = find_regressions(entry, load_history(args.history),
+                                   args.threshold, args.window)
+    entry["regressions"] = sorted(regressions)
+    if not args.no_save:
+        append_history(args.history, entry)
+    for metric, reg in regressions.items():
+        print("REGRESSION {}: {:.4g} against a baseline of {:.4g} ({:+.0%})"
+              "".format(metric, reg["value"], reg["baseline"],
+                        reg["change"]))
+    if regressions:
+        sys.exit(1)
+    return entry
+
+
+if __name__ == '__main__':
+    main()
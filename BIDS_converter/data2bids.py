@@ -1,23 +1,23 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from __future__ import annotations
 
 import argparse
+import contextlib
 import datetime
 import gc
 import gzip
+import importlib.util
 import json
 import os
 import os.path as op
 import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple, Any, Optional, List, Union, Dict, TypeVar
-
-import numpy as np
-import pandas as pd
-import pydicom as dicom
-from bids import layout
-from pyedflib import highlevel, EdfReader
+from typing import (Tuple, Any, Optional, List, Union, Dict, TypeVar,
+                    Iterator)
 
 import sys
 
@@ -25,12 +25,35 @@ file = Path(__file__).resolve()
 parent, root = file.parent, file.parents[1]
 sys.path.append(str(root))
 
+from BIDS_converter.utils import archive
+from BIDS_converter.utils import brainvision as bv
+from BIDS_converter.utils import edf
 from BIDS_converter.utils import fileutils as fls
+from BIDS_converter.utils import nwb
 from BIDS_converter.utils import organize as org
 from BIDS_converter.utils import utils as ut
+from BIDS_converter.utils import slicetiming as st
+from BIDS_converter.utils.dicomindex import DicomIndex, CACHE_NAME
+from BIDS_converter.utils.entities import parse_entities
+from BIDS_converter.utils.instrument import Profiler
+from BIDS_converter.utils.inventory import Inventory, config_hash
+from BIDS_converter.utils.journal import Journal
+from BIDS_converter.utils.manifest import Manifest, config_id
+from BIDS_converter.utils.pipeline import (SharedArray, attach, pipeline,
+                                           prefetch, process_pool)
+
+# the scientific stack is only imported once a conversion needs it
+np = ut.lazy_import("numpy")
+pd = ut.lazy_import("pandas")
+pyedflib = ut.lazy_import("pyedflib")
 
 PathLike = TypeVar("PathLike", str, os.PathLike)
 
+# formats the iEEG recordings can be split into, with their extension
+IEEG_FORMATS = {"edf": ".edf", "brainvision": ".vhdr", "nwb": ".nwb"}
+# threads encoding runs for the split writer, each holds one run in memory
+SPLIT_WORKERS = 2
+
 
 def get_parser():  # parses flags at onset of command
     parser = argparse.ArgumentParser(
@@ -111,9 +134,66 @@ def get_parser():  # parses flags at onset of command
     parser.add_argument("-s", "--stim_dir", required=False, default=None,
                         help="directory containing stimuli files", )
 
+    parser.add_argument("--stim_store", required=False, default=None,
+                        help="content addressed store the stimuli are "
+                             "hardlinked from, so stimuli shared between "
+                             "BIDS directories are stored once", )
+
+    parser.add_argument("--stim_hash", required=False, action='store_true',
+                        help="compare the content of stimuli already in the "
+                             "BIDS directory when only their mtime changed",
+                        )
+
     parser.add_argument("-v", "--verbose", required=False, action='store_true',
                         help="verbosity", )
 
+    parser.add_argument("-j", "--n_jobs", required=False, type=int,
+                        default=None,
+                        help="number of processes and threads converting "
+                             "at once: DICOM series, the recordings of a "
+                             "subject, the runs of a split and the xz "
+                             "decompression of archives. Default: all "
+                             "cores", )
+
+    parser.add_argument("--inventory", required=False, default=None,
+                        help="json file of the input file inventory. It is "
+                             "reused if the input tree is unchanged, otherwise"
+                             " it is rebuilt and saved there", )
+
+    parser.add_argument("--full", dest="incremental", action='store_false',
+                        help="convert every file again, even if the manifest"
+                             " in the BIDS directory shows that its sources "
+                             "and config are unchanged", )
+
+    parser.add_argument("--lazy", required=False, action='store_true',
+                        help="skip setup steps whose outputs are already "
+                             "present: DICOM series converted by an earlier "
+                             "run and channels cached in the inventory", )
+
+    parser.add_argument("--profile", required=False, nargs='?', const=True,
+                        default=None,
+                        help="write a json report of the wall and CPU time, "
+                             "bytes read and written and peak memory of "
+                             "every stage, per subject and file, to the "
+                             "given file. Default: {dataset}_profile.json "
+                             "next to the BIDS directory", )
+
+    parser.add_argument("--trace_memory", required=False,
+                        action='store_true',
+                        help="also record the peak Python allocations of "
+                             "each stage with tracemalloc in the --profile "
+                             "report, which slows the conversion down", )
+
+    parser.add_argument("-f", "--format", dest="ieeg_format",
+                        required=False, default="edf",
+                        choices=list(IEEG_FORMATS),
+                        help="format the iEEG recordings are split into. "
+                             "brainvision writes float32 .eeg files with "
+                             "their events as .vmrk markers, nwb streams "
+                             "them into chunked and compressed NWB style "
+                             "HDF5 files with their electrodes and events, "
+                             "which needs h5py. Default: edf", )
+
     return parser
 
 
@@ -127,11 +207,129 @@ def get_trigger(part_match: str, headers_dict: dict) -> str:
     return trig_lab
 
 
+def encode_section(array: np.ndarray, signal_headers: List[dict],
+                   ieeg_format: str, digital: bool, start: int = 0,
+                   stop: int = None, scale: bool = True
+                   ) -> Tuple[Optional[np.ndarray], bool]:
+    """samples start to stop of a recording, as the values an iEEG format
+    stores
+
+    pyedflib writes EDF values as they were read, BrainVision and NWB
+    store float32 physical values.
+
+    :param array: channels by samples of the whole recording, None if
+        NWB output streams it from the source file
+    :type array: np.ndarray
+    :param digital: whether array holds EDF digital values
+    :type digital: bool
+    :param scale: whether to convert the whole section at once, instead
+        of leaving it to write_section to convert a row or block at a time
+    :type scale: bool
+    :return: the section for write_section, and whether it still holds
+        EDF digital values
+    :rtype: Tuple[np.ndarray, bool]
+    """
+    if array is None:
+        return None, digital
+    section = array[:, start:stop]
+    if ieeg_format == "edf" or not scale:
+        return section, digital
+    if digital:
+        return edf.to_physical(section, signal_headers), False
+    return np.asarray(section, dtype=np.float32), False
+
+
+def section_electrodes(filename: PathLike) -> Optional[pd.DataFrame]:
+    """the electrodes.tsv next to a split file, None if there is none"""
+    ieeg_dir = op.dirname(filename)
+    if op.basename(ieeg_dir) == "practice":
+        ieeg_dir = op.dirname(ieeg_dir)
+    electrodes = [op.join(ieeg_dir, f) for f in sorted(os.listdir(
+        ieeg_dir)) if f.endswith("_electrodes.tsv")]
+    return pd.read_csv(electrodes[0], sep="\t") if electrodes else None
+
+
+def write_section(filename: PathLike, section: np.ndarray,
+                  signal_headers: List[dict], header: dict,
+                  sample_rate: float, ieeg_format: str, start: int = 0,
+                  events: PathLike = None, digital: bool = False
+                  ) -> List[str]:
+    """writes a section of a recording in an iEEG format
+
+    :param filename: .edf, .vhdr or .nwb file to write
+    :type filename: PathLike
+    :param section: the samples as encode_section returns them
+    :type section: np.ndarray
+    :param start: first sample of the section in the recording
+    :type start: int
+    :param events: events.tsv of the section, exported as BrainVision
+        markers or NWB intervals
+    :type events: PathLike
+    :param digital: whether section holds EDF digital values
+    :type digital: bool
+    :return: files written
+    :rtype: list
+    """
+    events = None if events is None else pd.read_csv(events, sep="\t")
+    if ieeg_format == "nwb":
+        blocks = edf.array_blocks(section, int(sample_rate * 10),
+                                  signal_headers if digital else None)
+        return nwb.write_nwb(filename, blocks, signal_headers, sample_rate,
+                             section.shape[1], section_electrodes(filename),
+                             events, start)
+    if ieeg_format == "brainvision":
+        markers = [] if events is None else bv.events_to_markers(
+            events, start, sample_rate)
+        return bv.write_brainvision(filename, section, signal_headers,
+                                    sample_rate, markers, digital)
+    with fls.atomic_path(filename) as tmp:
+        pyedflib.highlevel.write_edf(tmp, section, signal_headers, header,
+                                     digital=digital)
+    return [filename]
+
+
+# copy of the converter in a process of map_recordings
+_converter = None
+# what the split processes of write_edf write, set once per process
+_split = {}
+
+
+def _init_converter(converter: Data2Bids, n_jobs: int):
+    global _converter
+    _converter = converter
+    _converter.set_n_jobs(n_jobs)
+
+
+def _call_converter(method: str, recording: dict) -> Tuple[Any, List[dict]]:
+    # the result of one recording, with the stages profiled for it
+    _converter._profiler.records = []
+    return getattr(_converter, method)(recording), _converter._profiler.records
+
+
+def _init_split(settings: dict):
+    _split.clear()
+    _split.update(settings)
+
+
+def _write_shared(filename: PathLike, handle: tuple, start: int, stop: int,
+                  events: PathLike = None) -> List[str]:
+    # encodes and writes one section of the recording in a SharedArray
+    section, digital = encode_section(
+        attach(handle), _split["signal_headers"], _split["ieeg_format"],
+        _split["digital"], start, stop)
+    return write_section(filename, section, _split["signal_headers"],
+                         _split["header"], _split["sample_rate"],
+                         _split["ieeg_format"], start, events, digital)
+
+
 class Data2Bids:  # main conversion and file organization program
 
     def __init__(self, input_dir=None, config=None, output_dir=None,
                  DICOM_path=None, multi_echo=None, overwrite=False,
-                 stim_dir=None, channels=None, verbose=False):
+                 stim_dir=None, channels=None, verbose=False,
+                 inventory=None, incremental=True, stim_store=None,
+                 stim_hash=False, n_jobs=None, lazy=False, profile=None,
+                 trace_memory=False, ieeg_format="edf"):
         # sets the .self globalization for self variables
         self._is_multi_echo = None
         self._input_dir = None
@@ -142,16 +340,57 @@ class Data2Bids:  # main conversion and file organization program
         self._dataset_name = None
         self._data_types = {"anat": False, "func": False, "ieeg": False}
         self._ignore = []
-
+        self._protected = set()
+        self._journal = None
+        self._dicom_index = None
+        self._inventory = None
+        self._inventory_path = None
+        self.timings = {}
+
+        self.set_lazy(lazy)
+        self.set_profile(profile, trace_memory)
         self.set_overwrite(overwrite)
+        self.set_incremental(incremental)
+        self.set_n_jobs(n_jobs)
         self.set_data_dir(input_dir, DICOM_path)
         self.set_config_path(config)
-        self.set_bids_dir(output_dir)
-        self.set_DICOM(DICOM_path)
-        self.set_multi_echo(multi_echo)
         self.set_verbosity(verbose)
-        self.set_stim_dir(stim_dir)
-        self.set_channels(channels)
+        self.set_ieeg_format(ieeg_format)
+        # setup steps that touch the disk, in the order prepare runs them
+        self._stages = dict(
+            bids_dir=lambda: self.set_bids_dir(output_dir),
+            DICOM=lambda: self.set_DICOM(DICOM_path),
+            multi_echo=lambda: self.set_multi_echo(multi_echo),
+            stimuli=lambda: self.set_stim_dir(stim_dir, stim_store,
+                                              stim_hash),
+            inventory=lambda: self.set_inventory(inventory),
+            channels=lambda: self.set_channels(channels))
+        if not self._is_lazy:
+            self.prepare()
+
+    def prepare(self, *stages: str):
+        """runs the pending setup stages, all of them by default
+
+        Stages run once and in order, so asking for one also runs the ones
+        before it. The time each took is kept in self.timings.
+
+        :param stages: names of the stages that are needed
+        :type stages: str
+        """
+        names = list(self._stages)
+        if stages:
+            # stages that already ran are no longer pending
+            wanted = [names.index(s) for s in stages if s in names]
+            names = names[:max(wanted) + 1] if wanted else []
+        for name in names:
+            stage = self._stages.pop(name)
+            start = time.perf_counter()
+            with self._profiler.stage(name):
+                stage()
+            self.timings[name] = time.perf_counter() - start
+            if self._is_verbose:
+                print("{} stage took {:.3f} s".format(name,
+                                                      self.timings[name]))
 
     def check_ignore(self, file: PathLike):
 
@@ -170,7 +409,8 @@ class Data2Bids:  # main conversion and file organization program
                         ans = True
         return ans
 
-    def set_stim_dir(self, dir: PathLike):
+    def set_stim_dir(self, dir: PathLike, store: PathLike = None,
+                     check_hash: bool = False):
         if dir is None:
             if "stimuli" in os.listdir(self._data_dir):
                 dir = op.join(self._data_dir, "stimuli")
@@ -181,38 +421,91 @@ class Data2Bids:  # main conversion and file organization program
                 return
         if not op.isdir(op.join(self._bids_dir, "stimuli")):
             os.mkdir(op.join(self._bids_dir, "stimuli"))
-        for item in os.listdir(dir):
-            fls.copy_file(op.join(dir, item), op.join(
-                self._bids_dir, "stimuli", item))
+        # only new or changed stimuli are copied, or linked from the store
+        synced = fls.sync_dir(dir, op.join(self._bids_dir, "stimuli"),
+                              store, check_hash)
+        if self._is_verbose:
+            actions = list(synced.values())
+            print("Stimuli synced from {}: {}".format(dir, ", ".join(
+                "{} {}".format(actions.count(a), a) for a in dict.fromkeys(
+                    actions))))
         self.stim_dir = dir
         self._ignore.append(dir)
 
+    def set_inventory(self, inventory: PathLike = None):
+        # lazy runs keep the inventory, and the channels cached in it, in
+        # the BIDS directory, which is never part of the inventory itself
+        if inventory is None and self._is_lazy:
+            inventory = op.join(self._bids_dir, ".inventory.json")
+        self._inventory_path = inventory
+        # ignore BIDS directories and stimuli
+        exclude = [op.basename(self._bids_dir)]
+        if self.stim_dir is not None:
+            exclude.append(op.basename(self.stim_dir))
+        inv = None
+        if inventory is not None and op.isfile(inventory):
+            inv = Inventory.from_json(inventory)
+            if op.abspath(inv.data_dir) != op.abspath(self._data_dir) or \
+                    not inv.is_current(self._config, exclude):
+                inv = None
+        if inv is None:
+            inv = Inventory.build(self._data_dir, self._config, exclude)
+            if inventory is not None:
+                inv.to_json(inventory)
+        self._inventory = inv
+
+    def get_inventory(self) -> Inventory:
+        self.prepare("inventory")
+        return self._inventory
+
+    def _channels_key(self, channels: list) -> str:
+        # channel discovery depends on the ieeg config, the requested
+        # channels and the workbooks the triggers are read from
+        workbooks = {v: op.getmtime(v) for v in self._config["ieeg"][
+            "headerData"].values() if isinstance(v, str) and op.isfile(v)}
+        return config_hash(dict(ieeg=self._config["ieeg"], channels=channels,
+                                workbooks=workbooks),
+                           ("ieeg", "channels", "workbooks"))
+
     def set_channels(self, channels: list):
         self.channels = {}
         self.sample_rate = {}
         self.trigger = {}
         self._channels_file = {}
-        # ignore BIDS directories and stimuli
-        exclude = [op.basename(self._bids_dir)]
-        if self.stim_dir is not None:
-            exclude.append(op.basename(self.stim_dir))
-        for root, dirs, files in os.walk(self._data_dir, topdown=True):
-            dirs[:] = [d for d in dirs if d not in exclude]
-            if not files:
-                continue
-            part_match = self.find_a_match(files, "partLabel")
+        key = self._channels_key(channels)
+        cached = self._inventory.cache.get("channels")
+        if self._is_lazy and cached is not None and cached["key"] == key:
+            if self._is_verbose:
+                print("Channels read from the inventory cache")
+            self.channels = cached["channels"]
+            self.sample_rate = cached["sample_rate"]
+            self.trigger = cached["trigger"]
+            self._channels_file = cached["channels_file"]
+            self._ignore.extend(cached["ignore"])
+            return
+        n_ignored = len(self._ignore)
+        for root, files in self._inventory.walk():
+            part_match = self._inventory.find_a_match(root, "partLabel")
             self.chan_walk(root, files, part_match)
             if isinstance(channels, str):
                 channels = list(channels)
             if channels is not None:
                 self.channels[part_match] = self.channels[part_match] + [
                     c for c in channels if c not in self.channels[part_match]]
+        if self._is_lazy:
+            self._inventory.cache["channels"] = dict(
+                key=key, channels=self.channels, sample_rate=self.sample_rate,
+                trigger=self.trigger, channels_file=self._channels_file,
+                ignore=self._ignore[n_ignored:])
+            if self._inventory_path is not None:
+                self._inventory.to_json(self._inventory_path)
 
     def chan_walk(self, root: PathLike, files: List[PathLike],
                   part_match: str):
         ieeg_conf: dict = self._config["ieeg"]
-        self.trigger[part_match] = get_trigger(part_match,
-                                               ieeg_conf["headerData"])
+        with self._profiler.stage("excel", self.part_check(part_match)[1]):
+            self.trigger[part_match] = get_trigger(part_match,
+                                                   ieeg_conf["headerData"])
         self.channels[part_match] = [self.trigger[part_match]]
         for i, file in enumerate(files):
             src = op.join(root, file)
@@ -245,12 +538,43 @@ class Data2Bids:  # main conversion and file organization program
                       " {ext} files for channel labels"
                       "".format(ext=op.splitext(src)[1]))
 
+    def set_lazy(self, lazy: bool):
+        self._is_lazy = lazy
+
+    def set_profile(self, profile: Union[bool, PathLike] = None,
+                    trace_memory: bool = False):
+        self._profiler = Profiler(bool(profile), trace_memory)
+        self._profile_path = profile if isinstance(profile, (
+            str, os.PathLike)) else None
+
+    def get_profile_path(self) -> PathLike:
+        if self._profile_path is not None:
+            return self._profile_path
+        return op.join(op.dirname(self.get_bids_dir()), "{}_profile.json"
+                       "".format(self._dataset_name or "data2bids"))
+
     def set_overwrite(self, overwrite: bool):
         self._is_overwrite = overwrite
 
+    def set_n_jobs(self, n_jobs: int = None):
+        self._n_jobs = n_jobs or os.cpu_count()
+
+    def set_incremental(self, incremental: bool):
+        self._is_incremental = incremental
+
     def set_verbosity(self, verbose):
         self._is_verbose = verbose
 
+    def set_ieeg_format(self, ieeg_format: str = "edf"):
+        if ieeg_format not in IEEG_FORMATS:
+            raise ValueError("Unknown iEEG format {}, expected one of {}"
+                             "".format(ieeg_format, ", ".join(IEEG_FORMATS)))
+        if ieeg_format == "nwb" and importlib.util.find_spec("h5py") is None:
+            # fail before anything is converted
+            raise ImportError("h5py is required for NWB output, install it "
+                              "with pip install h5py")
+        self._ieeg_format = ieeg_format
+
     def set_multi_echo(self, multi_echo):  # if -m flag is called
         if multi_echo is None:
             self._is_multi_echo = False
@@ -265,42 +589,66 @@ class Data2Bids:  # main conversion and file organization program
         # therefore _data_dir is None
         if self._data_dir is None:
             self._data_dir = op.dirname(self._bids_dir)
-            subdirs = [x[0] for x in os.walk(ddir)]
-            files = [x[2] for x in os.walk(ddir)]
-            sub_num = str(dicom.read_file(op.join(subdirs[1], files[1][0]))[
-                              0x10, 0x20].value).split("_", 1)[1]
+            # one walk and one header per series, cached in the DICOM root
+            self._dicom_index = DicomIndex.load(ddir, n_jobs=self._n_jobs)
+            subdirs = self._dicom_index.walk()
+            sub_num = str(self._dicom_index.header(subdirs[1])[
+                              "PatientID"]).split("_", 1)[1]
             sub_dir = op.join(op.dirname(self._bids_dir),
                               "sub-{SUB_NUM}".format(SUB_NUM=sub_num))
+            # lazy runs keep the output of an earlier conversion of the same
+            # DICOM tree, the index is rebuilt whenever the tree changes
+            converted = self._is_lazy and not self._is_overwrite and \
+                self._dicom_index.is_converted(sub_dir)
             # destination subdirectory
-            if op.isdir(sub_dir):
-                fls.force_remove(sub_dir)
-            os.mkdir(sub_dir)
+            if converted:
+                print("Skipping dcm2niix, {} holds the conversion of {}"
+                      "".format(sub_dir, ddir))
+            else:
+                if op.isdir(sub_dir):
+                    fls.force_remove(sub_dir)
+                os.mkdir(sub_dir)
 
+            runlist = []
             if any("medata" in x for x in subdirs):  # copy over + list me data
-                melist = [x[2] for x in os.walk(op.join(ddir, "medata"))][0]
-                runlist = []
+                melist = self._dicom_index.files(op.join(ddir, "medata"))
                 for me in melist:
                     if me.startswith("."):
                         continue
                     runmatch = re.match(r".*run(\d{2}).*", me).group(1)
                     if str(int(runmatch)) not in runlist:
                         runlist.append(str(int(runmatch)))
-                    fls.copy_file(op.join(ddir, "medata", me), op.join(
-                        sub_dir, me))
+                    if not converted:
+                        fls.copy_file(op.join(ddir, "medata", me), op.join(
+                            sub_dir, me))
                 self._is_multi_echo = True
                 # will trigger even if single echo data is in medata folder.
                 # Should still be okay
-            for subdir in subdirs[1:]:
-                # print(str(fobj[0x20, 0x11].value), runlist)
+            # dcm2niix is single threaded, so series are converted
+            # concurrently by a bounded pool of dcm2niix processes
+            with ThreadPoolExecutor(max_workers=self._n_jobs) as pool:
+                futures = []
+                for subdir in subdirs[1:] if not converted else []:
+                    try:
+                        scan_num = str(int(os.path.basename(subdir))).zfill(2)
+                    except ValueError:
+                        continue
+                    series = (self._dicom_index.header(subdir) or {}).get(
+                        "SeriesNumber")
+                    futures.append(pool.submit(
+                        fls.run_dcm2niix, subdir, series, scan_num, runlist,
+                        sub_dir, sub_num))
+                # printed in series order so outputs do not interleave
+                for future in futures:
+                    sys.stdout.write(future.result())
+            if not converted:
+                # recorded only once every series went through
+                self._dicom_index.converted[sub_dir] = sorted(
+                    os.listdir(sub_dir))
                 try:
-                    fobj = dicom.read_file(os.path.join(subdir, list(os.walk(
-                        subdir))[0][2][0]), force=True)
-                    # first dicom file of the scan
-                    scan_num = str(int(os.path.basename(subdir))).zfill(2)
-                except ValueError:
-                    continue
-                fls.run_dcm2niix(subdir, fobj, scan_num, runlist, sub_dir,
-                                 sub_num)
+                    self._dicom_index.to_json(op.join(ddir, CACHE_NAME))
+                except OSError:
+                    pass
 
             self._multi_echo = runlist
             self._data_dir = op.join(op.dirname(
@@ -308,6 +656,7 @@ class Data2Bids:  # main conversion and file organization program
         self._DICOM_path = ddir
 
     def get_data_dir(self):
+        self.prepare("DICOM")
         return self._data_dir
 
     def set_data_dir(self, data_dir, DICOM):  # check if input dir is listed
@@ -348,6 +697,7 @@ class Data2Bids:  # main conversion and file organization program
         self._set_config()
 
     def get_bids_dir(self):
+        self.prepare("bids_dir")
         return self._bids_dir
 
     def set_bids_dir(self, bids_dir: PathLike):
@@ -603,87 +953,75 @@ class Data2Bids:  # main conversion and file organization program
             vols_per_time = 1
             echo = None
 
-        for root, _, dfiles in os.walk(folder, topdown=True):
-            dfiles.sort()
-            for dfile in dfiles:
-                dcm_file_path = op.join(root, dfile)
-                fobj = dicom.read_file(str(dcm_file_path))
-                if echo is None:
-                    try:
-                        echo = float(fobj[0x18, 0x81].value) / 1000
-                    except KeyError:
-                        echo = self._config['delayTimeInSec'][0]
-                ImagesInAcquisition = int(fobj[0x20, 0x1002].value)
-                seqlist = []
-                for i in list(range(5)):
-                    try:
-                        seqlist.append(fobj[0x18, (32 + i)].value)
-                        if seqlist[i] == 'NONE':
-                            seqlist[i] = None
-                        if isinstance(seqlist[i], dicom.multival.MultiValue):
-                            seqlist[i] = list(seqlist[i])
-                        if isinstance(seqlist[i], list):
-                            seqlist[i] = ", ".join(seqlist[i])
-                    except KeyError:
-                        seqlist.append(None)
-                [ScanningSequence, SequenceVariant, SequenceOptions,
-                 AquisitionType, SequenceName] = seqlist
-                try:
-                    timings = []
-                except NameError:
-                    timings = [None] * int(ImagesInAcquisition / vols_per_time)
-
-                RepetitionTime = (
-                    (float(fobj[0x18, 0x80].value) / 1000))  # TR value extract
-                # ed in milliseconds, converted to seconds
-                try:
-                    acquisition_series = self._config['series']
-                except KeyError:
-                    print("default")
-                    acquisition_series = "non-interleaved"
-                if acquisition_series == "even-interleaved":
-                    InstackPositionNumber = 2
-                else:
-                    InStackPositionNumber = 1
-                InstanceNumber = 0
-                while None in timings:
-                    if timings[InStackPositionNumber - 1] is None:
-                        timings[
-                            InStackPositionNumber - 1] = ut.slice_time_calc(
-                            RepetitionTime, InstanceNumber, int(
-                                ImagesInAcquisition / vols_per_time), echo)
-                    if acquisition_series == "odd-interleaved" or \
-                            acquisition_series == "even-interleaved":
-                        InStackPositionNumber += 2
-                        if InStackPositionNumber > ImagesInAcquisition / \
-                                vols_per_time and acquisition_series == \
-                                "odd-interleaved":
-                            InStackPositionNumber = 2
-                        elif InStackPositionNumber > ImagesInAcquisition / \
-                                vols_per_time and acquisition_series == \
-                                "even-interleaved":
-                            InStackPositionNumber = 1
-                    else:
-                        InStackPositionNumber += 1
-                    InstanceNumber += 1
-                return (timings, echo, ScanningSequence, SequenceVariant,
-                        SequenceOptions, SequenceName)
+        # headers come from the series index instead of reading every file
+        if self._dicom_index is None or self._dicom_index.first_header(
+                folder) is None:
+            self._dicom_index = DicomIndex.load(folder, n_jobs=self._n_jobs)
+        header = self._dicom_index.first_header(folder)
+        if header is None:
+            return None
+        if echo is None:
+            try:
+                echo = float(header["EchoTime"]) / 1000
+            except KeyError:
+                echo = self._config['delayTimeInSec'][0]
+        ImagesInAcquisition = int(header["ImagesInAcquisition"])
+        seqlist = []
+        for i, tag in enumerate(("ScanningSequence", "SequenceVariant",
+                                 "ScanOptions", "MRAcquisitionType",
+                                 "SequenceName")):
+            try:
+                seqlist.append(header[tag])
+                if seqlist[i] == 'NONE':
+                    seqlist[i] = None
+                if isinstance(seqlist[i], list):
+                    seqlist[i] = ", ".join(seqlist[i])
+            except KeyError:
+                seqlist.append(None)
+        [ScanningSequence, SequenceVariant, SequenceOptions,
+         AquisitionType, SequenceName] = seqlist
+        RepetitionTime = (
+            (float(header["RepetitionTime"]) / 1000))  # TR value extract
+        # ed in milliseconds, converted to seconds
+        try:
+            acquisition_series = self._config['series']
+        except KeyError:
+            print("default")
+            acquisition_series = "non-interleaved"
+        timings = st.slice_times(
+            RepetitionTime, int(ImagesInAcquisition / vols_per_time),
+            acquisition_series, self._config.get("multiband", 1),
+            echo).tolist()
+        return (timings, echo, ScanningSequence, SequenceVariant,
+                SequenceOptions, SequenceName)
 
     def read_edf(self, file_name: PathLike,
                  channels: List[Union[int, str]] = None,
-                 extra_arrays=None, extra_signal_headers=None):
+                 extra_arrays=None, extra_signal_headers=None,
+                 stream: edf.EdfStream = None, shared: bool = False):
+        """reads the channels of a recording for the split, or copies it to
+        the BIDS directory if it is not split
+
+        :param stream: recording open_archive made, instead of file_name
+        :type stream: edf.EdfStream
+        :param shared: whether to read the samples into a SharedArray that
+            split processes map, returned as shared. The caller closes it
+        :type shared: bool
+        """
         [edfname, dst_path, part_match] = self.generate_names(
             file_name, verbose=False)[0:3]
-        header = highlevel.make_header(patientname=part_match,
-                                       startdate=datetime.datetime(1, 1, 1))
+        header = pyedflib.highlevel.make_header(
+            patientname=part_match, startdate=datetime.datetime(1, 1, 1))
         edf_name = op.join(dst_path, edfname + ".edf")
         d = {str: [], int: []}
         for i in channels:
             d[type(i)].append(i)
 
-        f = EdfReader(file_name)
+        # archived recordings are read from the stream open_archive made
+        f = stream or pyedflib.EdfReader(file_name)
         chn_nums = d[int] + [i for i, x in enumerate(f.getSignalLabels())
                              if x.replace(" ", "") in channels]
+        n_samples = f.getNSamples()
         f.close()
         chn_nums.sort()
 
@@ -694,18 +1032,54 @@ class Data2Bids:  # main conversion and file organization program
 
         gc.collect()  # helps with memory
 
-        if check_sep:
+        buffer = None
+        if check_sep and self._ieeg_format == "nwb" and not extra_arrays \
+                and stream is None:
+            # the split streams the channels from file_name block by block
+            signal_headers = [pyedflib.highlevel.read_edf_header(
+                file_name, read_annotations=False)["SignalHeaders"][i]
+                              for i in chn_nums]
+            array = None
+            nsamples = int(n_samples[chn_nums[0]])
+        elif check_sep:
             # read edf
             print("Reading " + file_name + "...")
-            [array, signal_headers, _] = highlevel.read_edf(
-                file_name, ch_nrs=chn_nums,
-                digital=self._config["ieeg"]["digital"], verbose=True)
+            digital = self._config["ieeg"]["digital"]
+            if shared and not extra_arrays and len(
+                    {int(n_samples[i]) for i in chn_nums}) == 1:
+                # read straight into the memory the split processes map
+                buffer = SharedArray(
+                    (len(chn_nums), int(n_samples[chn_nums[0]])),
+                    np.int32 if digital else np.float64)
+                try:
+                    if stream is None:
+                        signal_headers = edf.read_into(
+                            file_name, chn_nums, buffer.array, digital)
+                    else:
+                        signal_headers = stream.read(chn_nums, digital,
+                                                     buffer.array)[1]
+                except BaseException:
+                    buffer.close()
+                    raise
+                array = buffer.array
+            elif stream is None:
+                [array, signal_headers, _] = pyedflib.highlevel.read_edf(
+                    file_name, ch_nrs=chn_nums, digital=digital,
+                    verbose=True)
+            else:
+                array, signal_headers = stream.read(chn_nums,
+                                                    digital=digital)
             print("read it")
+            if not self._config["ieeg"]["digital"]:
+                # the split writes the values with these headers
+                edf.clip_physical(array, signal_headers)
             if extra_arrays:
                 array = array + extra_arrays
             if extra_signal_headers:
                 signal_headers = signal_headers + extra_signal_headers
+            nsamples = array.shape[1]
 
+        if check_sep:
             for i, signal in enumerate(signal_headers):
                 if (signal["label"] or i) == self.trigger[part_match]:
                     signal_headers[i]["label"] = "Trigger"
@@ -714,11 +1088,13 @@ class Data2Bids:  # main conversion and file organization program
                         "label"].replace(" ", "")
 
             return dict(name=file_name, bids_name=edf_name,
-                        nsamples=array.shape[1], signal_headers=signal_headers,
-                        file_header=header, data=array, reader=f)
+                        nsamples=nsamples, signal_headers=signal_headers,
+                        file_header=header, data=array, reader=f,
+                        channels=chn_nums,
+                        shared=buffer)
         elif channels:
-            highlevel.drop_channels(file_name, edf_name, channels,
-                                    verbose=self._is_verbose)
+            pyedflib.highlevel.drop_channels(file_name, edf_name, channels,
+                                             verbose=self._is_verbose)
             return None
         else:
             fls.copy_file(file_name, edf_name)
@@ -762,8 +1138,8 @@ class Data2Bids:  # main conversion and file organization program
                 if string not in f.read():
                     f.write(string + "\n")
 
-    def check_for_mat_channels(self, fobj: EdfReader, root: PathLike,
-                               all_files: List[PathLike],
+    def check_for_mat_channels(self, fobj: pyedflib.EdfReader,
+                               root: PathLike, all_files: List[PathLike],
                                mat_files: List[PathLike]
                                ) -> Tuple[List[np.ndarray], List[dict]]:
         extra_arrays = []
@@ -789,7 +1165,7 @@ class Data2Bids:  # main conversion and file organization program
                     for cols in df.columns:
                         extra_arrays = np.vstack([extra_arrays, df[cols]])
                         extra_signal_headers.append(
-                            highlevel.make_signal_header(
+                            pyedflib.highlevel.make_signal_header(
                                 op.splitext(op.basename(fname))[0],
                                 sample_rate=self.sample_rate[part_match]))
                 elif sig_len * 0.99 <= len(
@@ -808,8 +1184,9 @@ class Data2Bids:  # main conversion and file organization program
             remove_src_edf = False
         elif file.endswith(".edf.gz"):
             with gzip.open(source, 'rb',
-                           self._config["compressLevel"]) as f_in:
-                with open(source.rsplit(".gz", 1)[0], 'wb') as f_out:
+                           self._config["compressLevel"]) as f_in, \
+                    fls.atomic_path(source.rsplit(".gz", 1)[0]) as tmp:
+                with open(tmp, 'wb') as f_out:
                     fls.copy_file(f_in, f_out, is_obj=True)
         elif not self._config["ieeg"]["binary?"]:
             raise NotImplementedError(
@@ -833,15 +1210,15 @@ class Data2Bids:  # main conversion and file organization program
                             "binaryEncoding"])
                 array = np.reshape(data, [len(headers_dict), -1], order='F')
                 # byte order is Fortran encoding, dont know why
-                signal_headers = highlevel.make_signal_headers(
+                signal_headers = pyedflib.highlevel.make_signal_headers(
                     headers_dict, sample_rate=self.sample_rate[part_match],
                     physical_max=np.amax(array), physical_min=(np.amin(array)))
                 print("converting binary" + source + " to edf" +
                       op.splitext(source)[0] + ".edf")
-                highlevel.write_edf(
-                    op.splitext(source)[0] + ".edf", array,
-                    signal_headers,
-                    digital=self._config["ieeg"]["digital"])
+                with fls.atomic_path(op.splitext(source)[0] + ".edf") as tmp:
+                    pyedflib.highlevel.write_edf(
+                        tmp, array, signal_headers,
+                        digital=self._config["ieeg"]["digital"])
             except OSError as e:
                 print("eeg file is either not detailed well enough in config"
                       " file or file type not yet supported")
@@ -851,10 +1228,212 @@ class Data2Bids:  # main conversion and file organization program
                 "{file} header could not be found".format(file=file))
         return remove_src_edf
 
+    @contextlib.contextmanager
+    def open_archive(self, source: PathLike, files: List[PathLike],
+                     drain: bool = True) -> Iterator[edf.EdfStream]:
+        """the recording in a tar archive, read straight out of the
+        decompressor instead of being extracted to disk
+
+        EDF members are read as they are, binary ones like force_to_edf
+        reads them. The stream can only be read once.
+
+        :param source: archive, such as a .edf.tar.xz file
+        :type source: PathLike
+        :param files: other files of the participant
+        :type files: list
+        :param drain: whether to decompress the rest of the archive on exit,
+            False if only the header is read
+        :type drain: bool
+        """
+        file = op.basename(source)
+        part_match = self.part_check(filename=file)[0]
+        headers_dict = self.channels[part_match]
+        with archive.open_member(source, (".edf", ".dat"), self._n_jobs,
+                                 drain) as (info, fobj):
+            if info.name.lower().endswith(".edf"):
+                yield edf.EdfStream(fobj, source)
+            elif not self._config["ieeg"]["binary?"]:
+                raise NotImplementedError(
+                    "{file} file format not yet supported. If file is binary "
+                    "format, please indicate so and what encoding in the "
+                    "config.json file".format(file=info.name))
+            elif headers_dict and any(".mat" in i for i in files) and \
+                    self.sample_rate[part_match] is not None:
+                yield edf.BinaryStream(
+                    fobj, info.size, headers_dict,
+                    self.sample_rate[part_match],
+                    self._config["ieeg"]["binaryEncoding"], source)
+            else:
+                raise FileNotFoundError(
+                    "{file} header could not be found".format(file=file))
+
+    def open_recording(self, stack: contextlib.ExitStack,
+                       edf_file: PathLike, files: List[PathLike],
+                       drain: bool = True
+                       ) -> Tuple[Any, Optional[edf.EdfStream]]:
+        """opens a recording with pyedflib, or as a stream if archived
+
+        :param stack: closes the archive stream on exit
+        :type stack: contextlib.ExitStack
+        :return: the reader, and the stream read_edf has to read from
+        :rtype: tuple
+        """
+        if archive.is_archive(edf_file):
+            stream = stack.enter_context(self.open_archive(
+                edf_file, files, drain))
+            return stream, stream
+        return pyedflib.EdfReader(edf_file), None
+
+    def probe_recording(self, recording: dict) -> dict:
+        """converts a recording to EDF if needed and finds the .mat files
+        that hold extra channels of it
+
+        :param recording: the source and edf_file of the recording, with the
+            files after it (later) and the .mat files before it (mats), as
+            the participant's files are listed
+        :type recording: dict
+        :return: whether edf_file is to be removed once the subject is done,
+            and the names of the .mat files taken as channels
+        :rtype: dict
+        """
+        source, edf_file = recording["source"], recording["edf_file"]
+        later, mats = list(recording["later"]), list(recording["mats"])
+        if archive.is_archive(source):
+            # streamed by open_archive, nothing to convert
+            remove = False
+        elif self._committed("convert", source):
+            remove = True
+        else:
+            with self._profiler.stage("force_to_edf", recording["subject"],
+                                      source):
+                remove = self.force_to_edf(source, later)
+            if remove:
+                self._commit("convert", source, [edf_file])
+        before = later + [op.basename(m) for m in mats]
+        with contextlib.ExitStack() as stack:
+            # only the header is needed, archives are not read any further
+            f = self.open_recording(stack, edf_file, later, False)[0]
+            # check for extra channels in data, not working in other file
+            # modalities
+            self.check_for_mat_channels(f, op.dirname(source), later, mats)
+            f.close()
+        after = set(later) | {op.basename(m) for m in mats}
+        return dict(remove=remove,
+                    consumed=[f for f in before if f not in after])
+
+    def convert_recording(self, recording: dict) -> dict:
+        """reads a recording with its extra channels and splits it into
+        runs if it has a split name
+
+        :param recording: the recording probe_recording checked, or the
+            metadata of one that was read before a restart (eeg)
+        :type recording: dict
+        :return: the metadata read_edf returns, without the data, and the
+            files the split wrote
+        :rtype: dict
+        """
+        source, edf_file = recording["source"], recording["edf_file"]
+        eeg_dict = recording["eeg"]
+        if eeg_dict is None:
+            mats = [op.join(op.dirname(source), m) for m in
+                    recording["consumed"]]
+            with contextlib.ExitStack() as stack:
+                f, stream = self.open_recording(stack, edf_file,
+                                                recording["later"])
+                extra_arrays, extra_signal_headers = \
+                    self.check_for_mat_channels(f, op.dirname(source), [],
+                                                mats)
+                f.close()
+                # read edf and either copy data to BIDS file or save data
+                # as dict for writing later
+                with self._profiler.stage("read_edf", recording["subject"],
+                                          edf_file):
+                    eeg_dict = self.read_edf(
+                        edf_file, self.channels[recording["part_match"]],
+                        extra_arrays, extra_signal_headers, stream,
+                        self._n_jobs > 1 and "split" in recording)
+            if eeg_dict is not None:
+                self._commit("read", source, consumed=recording["consumed"],
+                             bids_name=eeg_dict["bids_name"],
+                             nsamples=eeg_dict["nsamples"],
+                             channels=eeg_dict["channels"],
+                             signal_headers=eeg_dict["signal_headers"])
+        outputs = []
+        shared = None if eeg_dict is None else eeg_dict.get("shared")
+        try:
+            if "split" in recording:
+                with self._profiler.stage("split", recording["subject"],
+                                          eeg_dict["name"]):
+                    outputs = self.write_edf(
+                        eeg_dict["data"], eeg_dict["signal_headers"],
+                        eeg_dict["file_header"], eeg_dict["name"],
+                        recording["correct"], eeg_dict["nsamples"],
+                        eeg_dict.get("channels"),
+                        None if shared is None else shared.handle)
+                self._commit("recording", source)
+        finally:
+            if shared is not None:
+                shared.close()
+        if eeg_dict is not None:
+            eeg_dict = {k: v for k, v in eeg_dict.items() if k not in (
+                "data", "reader", "shared")}
+        return dict(eeg=eeg_dict, outputs=outputs)
+
+    def map_recordings(self, method: str, recordings: List[dict]
+                       ) -> Iterator[Future]:
+        """calls a method on every recording of a subject, in a pool of
+        processes with several jobs
+
+        Each process gets a copy of the converter once, when it starts, and
+        then only the recordings. The jobs are shared between the
+        processes, so that a recording split by one of them uses the
+        threads and processes left for it.
+
+        :param method: name of the method, such as convert_recording
+        :type method: str
+        :param recordings: arguments of the method
+        :type recordings: list
+        :return: the result of each recording, in order
+        :rtype: Iterator[Future]
+        """
+        workers = min(self._n_jobs, len(recordings))
+        if workers <= 1:
+            for recording in recordings:
+                future = Future()
+                try:
+                    future.set_result(getattr(self, method)(recording))
+                except Exception as e:
+                    future.set_exception(e)
+                yield future
+            return
+        pool = process_pool(workers, _init_converter, (
+            self, max(self._n_jobs // workers, 1)))
+        try:
+            futures = [pool.submit(_call_converter, method, recording)
+                       for recording in recordings]
+            for future in futures:
+                result = Future()
+                try:
+                    value, records = future.result()
+                    # the stages the process profiled count for the subject
+                    self._profiler.records.extend(records)
+                    result.set_result(value)
+                except Exception as e:
+                    result.set_exception(e)
+                yield result
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
     def write_edf(self, array: np.ndarray, signal_headers: List[dict],
-                  header: dict, old_name: PathLike, correct):
+                  header: dict, old_name: PathLike, correct,
+                  nsamples: int = None, channels: List[int] = None,
+                  shared: tuple = None):
         """checks for .tsv files in eeg folders then writes matching .edf files
 
+        Runs already committed to the journal are not written again, so the
+        array may be None if every run was written before a restart, or
+        for NWB output, which then streams the runs from old_name.
+
         :param array:
         :type array:
         :param signal_headers:
@@ -865,11 +1444,21 @@ class Data2Bids:  # main conversion and file organization program
         :type old_name:
         :param correct:
         :type correct:
-        :return:
-        :rtype:
+        :param nsamples: length of the recording if array is None
+        :type nsamples: int
+        :param channels: signals of old_name that were read
+        :type channels: list
+        :param shared: handle of the SharedArray holding array, to write the
+            runs in processes with several jobs
+        :type shared: tuple
+        :return: files written
+        :rtype: list
         """
+        if array is not None:
+            nsamples = array.shape[1]
         start_nums = []
         matches = []
+        written = []
         new_name, file_path, part_match = self.generate_names(
             old_name, verbose=False)[0:3]
         for signal_header in signal_headers:
@@ -882,48 +1471,205 @@ class Data2Bids:  # main conversion and file organization program
         for file in sorted(f for f in os.listdir(file_path) if re.match(
                 pattern, f)):
             full_file = op.join(file_path, file)
+            if full_file in self._protected:
+                # belongs to a recording skipped as unchanged
+                continue
             self.rewrite_tsv(full_file, part_match)
             num_list = org.get_timing_from_tsv(full_file, signal_headers[
                 0]["sample_rate"])
             start_nums.append(tuple(num_list))
             matches.append(re.match(pattern, file))
+        ext = IEEG_FORMATS[self._ieeg_format]
+        # the source is read again instead of keeping the array in memory
+        streamed = self._ieeg_format == "nwb" and channels is not None
+        sections = []
         for i in range(len(start_nums)):
             if i == 0:
                 start = 0
                 practice = op.join(file_path, "practice", new_name.split(
-                    "_ieeg", 1)[0] + "_ieeg.edf")
-                if not op.isfile(practice) and self._config["split"]["practice"
-                ]:
+                    "_ieeg", 1)[0] + "_ieeg" + ext)
+                write = not op.isfile(practice) and self._config["split"][
+                    "practice"] and (array is not None or streamed)
+                if write:
                     os.makedirs(op.join(file_path, "practice"),
                                 exist_ok=True)
-                    highlevel.write_edf(practice, np.split(array, [
-                        0, start_nums[0][0]], axis=1)[1], signal_headers,
-                                        header, digital=self._config["ieeg"][
-                            "digital"])
                     self.bidsignore("*practice*")
+                sections.append(dict(filename=practice, start=0,
+                                     stop=start_nums[0][0], write=write))
             else:
                 start = start_nums[i - 1][1]
 
             if i == len(start_nums) - 1:
-                end = array.shape[1]
+                end = nsamples
             else:
                 end = start_nums[i + 1][0]
-            new_array = np.split(array, [start, end], axis=1)[1]
             tsv_name: str = op.join(file_path, matches[i].string)
-            edf_name: str = tsv_name.split("_events.tsv", 1)[0] + "_ieeg.edf"
+            edf_name: str = tsv_name.split("_events.tsv", 1)[0] + "_ieeg" + \
+                ext
             full_name = op.join(file_path, new_name + ".edf")
-            if self._is_verbose:
+            write = not self._committed("split", edf_name)
+            if self._is_verbose and not write:
+                print(edf_name + " was written before, skipping")
+            elif self._is_verbose:
                 print(full_name + "(Samples[" + str(start) + ":" + str(
                     end) + "]) ---> " + edf_name)
-            highlevel.write_edf(edf_name, new_array, signal_headers, header,
-                                digital=self._config["ieeg"]["digital"])
-            # zero the timing so that each file starts at t=0
-            if i > 0:
-                org.reset_zero(tsv_name, start_nums[i - 1][1],
-                               self.sample_rate[part_match], self._is_verbose)
-            # dont forget .json files!
-            self.write_sidecar(edf_name, part_match)
-            self.write_sidecar(tsv_name, part_match)
+            sections.append(dict(filename=edf_name, start=start, stop=end,
+                                 events=tsv_name, run=i, write=write))
+
+        # with several jobs, sections are encoded while the one before is
+        # being written, and each run is finished as soon as its files are
+        # written, in order
+        threaded = self._n_jobs > 1
+
+        def encode(section: dict) -> dict:
+            if section["write"]:
+                section["data"], section["digital"] = self.encode_split(
+                    array, signal_headers, section["start"],
+                    section["stop"], scale=threaded)
+            return section
+
+        def write(section: dict) -> dict:
+            if section["write"]:
+                section["files"] = self.write_split(
+                    section["filename"], section.pop("data"),
+                    signal_headers, header, part_match, section["start"],
+                    section["stop"], section.get("events"), old_name,
+                    channels, section["digital"])
+            return section
+
+        stages, workers, maxsize = (encode, write), (SPLIT_WORKERS, 1), 1
+        n_writes = sum(section["write"] for section in sections)
+        with contextlib.ExitStack() as stack:
+            if threaded and shared is not None and n_writes > 1:
+                # sections are encoded and written by processes that map the
+                # recording from shared memory instead of receiving a copy
+                processes = min(self._n_jobs, n_writes)
+                pool = stack.enter_context(process_pool(
+                    processes, _init_split, (dict(
+                        signal_headers=signal_headers, header=header,
+                        sample_rate=self.sample_rate[part_match],
+                        ieeg_format=self._ieeg_format,
+                        digital=self._config["ieeg"]["digital"]),)))
+
+                def fan_out(section: dict) -> dict:
+                    if section["write"]:
+                        section["files"] = pool.submit(
+                            _write_shared, section["filename"], shared,
+                            section["start"], section["stop"],
+                            section.get("events")).result()
+                    return section
+                stages, workers, maxsize = (fan_out,), (processes,), processes
+
+            for section in pipeline(sections, stages, workers, maxsize,
+                                    threaded):
+                edf_name = section["filename"]
+                if "run" not in section:
+                    if op.isfile(edf_name):
+                        written.extend(self.split_files(edf_name))
+                    continue
+                i, tsv_name = section["run"], section["events"]
+                if section["write"]:
+                    self._commit("split", edf_name, section["files"])
+                # zero the timing so that each file starts at t=0
+                if i > 0:
+                    org.reset_zero(tsv_name, start_nums[i - 1][1],
+                                   self.sample_rate[part_match],
+                                   self._is_verbose)
+                # dont forget .json files!
+                sidecar = op.splitext(edf_name)[0] + ".json"
+                if not self._committed("sidecar", sidecar):
+                    self.write_sidecar(edf_name, part_match)
+                    self._commit("sidecar", sidecar, [sidecar])
+                written += self.split_files(edf_name) + [tsv_name, sidecar]
+                self.write_sidecar(tsv_name, part_match)
+        return written
+
+    def encode_split(self, array: np.ndarray, signal_headers: List[dict],
+                     start: int = 0, stop: int = None, scale: bool = True
+                     ) -> Tuple[Optional[np.ndarray], bool]:
+        """samples start to stop of a recording, as the values the chosen
+        iEEG format stores
+
+        pyedflib writes EDF values as they were read, BrainVision and NWB
+        store float32 physical values.
+
+        :param array: channels by samples of the whole recording, None if
+            NWB output streams it from the source file
+        :type array: np.ndarray
+        :param scale: whether to convert the whole section at once, instead
+            of leaving it to write_split to convert a row or block at a time
+        :type scale: bool
+        :return: the section for write_split, and whether it still holds
+            EDF digital values
+        :rtype: Tuple[np.ndarray, bool]
+        """
+        return encode_section(array, signal_headers, self._ieeg_format,
+                              self._config["ieeg"]["digital"], start, stop,
+                              scale)
+
+    def write_split(self, filename: PathLike, section: np.ndarray,
+                    signal_headers: List[dict], header: dict,
+                    part_match: str, start: int = 0, stop: int = None,
+                    events: PathLike = None, source: PathLike = None,
+                    channels: List[int] = None, digital: bool = None
+                    ) -> List[str]:
+        """writes samples start to stop of a recording in the chosen iEEG
+        format
+
+        :param filename: .edf, .vhdr or .nwb file to write
+        :type filename: PathLike
+        :param section: the samples as encode_split returns them, None to
+            stream NWB output from source
+        :type section: np.ndarray
+        :param start: first sample of the section
+        :type start: int
+        :param stop: sample after the last one of the section
+        :type stop: int
+        :param events: events.tsv of the section, exported as BrainVision
+            markers or NWB intervals
+        :type events: PathLike
+        :param source: EDF file the recording was read from
+        :type source: PathLike
+        :param channels: signals of source that were read
+        :type channels: list
+        :param digital: whether section holds EDF digital values, as the
+            config states by default
+        :type digital: bool
+        :return: files written
+        :rtype: list
+        """
+        if digital is None:
+            digital = self._config["ieeg"]["digital"]
+        sample_rate = self.sample_rate[part_match]
+        if self._ieeg_format == "nwb" and section is None:
+            length = edf.n_samples(source, channels[0])
+            stop = length if stop is None else min(stop, length)
+            blocks = edf.read_blocks(source, channels, start, stop,
+                                     int(sample_rate * 10))
+            if self._n_jobs > 1:
+                # the next block is read while the current compresses
+                blocks = prefetch(blocks)
+            return nwb.write_nwb(
+                filename, blocks, signal_headers, sample_rate, stop - start,
+                section_electrodes(filename), None if events is None else
+                pd.read_csv(events, sep="\t"), start)
+        return write_section(filename, section, signal_headers, header,
+                             sample_rate, self._ieeg_format, start, events,
+                             digital)
+
+    def split_files(self, filename: PathLike) -> List[str]:
+        """every file of a section written by write_split"""
+        if self._ieeg_format == "brainvision":
+            return bv.brainvision_names(filename)
+        return [filename]
+
+    def _committed(self, kind: str, key: PathLike) -> bool:
+        return self._journal is not None and self._journal.done(kind, key)
+
+    def _commit(self, kind: str, key: PathLike, outputs: List[PathLike] = (),
+                **extra):
+        if self._journal is not None:
+            self._journal.commit(kind, key, outputs, **extra)
 
     def rewrite_tsv(self, tsv_name: PathLike, part_match: str):
         df = pd.read_csv(tsv_name, sep="\t", header=0)
@@ -942,22 +1688,33 @@ class Data2Bids:  # main conversion and file organization program
             df = pd.read_csv(full_file, sep="\t")
             return
         elif op.dirname(full_file).endswith("ieeg"):
-            if not full_file.endswith(".edf"):
+            if not full_file.endswith((".edf", ".vhdr", ".nwb")):
                 full_file = full_file + ".edf"
-            entities = layout.parse_file_entities(full_file)
-            f = EdfReader(full_file)
-            if f.annotations_in_file == 0:
+            entities = parse_entities(full_file)
+            if full_file.endswith((".vhdr", ".nwb")):
+                # split files carry no annotations, like the split EDFs
+                reader = bv if full_file.endswith(".vhdr") else nwb
+                split = reader.read_header(full_file)
                 description = "n/a"
-            elif f.getPatientAdditional():
-                description = f.getPatientAdditional()
-            elif f.getRecordingAdditional():
-                description = f.getRecordingAdditional()
-            elif any((not i.size == 0) for i in f.readAnnotations()):
-                description = [i for i in f.readAnnotations()]
-                print("description:", description)
+                labels = split["channels"]
+                duration = split["n_samples"] / split["sample_rate"]
             else:
-                raise SyntaxError(full_file + "was not annotated correctly")
-            signals = [s for s in f.getSignalLabels() if not s == "Trigger"]
+                f = pyedflib.EdfReader(full_file)
+                if f.annotations_in_file == 0:
+                    description = "n/a"
+                elif f.getPatientAdditional():
+                    description = f.getPatientAdditional()
+                elif f.getRecordingAdditional():
+                    description = f.getRecordingAdditional()
+                elif any((not i.size == 0) for i in f.readAnnotations()):
+                    description = [i for i in f.readAnnotations()]
+                    print("description:", description)
+                else:
+                    raise SyntaxError(full_file +
+                                      "was not annotated correctly")
+                labels = f.getSignalLabels()
+                duration = f.file_duration
+            signals = [s for s in labels if not s == "Trigger"]
             data = dict(TaskName=entities['task'],
                         InstitutionName=self._config["institution"],
                         iEEGReference=description,
@@ -965,7 +1722,7 @@ class Data2Bids:  # main conversion and file organization program
                         PowerLineFrequency=60,
                         SoftwareFilters="n/a",
                         TriggerChannelCount=1,
-                        RecordingDuration=f.file_duration)
+                        RecordingDuration=duration)
             if self._config["ieeg"]["type"] == "ECOG":
                 data["ECOGChannelCount"] = len(signals)
             elif self._config["ieeg"]["type"] == "SEEG":
@@ -974,7 +1731,7 @@ class Data2Bids:  # main conversion and file organization program
                 raise NotImplementedError("Types are either 'SEEG' or 'ECOG'")
 
         elif op.dirname(full_file).endswith("anat"):
-            entities = layout.parse_file_entities(full_file + ".nii.gz")
+            entities = parse_entities(full_file + ".nii.gz")
             if entities["suffix"] == "CT":
                 data = {}
             elif entities["suffix"] == "T1w":
@@ -985,8 +1742,9 @@ class Data2Bids:  # main conversion and file organization program
         else:
             data = {}
         if not op.isfile(op.splitext(full_file)[0] + ".json"):
-            with open(op.splitext(full_file)[0] + ".json", "w") as fst:
-                json.dump(data, fst)
+            fls.write_json(op.splitext(full_file)[0] + ".json", data,
+                           ensure_ascii=True, indent=None)
+        return op.splitext(full_file)[0] + ".json"
 
     def part_file_sort(self, mat_files: List[PathLike]) -> Dict[str, PathLike]:
         part_sorted_mats = dict()
@@ -1041,6 +1799,10 @@ class Data2Bids:  # main conversion and file organization program
             df = df.loc[nindex]
         file_name = op.join(dst_file_path, new_name.split(
             "ieeg")[0] + "events.tsv")
+        if file_name in self._protected:
+            if self._is_verbose:
+                print(file_name, "is unchanged, skipping")
+            return
         if self._is_verbose:
             print(mat_file, "--->", file_name)
         df.to_csv(file_name, sep="\t", index=False)
@@ -1084,6 +1846,18 @@ class Data2Bids:  # main conversion and file organization program
                     print("From " + i)
 
     def run(self):  # main function
+        try:
+            self._run()
+        finally:
+            # also written when a conversion fails, to see how far it got
+            if self._profiler.enabled:
+                self._profiler.save(self.get_profile_path())
+
+    def _run(self):
+
+        # deferred setup of lazy instances
+        self.prepare()
+        profile = self._profiler.stage
 
         # First we check that every parameters are configured
         if (self._data_dir is None or
@@ -1114,24 +1888,20 @@ class Data2Bids:  # main conversion and file organization program
 
         # dataset_description.json must be included in the BIDS folder
         description = op.join(self._bids_dir, "dataset_description.json")
+        # written atomically since batch conversions share the BIDS directory
+        data = {'Name': self._dataset_name,
+                'BIDSVersion': self._bids_version}
         if op.exists(description):
             with open(description, "r") as fst:
                 filedata = json.load(fst)
-            with open(description, 'w') as fst:
-                data = {'Name': self._dataset_name,
-                        'BIDSVersion': self._bids_version}
-                filedata.update(data)
-                json.dump(filedata, fst, ensure_ascii=False, indent=4)
+            filedata.update(data)
+            fls.update_json(description, filedata)
         else:
-            with open(description, 'w') as fst:
-                data = {'Name': self._dataset_name,
-                        'BIDSVersion': self._bids_version}
-                json.dump(data, fst, ensure_ascii=False, indent=4)
+            fls.write_json(description, data)
 
         try:
             for key, data in self._config["JSON_files"].items():
-                with open(op.join(self._bids_dir, key), 'w') as fst:
-                    json.dump(data, fst, ensure_ascii=False, indent=4)
+                fls.update_json(op.join(self._bids_dir, key), data)
         except KeyError:
             pass
 
@@ -1142,29 +1912,56 @@ class Data2Bids:  # main conversion and file organization program
                 data = ""
                 fst.write(data)
 
-        # now we can scan all files and rearrange them
-        # ignore BIDS directories and stimuli
-        exclude = [op.basename(self._bids_dir)]
-        if self.stim_dir is not None:
-            exclude.append(op.basename(self.stim_dir))
-        for root, dirs, files in os.walk(self._data_dir, topdown=True):
-            dirs[:] = [d for d in dirs if d not in exclude]
+        # now we can rearrange all files from the inventory
+        for root, files in self._inventory.walk():
+            # every file in the root, even ignored ones, is a source
+            sources = {op.relpath(op.join(root, f), self._data_dir): op.join(
+                root, f) for f in files}
+            shared_sources = {k: v for k, v in sources.items() if
+                              self._inventory.file_type(root, op.basename(v))
+                              in ("mat", "txt")}
             # each loop is a new participant so long as participant is top lev
             files[:] = [f for f in files if not self.check_ignore(op.join(
                 root, f))]
             if not files:
                 continue
             files.sort()
-            eeg = []
+            recordings = []
             dst_file_path_list = []
             names_list = []
             mat_list = []
             run_list = []
             df_list = []
             correct = None
-            part_match = self.find_a_match(files, "partLabel")
+            part_match = self._inventory.find_a_match(root, "partLabel",
+                                                      files)
             part_match_z = self.part_check(part_match)[1]
-            task_label_match = self.find_a_match(files, "task")
+            task_label_match = self._inventory.find_a_match(root, "task",
+                                                            files)
+
+            # skip the whole participant if nothing changed since last time
+            manifest = Manifest(self._bids_dir, part_match_z)
+            root_key = op.relpath(root, self._data_dir)
+            root_config = config_id(self._config)
+            if self._is_incremental and manifest.is_current(
+                    root_key, sources, root_config):
+                print("Skipping {}, sources and config are unchanged since "
+                      "the last conversion".format(root))
+                continue
+            outputs = {}
+            units = {}
+            skipped = []
+            # resume after the last committed unit of a crashed conversion
+            journal = Journal(self._bids_dir, part_match_z)
+            self._journal = journal
+            if len(journal) and self._is_verbose:
+                print("Resuming {} from {}".format(root, journal.filename))
+            intermediates = set(journal.outputs("convert"))
+            for edf_file in intermediates:
+                sources.pop(op.relpath(edf_file, self._data_dir), None)
+            files[:] = [f for f in files if op.join(root, f) not in
+                        intermediates]
+            remove_list = []
             self.make_subdirs(files)
             if self.channels:
                 self.announce_channels(part_match)
@@ -1176,10 +1973,11 @@ class Data2Bids:  # main conversion and file organization program
                 if self._is_verbose:
                     print(file)
                 src_file_path = op.join(root, file)
-                if re.match(".*?" + "\\.mat", file):
+                f_type = self._inventory.file_type(root, file)
+                if f_type == "mat":
                     mat_list.append(src_file_path)
                     continue
-                elif re.match(".*?" + "\\.txt", file):
+                elif f_type == "txt":
                     try:
                         df = pd.read_table(src_file_path, header=None,
                                            sep="\s+")
@@ -1205,15 +2003,43 @@ class Data2Bids:  # main conversion and file organization program
                     print("problem with %s:" % src_file_path, problem, "\n")
                     continue
 
+                unit_key = op.relpath(src_file_path, self._data_dir)
+                unit_sources = dict(shared_sources)
+                unit_sources[unit_key] = src_file_path
+                unit_config = config_id(self._config, op.basename(
+                    dst_file_path))
+                if self._is_incremental and manifest.is_current(
+                        unit_key, unit_sources, unit_config):
+                    print("Skipping {}, unchanged since the last conversion"
+                          "".format(src_file_path))
+                    # mat files that were read as extra channels last time
+                    for mat in manifest.get(unit_key).get("consumed", []):
+                        if mat in files:
+                            files.remove(mat)
+                        if op.join(root, mat) in mat_list:
+                            mat_list.remove(op.join(root, mat))
+                    outputs[new_name] = manifest.outputs(unit_key)
+                    self._protected.update(outputs[new_name])
+                    skipped.append(new_name)
+                    names_list.append(new_name)
+                    dst_file_path_list.append(dst_file_path)
+                    continue
+                units[new_name] = dict(key=unit_key, sources=unit_sources,
+                                       config=unit_config, consumed=[],
+                                       source=src_file_path)
+
                 # finally, if the file is not nifti
                 if dst_file_path.endswith(
                         "func") or dst_file_path.endswith("anat"):
-                    fls.mri_file_transfer(src_file_path, dst_file_path,
-                                          new_name, self._config)
+                    with profile("mri", part_match_z, src_file_path):
+                        outputs[new_name] = [fls.mri_file_transfer(
+                            src_file_path, dst_file_path, new_name,
+                            self._config)]
 
                 elif dst_file_path.endswith("ieeg"):
-                    dtype = org.from_excel(self._config["ieeg"]["headerData"][
-                                               "default"], part_match, "Type")
+                    with profile("excel", part_match_z):
+                        dtype = org.from_excel(self._config["ieeg"][
+                            "headerData"]["default"], part_match, "Type")
                     if "grid" in dtype.lower():
                         self._config["ieeg"]["type"] = "ECOG"
                     elif "seeg" in dtype.lower():
@@ -1222,29 +2048,36 @@ class Data2Bids:  # main conversion and file organization program
                         raise NotImplementedError(
                             "Types are either 'SEEG' or 'ECOG'")
 
-                    remove_src_edf = self.force_to_edf(
-                        src_file_path, files)
-
-                    f = EdfReader(op.splitext(src_file_path)[0] + ".edf")
-                    # check for extra channels in data, not working in other
-                    # file modalities
-                    extra_arrays, extra_signal_headers = \
-                        self.check_for_mat_channels(
-                            f, root, files, mat_list)
-
-                    f.close()
-                    # read edf and either copy data to BIDS file or save data
-                    # as dict for writing later
-                    eeg.append(self.read_edf(op.splitext(
-                        src_file_path)[0] + ".edf", self.channels[
-                                                 part_match], extra_arrays,
-                                             extra_signal_headers))
-
-                    if remove_src_edf:
-                        if self._is_verbose:
-                            print("Removing " + op.splitext(src_file_path)[
-                                0] + ".edf")
-                        os.remove(op.splitext(src_file_path)[0] + ".edf")
+                    if archive.is_archive(src_file_path):
+                        edf_file = src_file_path
+                    else:
+                        edf_file = op.splitext(src_file_path)[0] + ".edf"
+                    read = journal.get("read", src_file_path)
+                    recording = dict(
+                        name=new_name, source=src_file_path,
+                        edf_file=edf_file, part_match=part_match,
+                        subject=part_match_z, consumed=[], eeg=None,
+                        later=list(files), mats=list(mat_list))
+                    if journal.done("recording", src_file_path) and read:
+                        # every run was split before the crash, only the
+                        # metadata is needed to finish the subject
+                        for mat in read["consumed"]:
+                            if mat in files:
+                                files.remove(mat)
+                            if op.join(root, mat) in mat_list:
+                                mat_list.remove(op.join(root, mat))
+                        recording["consumed"] = read["consumed"]
+                        recording["eeg"] = dict(
+                            name=edf_file, bids_name=read["bids_name"],
+                            nsamples=read["nsamples"],
+                            channels=read.get("channels"),
+                            signal_headers=read["signal_headers"],
+                            file_header=pyedflib.highlevel.make_header(
+                                patientname=part_match,
+                                startdate=datetime.datetime(1, 1, 1)),
+                            data=None)
+                    recordings.append(recording)
+                    units[new_name]["consumed"] = recording["consumed"]
 
                 # move the sidecar from input to output
                 names_list.append(new_name)
@@ -1255,19 +2088,39 @@ class Data2Bids:  # main conversion and file organization program
                 except UnboundLocalError:
                     pass
 
-            # create the channels file
-            if self.channels and eeg:
-                filename, df = org.prep_tsv(
-                    self._channels_file[part_match], task_label_match,
-                    part_match_z, self._config["ieeg"], self._bids_dir)
-                ord_labels = [sig['label'] for sig in eeg[0]['signal_headers']]
-                df = org.sort_by_list(df, ord_labels, "name")
-                org.tsv_all_eeg(filename, df, self._data_types)
+            # recordings are converted and checked for extra channels at
+            # once, the .mat files they take are then settled in file order
+            pending = [r for r in recordings if r["eeg"] is None]
+            taken = set()
+            for recording, future in zip(pending, self.map_recordings(
+                    "probe_recording", pending)):
+                try:
+                    probe = future.result()
+                    retry = bool(taken & set(probe["consumed"]))
+                except Exception:
+                    if not taken:
+                        raise
+                    retry = True
+                if retry:
+                    # an earlier recording took some of its .mat files
+                    recording["later"] = [f for f in recording["later"] if
+                                          f not in taken]
+                    recording["mats"] = [m for m in recording["mats"] if
+                                         op.basename(m) not in taken]
+                    probe = self.probe_recording(recording)
+                taken.update(probe["consumed"])
+                recording["consumed"] = probe["consumed"]
+                units[recording["name"]]["consumed"] = probe["consumed"]
+                # kept until the subject is done in case of a restart
+                if probe["remove"]:
+                    remove_list.append(recording["edf_file"])
+            mat_list = [m for m in mat_list if op.basename(m) not in taken]
 
             if mat_list:  # deal with remaining .mat files
                 part_mat_list = self.part_file_sort(mat_list)
                 for mat_files in part_mat_list.values():
-                    events = org.gather_metadata(mat_files)
+                    with profile("events", part_match_z, mat_files[0]):
+                        events = org.gather_metadata(mat_files)
                     df_list.append(dict(name=mat_files[0],
                                         data=events))
 
@@ -1277,7 +2130,8 @@ class Data2Bids:  # main conversion and file organization program
                     name = df_dict["name"]
                     data = df_dict["data"]
                     if re.match(self._config["eventFiles"], name):
-                        self.events2tsv(data, name)
+                        with profile("events", part_match_z, name):
+                            self.events2tsv(data, name)
                         checker = True
                     elif self._config["coordsystem"] in name:
                         filename, df = org.prep_coordsystem(
@@ -1306,7 +2160,19 @@ class Data2Bids:  # main conversion and file organization program
                     "between the two. Go back and check the config.json file."
                     f"\nRemapped files: {names_list}"
                 )
+            bids_names = []
+            for recording in recordings:
+                if recording["eeg"] is None:
+                    # the name read_edf gives the recording
+                    edfname, dst_path = self.generate_names(
+                        recording["edf_file"], verbose=False)[0:2]
+                    bids_names.append(op.join(dst_path, edfname + ".edf"))
+                else:
+                    bids_names.append(recording["eeg"]["bids_name"])
+            sidecars = []
             for new_name in names_list:
+                if new_name in skipped:
+                    continue
                 file_path = dst_file_path_list[names_list.index(new_name)]
                 full_name = op.join(file_path, new_name + ".edf")
                 task_match = re.match(".*_task-(\w*)_.*", full_name)
@@ -1325,27 +2191,50 @@ class Data2Bids:  # main conversion and file organization program
                     print("here")
                     if self._is_verbose:
                         print("Reading for split... ")
-                    if full_name in [i["bids_name"] for i in eeg]:
-                        eeg_dict = eeg[
-                            [i["bids_name"] for i in eeg].index(full_name)]
-                    else:
+                    if full_name not in bids_names:
                         raise LookupError(
                             "This error should not have been raised, was edf "
                             "file " + full_name + " ever written?",
-                            [i["name"] for i in eeg])
-                    self.write_edf(eeg_dict["data"],
-                                   eeg_dict["signal_headers"],
-                                   eeg_dict["file_header"],
-                                   eeg_dict["name"],
-                                   correct)
+                            [r["edf_file"] for r in recordings])
+                    recording = recordings[bids_names.index(full_name)]
+                    recording["split"] = new_name
+                    recording["correct"] = correct
                     continue
                 elif not any(match_set) and self._is_verbose:
                     print("no file matching the pattern {} found in {}".format(
                         pattern, file_path))
                 else:
                     print(match_set)
+                sidecars.append((new_name, file_path, full_name))
+
+            # each recording is read and split on its own, the shared files
+            # of the subject are written here once they are all done
+            eeg = []
+            for recording, future in zip(recordings, self.map_recordings(
+                    "convert_recording", recordings)):
+                converted = future.result()
+                eeg.append(converted["eeg"])
+                if "split" in recording:
+                    outputs.setdefault(recording["split"], []).extend(
+                        converted["outputs"])
+
+            # create the channels file
+            if self.channels and eeg:
+                filename, df = org.prep_tsv(
+                    self._channels_file[part_match], task_label_match,
+                    part_match_z, self._config["ieeg"], self._bids_dir)
+                ord_labels = [sig['label'] for sig in eeg[0]['signal_headers']]
+                df = org.sort_by_list(df, ord_labels, "name")
+                org.tsv_all_eeg(filename, df, self._data_types)
+
+            for new_name, file_path, full_name in sidecars:
                 # write JSON file for any missing files
-                self.write_sidecar(op.join(file_path, new_name), part_match)
+                with profile("sidecar", part_match_z, new_name):
+                    outputs.setdefault(new_name, []).append(
+                        self.write_sidecar(op.join(file_path, new_name),
+                                           part_match))
+                if op.isfile(full_name):
+                    outputs[new_name].append(full_name)
 
             # write any indicated .json files
             try:
@@ -1360,12 +2249,50 @@ class Data2Bids:  # main conversion and file organization program
                         part_match_z, task_label_match, jfile))
                 with open(file_name, "w") as fst:
                     json.dump(contents, fst)
+
+            # remember what was converted for the next incremental run
+            for new_name, unit in units.items():
+                manifest.update(unit["key"], unit["sources"], unit["config"],
+                                [f for f in outputs.get(new_name, []) if f],
+                                consumed=unit["consumed"])
+            manifest.update(root_key, sources, root_config, [
+                f for files_out in outputs.values() for f in files_out if f])
+            manifest.save()
+            # the intermediate files of recordings converted before a crash
+            remove_list.extend(f for f in journal.outputs("convert") if
+                               f not in remove_list and op.exists(f))
+            for edf_file in remove_list:
+                if self._is_verbose:
+                    print("Removing " + edf_file)
+                os.remove(edf_file)
+            journal.clear()
+            self._journal = None
         # Output
         if self._is_verbose:
             ut.tree(self._bids_dir)
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from BIDS_converter import batch
+        batch.main(sys.argv[2:])
+        return
+    elif len(sys.argv) > 1 and sys.argv[1] == "worker":
+        from BIDS_converter import worker
+        worker.main(sys.argv[2:])
+        return
+    elif len(sys.argv) > 1 and sys.argv[1] == "stage":
+        from BIDS_converter import stage
+        stage.main(sys.argv[2:])
+        return
+    elif len(sys.argv) > 1 and sys.argv[1] == "synthetic":
+        from BIDS_converter import synthetic
+        synthetic.main(sys.argv[2:])
+        return
+    elif len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        from BIDS_converter.benchmarks import suite
+        suite.main(sys.argv[2:])
+        return
     args = get_parser().parse_args()
     data2bids = Data2Bids(**vars(args))
     data2bids.run()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import os.path as op
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from BIDS_converter.utils import fileutils as fls
+from BIDS_converter.utils.inventory import Inventory
+
+
+def get_parser():  # parses flags at onset of command
+    parser = argparse.ArgumentParser(
+        prog="data2bids stage",
+        formatter_class=argparse.RawDescriptionHelpFormatter, description="""
+        Stages the files of one subject from the lab's data share into a
+        scratch directory under the names data2bids expects, replacing the
+        find/cp/mv phase of BIDS_convert.sh. Files are hardlinked, reflinked
+        or symlinked when the filesystem allows and only copied, in parallel,
+        when it does not. An inventory json of the staged directory is
+        written for data2bids --inventory.""",
+        epilog="""
+        Made by Aaron Earle-Richardson (ae166@duke.edu)
+        """)
+
+    parser.add_argument("-s", "--subject", required=True,
+                        help="subject ID, for example D53")
+    parser.add_argument("-t", "--task", required=True,
+                        help="task folder name, for example Sentence_Rep")
+    parser.add_argument("-i", "--input_root", required=True,
+                        help="top of the data share, $ORIG_DATA_DIR in "
+                             "BIDS_convert.sh")
+    parser.add_argument("-o", "--output_dir", required=True,
+                        help="scratch directory, the subject is staged in "
+                             "{output_dir}/{subject}")
+    parser.add_argument("-c", "--config", default=None,
+                        help="JSON configuration file used to classify the "
+                             "inventory. Default: the packaged config.json")
+    parser.add_argument("--inventory", default=None,
+                        help="inventory json to write. Default: "
+                             "{output_dir}/{subject}_inventory.json")
+    parser.add_argument("-m", "--modes", nargs='*',
+                        default=list(fls.LINK_MODES),
+                        choices=fls.LINK_MODES,
+                        help="link types to try in order. Default: "
+                             + " ".join(fls.LINK_MODES))
+    parser.add_argument("--stimuli", action='store_true',
+                        help="also stage the task stimuli into "
+                             "{output_dir}/stimuli")
+    parser.add_argument("-z", "--zip", action='store_true',
+                        help="gzip recordings instead of linking them")
+    parser.add_argument("-j", "--n_jobs", type=int, default=os.cpu_count(),
+                        help="parallel copies when linking is not possible")
+    parser.add_argument("-v", "--verbose", action='store_true',
+                        help="verbosity")
+    return parser
+
+
+def find(top: str, regex: str = None, name: str = None) -> List[str]:
+    """sorted files under top whose full path matches regex, like find
+
+    :param top: directory to search
+    :type top: str
+    :param regex: pattern matched against the whole path like find -regex
+    :type regex: str
+    :param name: exact file name like find -name
+    :type name: str
+    :return: matching file paths
+    :rtype: list
+    """
+    found = []
+    for dirpath, _, files in os.walk(top):
+        for f in files:
+            path = op.join(dirpath, f)
+            if name is not None and f != name:
+                continue
+            if regex is not None and not re.fullmatch(regex, path):
+                continue
+            found.append(path)
+    return sorted(found)
+
+
+def plan(subject: str, task: str, input_root: str) -> Dict[str, str]:
+    """maps staged file names to their source files for one subject
+
+    Reproduces the find patterns of BIDS_convert.sh. Where the script copied
+    several matches onto the same name the last one wins here too.
+
+    :param subject: subject ID, for example D53
+    :type subject: str
+    :param task: task folder name
+    :type task: str
+    :param input_root: top of the data share
+    :type input_root: str
+    :return: staged name to source path
+    :rtype: dict
+    """
+    files = {}
+    recon = op.join(input_root, "ECoG_Recon_Full", subject, "elec_recon")
+    data = op.join(input_root, "D_Data", task, subject)
+
+    # CT scan .nii
+    for src in find(recon, regex=r".*[(postInPre)(ctINt1)]\.nii\.gz"):
+        files[subject + "_CT.nii.gz"] = src
+    # electrode locations .txt
+    for src in find(op.join(input_root, "..", "ECoG_Recon", subject,
+                            "elec_recon"),
+                    name=subject + "_elec_locations_RAS.txt"):
+        files[op.basename(src)] = src
+    # T1 MRI file
+    for src in find(recon, name="T1.nii.gz"):
+        files[subject + "_T1w.nii.gz"] = src
+    # stim file corrections
+    if task == "Phoneme_sequencing":
+        src = op.join(input_root, "ECoG_Task_Data", "response_coding",
+                      "PhonemeSequencingStimStarts.txt")
+        if op.isfile(src):
+            files[subject + "_PhonemeSequencingStimStarts.txt"] = src
+    # eeg files, or binary files if there are no edf files. Archived ones
+    # are staged as they are, data2bids reads them without extracting
+    edfs = find(data, regex=r".*\.edf(\.tar\.xz)?")
+    for src in edfs:
+        files[op.basename(src)] = src
+    if not edfs:
+        for src in find(data, regex=".*{}.*\\.ieeg.dat(\\.tar\\.xz)?".format(
+                subject)):
+            name = "Session{}_{}".format(op.basename(op.dirname(src)),
+                                         op.basename(src))
+            name = name.replace(subject + "_", "", 1)
+            files["{}_{}".format(subject, name)] = src
+    # experiment and event .mat, prefixed with the subject
+    for src in find(data, regex=r".*experiment\.mat") + find(
+            data, regex=r".*\/mat\/.*[tT]rial[(Info)s].*\.mat"):
+        files["{}_{}".format(subject, op.basename(src))] = src
+    return files
+
+
+def plan_stimuli(task: str, input_root: str) -> Dict[str, str]:
+    """maps relative stimuli paths to the task's stimuli files"""
+    files = {}
+    top = op.join(input_root, "task_stimuli")
+    for dirpath, dirs, _ in os.walk(top):
+        for d in dirs:
+            if d.lower() != task.lower():
+                continue
+            stim_dir = op.join(dirpath, d)
+            for src in find(stim_dir):
+                files[op.relpath(src, stim_dir)] = src
+    return files
+
+
+def link_all(files: Dict[str, str], dst_dir: str, modes: List[str],
+             n_jobs: int = 1, zip: bool = False) -> Dict[str, str]:
+    """links or copies every planned file into dst_dir in a thread pool
+
+    :return: staged path to the link type used
+    :rtype: dict
+    """
+    def work(item):
+        name, src = item
+        dst = op.join(dst_dir, name)
+        os.makedirs(op.dirname(dst), exist_ok=True)
+        if zip and re.match(r".*\.(edf|ieeg\.dat)$", name, re.IGNORECASE):
+            fls.gzip_file(src, dst + ".gz")
+            return dst + ".gz", "gzip"
+        return dst, fls.link_file(src, dst, tuple(modes))
+
+    with ThreadPoolExecutor(max_workers=max(n_jobs or 1, 1)) as pool:
+        return dict(pool.map(work, files.items()))
+
+
+def stage(subject: str, task: str, input_root: str, output_dir: str,
+          config: str = None, inventory: str = None,
+          modes: List[str] = fls.LINK_MODES, stimuli: bool = False,
+          zip: bool = False, n_jobs: int = 1, verbose: bool = False,
+          exclude: List[str] = ("BIDS", "stimuli")) -> dict:
+    """stages one subject and writes the inventory of the staged files
+
+    :param exclude: directory names data2bids will exclude, the inventory
+        is only reused if these match
+    :type exclude: list
+    :return: staged files with their link type and the inventory path
+    :rtype: dict
+    """
+    sub_dir = op.join(output_dir, subject)
+    if op.isdir(sub_dir):
+        fls.force_remove(sub_dir)
+    os.makedirs(sub_dir)
+
+    staged = link_all(plan(subject, task, input_root), sub_dir, modes,
+                      n_jobs, zip)
+    if stimuli:
+        staged.update(link_all(plan_stimuli(task, input_root), op.join(
+            output_dir, "stimuli"), modes, n_jobs))
+    if verbose:
+        for dst, mode in staged.items():
+            print("{:>8} {}".format(mode, dst))
+
+    if config is None:
+        config = op.join(op.dirname(__file__), "config.json")
+    with open(config, "r") as fst:
+        config = json.load(fst)
+    if inventory is None:
+        inventory = op.join(output_dir, subject + "_inventory.json")
+    Inventory.build(sub_dir, config, list(exclude)).to_json(inventory)
+    return dict(files=staged, inventory=inventory)
+
+
+def main(argv: List[str] = None) -> dict:
+    args = get_parser().parse_args(argv)
+    result = stage(args.subject, args.task, args.input_root, args.output_dir,
+                   args.config, args.inventory, args.modes, args.stimuli,
+                   args.zip, args.n_jobs, args.verbose)
+    modes = [mode for mode in result["files"].values()]
+    print("staged {} files for {} ({}), inventory written to {}".format(
+        len(modes), args.subject, ", ".join("{} {}".format(
+            modes.count(m), m) for m in dict.fromkeys(modes)),
+        result["inventory"]))
+    return result
+
+
+if __name__ == '__main__':
+    main()
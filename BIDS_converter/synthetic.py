@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import os.path as op
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from BIDS_converter.utils.utils import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+pyedflib = lazy_import("pyedflib")
+
+# Trials.mat counts samples of the task computer at this rate, see the
+# eventFormat SampleRate of config.json
+TASK_RATE = 30000
+# name of the trigger channel in the recordings and the stand in workbook
+TRIGGER = "DC1"
+# seconds of recording before the first and after the last trial
+MARGIN = 5
+# physical range of the EDF signals in uV
+PHYSICAL_MAX = 3000.
+
+
+def get_parser():  # parses flags at onset of command
+    parser = argparse.ArgumentParser(
+        prog="data2bids synthetic",
+        formatter_class=argparse.RawDescriptionHelpFormatter, description="""
+        Generates a synthetic Data2Bids input dataset of any size, laid out
+        like the output of data2bids stage: one directory per subject with
+        EDF or Fortran order .ieeg.dat recordings, experiment.mat,
+        Trials.mat, trialInfo.mat and RAS electrode files, plus the stimuli,
+        a stand in Timestamps workbook and a config.json pointing at it.
+        Signals are streamed to disk so 100 GB datasets need little
+        memory.""",
+        epilog="""
+        Made by Aaron Earle-Richardson (ae166@duke.edu)
+        """)
+
+    parser.add_argument("-o", "--output_dir", required=True,
+                        help="directory the dataset is written to")
+    parser.add_argument("-n", "--n_subjects", type=int, default=1,
+                        help="number of subjects. Default: 1")
+    parser.add_argument("-m", "--n_sessions", type=int, default=1,
+                        help="recordings per subject. Default: 1")
+    parser.add_argument("-c", "--n_channels", type=int, default=64,
+                        help="channels per recording. Default: 64")
+    parser.add_argument("-H", "--hours", type=float, default=0.1,
+                        help="hours per recording. Default: 0.1")
+    parser.add_argument("-r", "--sample_rate", type=int, default=2048,
+                        help="sample rate in Hz. Default: 2048")
+    parser.add_argument("-f", "--format", choices=("edf", "dat"),
+                        default="edf",
+                        help="recording format. Default: edf")
+    parser.add_argument("-t", "--task", default="PhonemeSequencing",
+                        help="task name written into the file names. "
+                             "Default: PhonemeSequencing")
+    parser.add_argument("--trial_seconds", type=float, default=4.,
+                        help="time between trial onsets. Default: 4")
+    parser.add_argument("--n_blocks", type=int, default=4,
+                        help="blocks, and so BIDS runs, per recording. "
+                             "Default: 4")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed")
+    parser.add_argument("--dry_run", action='store_true',
+                        help="only print the size the dataset would have")
+    return parser
+
+
+def recording_size(n_channels: int, hours: float, sample_rate: int,
+                   fmt: str = "edf") -> int:
+    """bytes of signal in one recording, without headers"""
+    n_samples = int(hours * 3600 * sample_rate)
+    # int16 or float32 samples of the channels and the trigger
+    return n_samples * (n_channels + 1) * (2 if fmt == "edf" else 4)
+
+
+def signal_blocks(n_channels: int, sample_rate: int, n_samples: int,
+                  onsets: List[float], seed: int = 0,
+                  block_seconds: int = 10) -> Iterator[np.ndarray]:
+    """yields (channels + trigger, samples) blocks of a recording
+
+    Channels carry noise around a 60 Hz line component and per channel
+    offsets. Noise is drawn once and circularly shifted for every block, so
+    generation runs at disk speed while no stretch of the file repeats
+    within a compressor window. The trigger channel, last, is high for 50
+    ms at every trial onset.
+
+    :param onsets: trial onsets in seconds
+    :type onsets: list
+    """
+    rng = np.random.default_rng(seed)
+    block = block_seconds * sample_rate
+    noise = rng.standard_normal((n_channels, block), np.float32) * 50
+    offsets = rng.uniform(-200, 200, (n_channels, 1)).astype(np.float32)
+    onsets = (np.asarray(onsets) * sample_rate).astype(np.int64)
+    width = int(0.05 * sample_rate)
+    for start in range(0, n_samples, block):
+        n = min(block, n_samples - start)
+        t = np.arange(start, start + n, dtype=np.float64) / sample_rate
+        data = np.empty((n_channels + 1, n), np.float32)
+        np.add(np.roll(noise, -(start // block) * 997, axis=1)[:, :n],
+               offsets, out=data[:-1])
+        data[:-1] += (20 * np.sin(2 * np.pi * 60 * t)).astype(np.float32)
+        data[-1] = 0
+        for onset in onsets[(onsets + width > start) & (onsets < start + n)]:
+            data[-1, max(onset - start, 0):onset - start + width] = 1000
+        yield data
+
+
+def write_edf(filename: str, labels: List[str], blocks: Iterator[
+        np.ndarray], sample_rate: int):
+    """streams signal blocks into an EDF file one data record at a time"""
+    headers = pyedflib.highlevel.make_signal_headers(
+        labels, sample_frequency=sample_rate, physical_max=PHYSICAL_MAX,
+        physical_min=-PHYSICAL_MAX)
+    writer = pyedflib.EdfWriter(filename, len(labels),
+                                file_type=pyedflib.FILETYPE_EDFPLUS)
+    try:
+        writer.setSignalHeaders(headers)
+        for data in blocks:
+            writer.writeSamples(np.clip(data, -PHYSICAL_MAX, PHYSICAL_MAX
+                                        ).astype(np.float64))
+    finally:
+        writer.close()
+
+
+def write_dat(filename: str, blocks: Iterator[np.ndarray]):
+    """streams signal blocks into a Fortran order float32 file, the layout
+    force_to_edf reads, with the trigger first like its channel list"""
+    with open(filename, "wb") as fst:
+        for data in blocks:
+            # C order of the transpose is the Fortran order of the block
+            data = np.roll(data, 1, axis=0)
+            np.ascontiguousarray(data.T).tofile(fst)
+
+
+def savemat(filename: str, name: str, records: List[dict]):
+    """saves a list of dicts as a MATLAB struct array"""
+    from scipy.io import savemat as _savemat
+    fields = list(records[0].keys())
+    array = np.zeros((len(records),), dtype=[(f, "O") for f in fields])
+    for i, record in enumerate(records):
+        array[i] = tuple(record[f] for f in fields)
+    _savemat(filename, {name: array})
+
+
+def make_subject(sub_dir: str, subject: str, n_sessions: int,
+                 n_channels: int, hours: float, sample_rate: int,
+                 fmt: str = "edf", task: str = "PhonemeSequencing",
+                 trial_seconds: float = 4., n_blocks: int = 4,
+                 stimuli: List[str] = ("aa.wav",), seed: int = 0
+                 ) -> List[str]:
+    """writes the recordings and metadata of one subject
+
+    :return: paths of the recordings
+    :rtype: list
+    """
+    from scipy.io import savemat as _savemat
+    os.makedirs(sub_dir, exist_ok=True)
+    labels = ["RAM{}".format(i + 1) for i in range(n_channels)]
+    duration = hours * 3600
+    n_samples = int(duration * sample_rate)
+    onsets = np.arange(MARGIN, duration - MARGIN - trial_seconds,
+                       trial_seconds)
+    if not len(onsets):
+        raise ValueError("{} hours leave no room for trials".format(hours))
+    per_block = -(-len(onsets) // n_blocks)
+
+    channels = np.zeros((n_channels,), dtype=[(f, "O") for f in (
+        "name", "lowpass_cutoff", "highpass_cutoff")])
+    for i, label in enumerate(labels):
+        channels[i] = (label, 1000, 1)
+    _savemat(op.join(sub_dir, subject + "_experiment.mat"), {"experiment": {
+        "channels": channels,
+        "recording": {"sample_rate": np.array([sample_rate, sample_rate])}}})
+
+    recordings, trials, info = [], [], []
+    for session in range(1, n_sessions + 1):
+        date = "2001{:02d}".format(session)
+        prefix = "{}_{}_{}".format(subject, task, date)
+        if fmt == "edf":
+            suffix = "" if n_sessions == 1 else "_Session{}".format(session)
+            name = "{} {} COGAN_{}{}.edf".format(subject, date, task.upper(),
+                                                suffix)
+        else:
+            name = "{}_Session{:03d}_{}.ieeg.dat".format(subject, session,
+                                                        task)
+        recordings.append(op.join(sub_dir, name))
+        blocks = signal_blocks(n_channels, sample_rate, n_samples, onsets,
+                               seed + session)
+        if fmt == "edf":
+            write_edf(recordings[-1], labels + [TRIGGER], blocks,
+                      sample_rate)
+        else:
+            write_dat(recordings[-1], blocks)
+
+        for i, onset in enumerate(onsets):
+            trials.append(dict(
+                Subject=subject, Trial=len(trials) + 1,
+                Rec="{:03d}".format(session), Day=date,
+                FilenamePrefix=prefix, Start=int(onset * TASK_RATE),
+                Auditory=int((onset + .5) * TASK_RATE),
+                Go=int((onset + 1.5) * TASK_RATE),
+                ResponseStart=(onset + 2) * TASK_RATE,
+                ResponseEnd=(onset + 2.5) * TASK_RATE))
+            info.append(dict(
+                cue="Listen", sound=stimuli[i % len(stimuli)], go="Speak",
+                block=i // per_block + 1, cueStart=onset,
+                cueEnd=onset + .3, goStart=onset + 1.5, goEnd=onset + 1.8))
+    savemat(op.join(sub_dir, subject + "_Trials.mat"), "Trials", trials)
+    savemat(op.join(sub_dir, subject + "_trialInfo.mat"), "trialInfo", info)
+
+    rng = np.random.default_rng(seed)
+    with open(op.join(sub_dir, subject + "_elec_locations_RAS.txt"),
+              "w") as fst:
+        for i, xyz in enumerate(rng.uniform(-70, 70, (n_channels, 3))):
+            fst.write("RAM {} {:.4f} {:.4f} {:.4f} L G\n".format(i + 1, *xyz))
+    return recordings
+
+
+def write_stimuli(stim_dir: str, n_stimuli: int = 8) -> List[str]:
+    """writes short silent wav files the trials refer to"""
+    from scipy.io import wavfile
+    os.makedirs(stim_dir, exist_ok=True)
+    names = ["stim{:02d}.wav".format(i + 1) for i in range(n_stimuli)]
+    for name in names:
+        wavfile.write(op.join(stim_dir, name), 8000, np.zeros(4000, np.int16))
+    return names
+
+
+def write_workbook(filename: str, subjects: List[str]):
+    """stand in for the Timestamps (MASTER) workbook, one sheet a subject"""
+    with pd.ExcelWriter(filename) as writer:
+        for subject in subjects:
+            pd.DataFrame({"Trigger": [TRIGGER], "Type": ["grid"]}).to_excel(
+                writer, sheet_name=subject, index=False)
+
+
+def write_config(filename: str, workbook: str, fmt: str = "edf"):
+    """the packaged config.json pointed at the stand in workbook"""
+    with open(op.join(op.dirname(__file__), "config.json"), "r") as fst:
+        config = json.load(fst)
+    config["ieeg"]["headerData"]["default"] = workbook
+    if fmt == "dat":
+        # float32 samples are physical values
+        config["ieeg"]["binary?"] = True
+        config["ieeg"]["digital"] = False
+        config["dataFormat"].append(".dat")
+    with open(filename, "w") as fst:
+        json.dump(config, fst, indent=4)
+
+
+def make_dataset(output_dir: str, n_subjects: int = 1, n_sessions: int = 1,
+                 n_channels: int = 64, hours: float = 0.1,
+                 sample_rate: int = 2048, fmt: str = "edf",
+                 task: str = "PhonemeSequencing", trial_seconds: float = 4.,
+                 n_blocks: int = 4, seed: int = 0) -> Dict[str, object]:
+    """generates a complete synthetic input dataset
+
+    Subjects D1, D2... are written to {output_dir}/{subject}, next to
+    {output_dir}/stimuli, Timestamps.xlsx and config.json, so a subject
+    converts with data2bids -i {output_dir}/D1 -c {output_dir}/config.json
+    -s {output_dir}/stimuli.
+
+    :param output_dir: directory the dataset is written to
+    :type output_dir: str
+    :param n_subjects: number of subjects
+    :type n_subjects: int
+    :param n_sessions: recordings per subject
+    :type n_sessions: int
+    :param n_channels: channels per recording
+    :type n_channels: int
+    :param hours: length of each recording
+    :type hours: float
+    :param sample_rate: sample rate in Hz
+    :type sample_rate: int
+    :param fmt: edf or dat
+    :type fmt: str
+    :param task: task name written into the file names
+    :type task: str
+    :param trial_seconds: time between trial onsets
+    :type trial_seconds: float
+    :param n_blocks: blocks per recording
+    :type n_blocks: int
+    :param seed: random seed
+    :type seed: int
+    :return: subject directories, recordings, config, stimuli and bytes
+    :rtype: dict
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stim_dir = op.join(output_dir, "stimuli")
+    stimuli = write_stimuli(stim_dir)
+    subjects = ["D{}".format(i + 1) for i in range(n_subjects)]
+    workbook = op.join(output_dir, "Timestamps.xlsx")
+    write_workbook(workbook, subjects)
+    config = op.join(output_dir, "config.json")
+    write_config(config, workbook, fmt)
+    recordings = {}
+    for i, subject in enumerate(subjects):
+        recordings[subject] = make_subject(
+            op.join(output_dir, subject), subject, n_sessions, n_channels,
+            hours, sample_rate, fmt, task, trial_seconds, n_blocks,
+            stimuli, seed + 1000 * i)
+    return dict(subjects={s: op.join(output_dir, s) for s in subjects},
+                recordings=recordings, config=config, stim_dir=stim_dir,
+                bytes=sum(op.getsize(f) for files in recordings.values()
+                          for f in files))
+
+
+def main(argv: List[str] = None) -> dict:
+    args = get_parser().parse_args(argv)
+    size = recording_size(args.n_channels, args.hours, args.sample_rate,
+                          args.format) * args.n_subjects * args.n_sessions
+    if args.dry_run:
+        print("{} recordings, {:.2f} GB".format(
+            args.n_subjects * args.n_sessions, size / 1e9))
+        return {}
+    result = make_dataset(args.output_dir, args.n_subjects, args.n_sessions,
+                          args.n_channels, args.hours, args.sample_rate,
+                          args.format, args.task, args.trial_seconds,
+                          args.n_blocks, args.seed)
+    print("wrote {} recordings, {:.2f} GB, to {}".format(
+        sum(len(f) for f in result["recordings"].values()),
+        result["bytes"] / 1e9, args.output_dir))
+    return result
+
+
+if __name__ == '__main__':
+    main()
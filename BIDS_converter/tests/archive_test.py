@@ -0,0 +1,102 @@
+import glob
+import lzma
+import os
+import shutil
+import tarfile
+
+import numpy as np
+import pyedflib
+import pytest
+
+from BIDS_converter import synthetic
+from BIDS_converter.data2bids import Data2Bids
+from BIDS_converter.utils import archive, edf
+
+
+def make_archive(filename):
+    with tarfile.open(filename + ".tar.xz", "w:xz") as tar:
+        tar.add(filename, arcname=os.path.basename(filename))
+    os.remove(filename)
+    return filename + ".tar.xz"
+
+
+def test_strip_archive():
+    assert archive.is_archive("D48 Session1.edf.tar.xz")
+    assert not archive.is_archive("D48 Session1.edf")
+    assert archive.strip_archive("a.ieeg.dat.TGZ") == "a.ieeg.dat"
+    assert archive.strip_archive("a.edf") == "a.edf"
+
+
+@pytest.mark.parametrize("xz", [True, False])
+def test_open_member(tmp_path, monkeypatch, xz):
+    if not xz:
+        monkeypatch.setattr(shutil, "which", lambda cmd: None)
+    elif shutil.which("xz") is None:
+        pytest.skip("the xz command is not installed")
+    rng = np.random.default_rng(0)
+    headers = pyedflib.highlevel.make_signal_headers(
+        ["A1", "A2"], sample_frequency=100, physical_min=-100,
+        physical_max=300)
+    signals = rng.uniform(-100, 300, (2, 1000))
+    filename = str(tmp_path / "sub-01.edf")
+    pyedflib.highlevel.write_edf(filename, signals, headers)
+    expected = pyedflib.highlevel.read_edf(filename, digital=True,
+                                           verbose=False)[0]
+    with open(tmp_path / "notes.txt", "w") as fst:
+        fst.write("first member")
+    with tarfile.open(str(tmp_path / "sub-01.tar.xz"), "w:xz") as tar:
+        tar.add(str(tmp_path / "notes.txt"), arcname="notes.txt")
+        tar.add(filename, arcname="sub-01.edf")
+
+    with archive.open_member(str(tmp_path / "sub-01.tar.xz"),
+                             (".edf",)) as (info, fobj):
+        assert info.name == "sub-01.edf"
+        stream = edf.EdfStream(fobj, info.name)
+        assert stream.getSignalLabels() == ["A1", "A2"]
+        assert stream.samples_in_file(0) == 1000
+        data, read_headers = stream.read([1], digital=True)
+    np.testing.assert_array_equal(data, expected[1:])
+    assert read_headers[0]["label"] == "A2"
+
+    with pytest.raises(FileNotFoundError):
+        with archive.open_member(str(tmp_path / "sub-01.tar.xz"),
+                                 (".dat",)):
+            pass
+    with open(tmp_path / "sub-01.tar.xz", "r+b") as fst:
+        fst.seek(-40, os.SEEK_END)
+        fst.write(b"\0" * 8)
+    with pytest.raises((OSError, EOFError, lzma.LZMAError,
+                        tarfile.TarError)):
+        with archive.open_member(str(tmp_path / "sub-01.tar.xz")) as (
+                info, fobj):
+            fobj.read()
+
+
+@pytest.mark.parametrize("fmt", ["edf", "dat"])
+def test_convert(tmp_path, fmt):
+    dataset = synthetic.make_dataset(str(tmp_path / "data"), n_channels=4,
+                                     hours=0.01, sample_rate=256, fmt=fmt,
+                                     n_blocks=2)
+    subject = dataset["subjects"]["D1"]
+    outputs = {}
+    for name in ("plain", "archived"):
+        if name == "archived":
+            for recording in dataset["recordings"]["D1"]:
+                make_archive(recording)
+        os.makedirs(tmp_path / name)
+        Data2Bids(input_dir=subject, config=dataset["config"],
+                  stim_dir=dataset["stim_dir"],
+                  output_dir=str(tmp_path / name)).run()
+        outputs[name] = str(tmp_path / name / "BIDS" / "sub-D0001" / "ieeg"
+                            / "sub-D0001_task-PhonemeSequence_acq-01_"
+                              "run-02_ieeg.edf")
+
+    # nothing is extracted next to the archives
+    assert not glob.glob(os.path.join(subject, "*." + fmt))
+    plain, archived = (pyedflib.highlevel.read_edf(
+        outputs[name], digital=True, verbose=False) for name in
+        ("plain", "archived"))
+    # plain binary recordings are quantized to an intermediate EDF first
+    np.testing.assert_allclose(archived[0], plain[0],
+                               atol=0 if fmt == "edf" else 1)
+    assert archived[1] == plain[1]
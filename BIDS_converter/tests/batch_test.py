@@ -0,0 +1,123 @@
+import glob
+import json
+import os
+import subprocess
+import sys
+
+from BIDS_converter import batch, synthetic
+
+
+def write_header(filename, n_signals, n_records, per_record=1000):
+    # an EDF header without data records, all the estimate reads
+    fields = [("EEG{}".format(i), 16) for i in range(n_signals)] + \
+        [("", 80), ("uV", 8), ("-3200", 8), ("3200", 8), ("-32768", 8),
+         ("32767", 8), ("", 80)] + [(str(per_record), 8), ("", 32)]
+    signals = b"".join(
+        value.ljust(width).encode() for value, width in fields[:n_signals])
+    for value, width in fields[n_signals:]:
+        signals += value.ljust(width).encode() * n_signals
+    main = "0".ljust(8) + "".ljust(160) + "01.01.01" + "00.00.00" + \
+        str(256 * (n_signals + 1)).ljust(8) + "".ljust(44) + \
+        str(n_records).ljust(8) + "1".ljust(8) + str(n_signals).ljust(4)
+    with open(filename, "wb") as fst:
+        fst.write(main.encode() + signals)
+
+
+def test_make_jobs():
+    jobs = batch.make_jobs(["D48", "D52"], ["Phoneme_Sequencing"],
+                           {"Phoneme_Sequencing": ["D52", "D53"]})
+    assert [(j["task"], j["sub"]) for j in jobs] == [
+        ("Phoneme_Sequencing", "D48"), ("Phoneme_Sequencing", "D52"),
+        ("Phoneme_Sequencing", "D53")]
+
+
+def test_failures_are_isolated(tmp_path):
+    # neither subject exists, so both jobs fail without stopping the batch
+    out = tmp_path / "out"
+    report = batch.main(["-s", "D1", "D2", "-t", "Task", "-i",
+                         str(tmp_path / "in"), "-o", str(out), "-j", "2"])
+    assert report["jobs"] == 2
+    assert report["failed"] == 2
+    assert os.path.isdir(out / "Task" / "BIDS")
+    with open(out / "batch_report.json") as fst:
+        saved = json.load(fst)
+    assert [r["sub"] for r in saved["results"]] == ["D1", "D2"]
+    assert all(os.path.isfile(r["log"]) for r in saved["results"])
+    assert all(r["estimated_mb"] == batch.BASE_BYTES >> 20 and
+               r["peak_mb"] > 0 for r in saved["results"])
+
+
+def test_convert(tmp_path):
+    dataset = synthetic.make_dataset(
+        str(tmp_path / "data"), n_subjects=2, n_channels=4, hours=0.01,
+        sample_rate=256, n_blocks=2)
+    out = tmp_path / "out"
+    proc = subprocess.run(
+        [sys.executable, batch.__file__, "-s", "D1", "D2", "-t", "Task",
+         "-i", str(tmp_path / "data"), "--input_template", "{root}/{sub}",
+         "-o", str(out), "-c", dataset["config"], "--stim_template",
+         dataset["stim_dir"], "-j", "2"], capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    with open(out / "batch_report.json") as fst:
+        report = json.load(fst)
+    assert (report["jobs"], report["succeeded"]) == (2, 2)
+    assert all(r["status"] == "ok" and r["peak_mb"] > 0
+               for r in report["results"])
+    for sub in ("D0001", "D0002"):
+        ieeg = out / "Task" / "BIDS" / "sub-{}".format(sub) / "ieeg"
+        assert len(glob.glob(str(ieeg / "*_run-*_ieeg.edf"))) == 2
+        assert len(glob.glob(str(ieeg / "*_run-*_events.tsv"))) == 2
+        assert len(glob.glob(str(ieeg / "*_electrodes.tsv"))) == 1
+
+
+def test_jobs_share_cores(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    seen = []
+    monkeypatch.setattr(batch, "job_kwargs", lambda *args: seen.append(
+        args[-1]) or dict(input_dir=str(tmp_path / "in")))
+    batch.main(["-s", "D1", "D2", "-t", "Task", "-i", str(tmp_path / "in"),
+                "-o", str(tmp_path / "out"), "-j", "2"])
+    assert seen == [4, 4]
+
+
+def test_estimate_job(tmp_path):
+    os.makedirs(tmp_path / "D1")
+    write_header(tmp_path / "D1" / "a.edf", 100, 3600)
+    write_header(tmp_path / "D1" / "b.edf", 10, 3600)
+    with open(tmp_path / "D1" / "c.dat", "wb") as fst:
+        fst.write(bytes(4000))
+    samples = 100 * 3600 * 1000
+    assert batch.estimate_job(str(tmp_path / "D1")) == \
+        batch.BASE_BYTES + samples * batch.BYTES_PER_SAMPLE["physical"]
+    # the largest recordings are converted at once
+    assert batch.estimate_job(str(tmp_path / "D1"), 3, 4, 8) == \
+        batch.BASE_BYTES + (samples * 11 // 10 + 1000) * 8 + 4000
+    assert batch.estimate_job(str(tmp_path / "D2")) == batch.BASE_BYTES
+
+
+def test_admit_fills_gaps():
+    gb = 1 << 30
+    jobs = [dict(sub=sub, estimate=size * gb) for sub, size in
+            [("D1", 6), ("D2", 6), ("D3", 2), ("D4", 1), ("D5", 12)]]
+    pending = list(jobs)
+    # D2 waits for room, the smaller D3 takes the gap
+    running = batch.admit(pending, [], 8 * gb, 4)
+    assert [j["sub"] for j in running] == ["D1", "D3"]
+    running.remove(jobs[0])
+    running += batch.admit(pending, running, 8 * gb, 4)
+    assert [j["sub"] for j in running] == ["D3", "D2"]
+    assert sum(j["estimate"] for j in running) <= 8 * gb
+    running.remove(jobs[2])
+    running += batch.admit(pending, running, 8 * gb, 4)
+    assert [j["sub"] for j in running] == ["D2", "D4"]
+    # a job over the budget waits until it can run alone
+    assert batch.admit(pending, running, 8 * gb, 4) == []
+    assert [j["sub"] for j in batch.admit(pending, [], 8 * gb, 4)] == \
+        ["D5"]
+    assert pending == []
+
+
+def test_admit_workers():
+    pending = [dict(sub=str(i), estimate=1) for i in range(3)]
+    assert len(batch.admit(pending, [], None, 2)) == 2
+    assert len(pending) == 1
@@ -0,0 +1,38 @@
+import pytest
+
+from BIDS_converter.benchmarks import suite
+
+
+def entry(value, unit="s", machine="a", scale=1.):
+    return dict(machine=machine, scale=scale,
+                results={"names.match_regexp": dict(value=value, unit=unit)})
+
+
+def test_find_regressions():
+    history = [entry(1.), entry(1.1), entry(0.9), entry(10, machine="b"),
+               entry(10, scale=2.)]
+    assert not suite.find_regressions(entry(1.2), history)
+    regressions = suite.find_regressions(entry(1.5), history)
+    assert regressions["names.match_regexp"]["baseline"] == 1.
+    assert regressions["names.match_regexp"]["change"] == pytest.approx(.5)
+    # throughput regresses when it drops
+    history = [entry(100., "MB/s")]
+    assert not suite.find_regressions(entry(150., "MB/s"), history)
+    assert suite.find_regressions(entry(50., "MB/s"), history)
+    # nothing to compare with on a new machine
+    assert not suite.find_regressions(entry(100., machine="c"), history)
+
+
+def test_history(tmp_path):
+    history = str(tmp_path / "history.jsonl")
+    argv = ["-b", "names", "-s", "0.001", "-r", "1", "--history", history]
+    first = suite.main(argv)
+    assert set(first["results"]) == {"names.match_regexp",
+                                     "names.generate_names"}
+    # timings this short are mostly noise
+    second = suite.main(argv + ["-t", "1000"])
+    assert suite.load_history(history) == [first, second]
+    # every metric regresses with a negative threshold
+    with pytest.raises(SystemExit):
+        suite.main(argv + ["-t", "-1"])
+    assert len(suite.load_history(history)) == 3
@@ -0,0 +1,74 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyedflib
+
+from BIDS_converter import synthetic
+from BIDS_converter.data2bids import Data2Bids
+from BIDS_converter.utils import brainvision as bv
+
+
+def test_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    headers = pyedflib.highlevel.make_signal_headers(
+        ["A1", "B,2", "Trigger"], sample_frequency=500, physical_min=-100,
+        physical_max=300)
+    digital = rng.integers(-32768, 32767, (3, 1000))
+    events = pd.DataFrame(dict(sample=[110, 150, np.nan],
+                               duration=[0.1, 0.0003, 1],
+                               trial_type=["Audio", "Go", "lost"]))
+    markers = bv.events_to_markers(events, start=100, sample_rate=500)
+    assert markers == [("Audio", 11, 50), ("Go", 51, 1)]
+
+    files = bv.write_brainvision(str(tmp_path / "sub-01_ieeg.edf"), digital,
+                                 headers, 500, markers, digital=True)
+    assert files == [str(tmp_path / "sub-01_ieeg") + ext for ext in
+                     (".vhdr", ".vmrk", ".eeg")]
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(f) for f in files)
+    header = bv.read_header(files[1])
+    assert header["channels"] == ["A1", "B,2", "Trigger"]
+    assert header["sample_rate"] == 500 and header["n_samples"] == 1000
+    # digital values are scaled like pyedflib does
+    physical = (digital + 32768) * 400 / 65535 - 100
+    np.testing.assert_allclose(bv.read_brainvision(files[0]), physical,
+                               rtol=1e-6, atol=1e-4)
+    with open(files[1], "r", encoding="utf-8") as fst:
+        lines = fst.read().splitlines()
+    assert lines[-2:] == ["Mk2=Stimulus,Audio,11,50,0",
+                          "Mk3=Stimulus,Go,51,1,0"]
+
+
+def test_convert(tmp_path):
+    dataset = synthetic.make_dataset(str(tmp_path / "data"), n_channels=4,
+                                     hours=0.01, sample_rate=256, n_blocks=2)
+    outputs = {}
+    for ieeg_format in ("edf", "brainvision"):
+        out = tmp_path / ieeg_format
+        os.makedirs(out)
+        Data2Bids(input_dir=dataset["subjects"]["D1"],
+                  config=dataset["config"], stim_dir=dataset["stim_dir"],
+                  output_dir=str(out), ieeg_format=ieeg_format).run()
+        outputs[ieeg_format] = str(out / "BIDS" / "sub-D0001" / "ieeg" /
+                                   "sub-D0001_task-PhonemeSequence_acq-01_"
+                                   "run-02_")
+
+    edf, vhdr = outputs["edf"], outputs["brainvision"]
+    assert not os.path.exists(vhdr + "ieeg.edf")
+    data = bv.read_brainvision(vhdr + "ieeg.vhdr")
+    signals = pyedflib.highlevel.read_edf(edf + "ieeg.edf")[0]
+    # EDF pads the last data record to a whole second
+    np.testing.assert_allclose(data, signals[:, :data.shape[1]], atol=1e-3)
+
+    events = pd.read_csv(vhdr + "events.tsv", sep="\t")
+    with open(vhdr + "ieeg.vmrk", "r", encoding="utf-8") as fst:
+        positions = [int(line.split(",")[2]) for line in fst if
+                     line.startswith("Mk") and "Stimulus" in line]
+    assert positions == (events["sample"] + 1).tolist()
+
+    with open(vhdr + "ieeg.json", "r") as fst:
+        sidecar = json.load(fst)
+    assert sidecar["ECOGChannelCount"] == 4
+    assert sidecar["RecordingDuration"] == data.shape[1] / 256
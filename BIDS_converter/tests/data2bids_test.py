@@ -0,0 +1,49 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from BIDS_converter.data2bids import Data2Bids
+
+src_path = "Data/Phoneme_Sequencing/sourcedata"
+config_path = "BIDS_converter/config.json"
+
+
+@pytest.fixture
+def kwargs(tmp_path):
+    shutil.copytree(os.path.join(src_path, "D52"),
+                    tmp_path / "data" / "D52")
+    with open(config_path, "r") as fst:
+        config = json.load(fst)
+    # the timestamps workbook is not part of the repository
+    config["ieeg"]["headerData"]["default"] = "Trigger"
+    with open(tmp_path / "config.json", "w") as fst:
+        json.dump(config, fst)
+    return dict(input_dir=str(tmp_path / "data"), config=str(tmp_path / "config.json"),
+                output_dir=str(tmp_path / "out"), lazy=True)
+
+
+def test_lazy_stages(kwargs, tmp_path, monkeypatch):
+    os.makedirs(tmp_path / "out")
+    d2b = Data2Bids(**kwargs)
+    assert not d2b.timings
+    assert os.listdir(tmp_path / "out") == []
+
+    assert d2b.get_bids_dir() == str(tmp_path / "out" / "BIDS")
+    assert list(d2b.timings) == ["bids_dir"]
+    d2b.prepare()
+    assert list(d2b.timings) == ["bids_dir", "DICOM", "multi_echo",
+                                 "stimuli", "inventory", "channels"]
+    channels = d2b.channels
+    assert len(channels["D52"]) > 1
+
+    # channel discovery is skipped while the inventory is current
+    def chan_walk(*args):
+        raise AssertionError("channels were scanned again")
+
+    monkeypatch.setattr(Data2Bids, "chan_walk", chan_walk)
+    d2b = Data2Bids(**kwargs)
+    d2b.prepare()
+    assert d2b.channels == channels
+    assert d2b.sample_rate["D52"] > 0
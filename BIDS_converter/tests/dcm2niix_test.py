@@ -0,0 +1,63 @@
+import os
+import stat
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from BIDS_converter.utils import fileutils as fls
+
+# writes the outputs dcm2niix would, after a delay so conversions overlap
+STUB = """#!{python}
+import os, sys, time
+args = dict(zip(sys.argv[1:-1:2], sys.argv[2::2]))
+name = args["-f"].replace("%p", "bold").replace("%t", "20200101")
+time.sleep(0.2)
+for ext in (".nii.gz", ".json"):
+    with open(os.path.join(args["-o"], name + ext), "w") as fst:
+        fst.write(sys.argv[-1])
+print("Convert 1 DICOM as " + os.path.join(args["-o"], name))
+"""
+
+
+@pytest.fixture
+def dcm2niix(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    os.makedirs(bin_dir)
+    stub = bin_dir / "dcm2niix"
+    stub.write_text(STUB.format(python=sys.executable))
+    stub.chmod(stub.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep +
+                       os.environ["PATH"])
+
+
+def test_parallel_series(tmp_path, dcm2niix):
+    sub_dir = tmp_path / "sub-01"
+    os.makedirs(sub_dir)
+    jobs = []
+    for series in range(1, 7):
+        subdir = tmp_path / "dicom" / str(series)
+        os.makedirs(subdir)
+        (subdir / "IM0001.dcm").write_text("")
+        jobs.append((str(subdir), series, str(series).zfill(2)))
+    # multi echo runs copied over from the medata folder
+    runlist = ["2", "5"]
+    for scan in ("02", "05"):
+        for echo in ("e01", "e02"):
+            (sub_dir / "run{}.{}.nii".format(scan, echo)).write_text(echo)
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        outs = list(pool.map(lambda job: fls.run_dcm2niix(
+            *job, runlist, str(sub_dir), "01"), jobs))
+
+    assert all("Convert 1 DICOM" in out for out in outs)
+    files = sorted(os.listdir(sub_dir))
+    assert files == sorted(
+        ["run{}_bold_20200101_sub01.{}".format(scan, ext)
+         for scan in ("01", "03", "04", "06") for ext in ("nii.gz", "json")] +
+        ["run{}_bold_20200101_sub01.{}.{}".format(scan, echo, ext)
+         for scan in ("02", "05") for echo in ("e01", "e02")
+         for ext in ("nii", "json")])
+    # the single file conversion only donates its name and sidecar
+    me_json = sub_dir / "run05_bold_20200101_sub01.e02.json"
+    assert me_json.read_text().endswith("IM0001.dcm")
@@ -0,0 +1,67 @@
+import os
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from BIDS_converter.utils.dicomindex import DicomIndex, CACHE_NAME
+
+
+def write_dcm(path, series):
+    ds = Dataset()
+    ds.PatientID = "Sub_01"
+    ds.SeriesNumber = series
+    ds.RepetitionTime = 2000
+    ds.EchoTime = 30
+    ds.ImagesInAcquisition = 36
+    ds.ScanningSequence = ["EP", "GR"]
+    ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4"
+    ds.SOPInstanceUID = generate_uid()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.save_as(str(path), enforce_file_format=True)
+
+
+def test_dicom_index(tmp_path):
+    ddir = tmp_path / "dicom"
+    for series, files in ((3, ["IM0001", "IM0002"]), (5, ["IM0001"])):
+        os.makedirs(ddir / str(series))
+        for f in files:
+            write_dcm(ddir / str(series) / f, series)
+    (ddir / "5" / ".DS_Store").write_text("")
+    os.makedirs(ddir / "medata")
+    (ddir / "medata" / "run05.e01.nii").write_text("")
+
+    index = DicomIndex.load(ddir, n_jobs=2)
+    assert index.walk()[0] == str(ddir)
+    assert index.header(ddir / "5")["SeriesNumber"] == 5
+    assert index.header(ddir / "medata") is None
+    assert index.first_header(ddir)["RepetitionTime"] == 2000
+    assert index.files(ddir / "medata") == ["run05.e01.nii"]
+
+    # the cache in the root is reused until the tree changes
+    assert os.path.isfile(ddir / CACHE_NAME)
+    cached = DicomIndex.from_json(ddir / CACHE_NAME)
+    assert cached.is_current()
+    assert DicomIndex.load(ddir).dirs == index.dirs
+    os.makedirs(ddir / "7")
+    write_dcm(ddir / "7" / "IM0001", 7)
+    assert not cached.is_current()
+    assert DicomIndex.load(ddir).header(ddir / "7")["SeriesNumber"] == 7
+
+
+def test_converted(tmp_path):
+    ddir = tmp_path / "dicom"
+    os.makedirs(ddir / "3")
+    write_dcm(ddir / "3" / "IM0001", 3)
+    sub_dir = tmp_path / "sub-01"
+    os.makedirs(sub_dir)
+    (sub_dir / "run03.nii.gz").write_text("")
+
+    index = DicomIndex.load(ddir)
+    assert not index.is_converted(sub_dir)
+    index.converted[str(sub_dir)] = ["run03.nii.gz"]
+    index.to_json(ddir / CACHE_NAME)
+    index = DicomIndex.load(ddir)
+    assert index.is_current() and index.is_converted(sub_dir)
+    os.remove(sub_dir / "run03.nii.gz")
+    assert not index.is_converted(sub_dir)
@@ -0,0 +1,34 @@
+import pytest
+
+from BIDS_converter.utils.entities import parse_entities, build_name
+
+
+@pytest.mark.parametrize("name", [
+    "sub-D0052_task-PhonemeSequencing_acq-01_run-01_ieeg.edf",
+    "sub-D0048_ses-01_task-Sentence_echo-2_ce-gad_run-03_bold.nii.gz",
+    "sub-D0052_CT.nii.gz",
+    "sub-D0052_task-PhonemeSequencing_run-01_events.tsv",
+    "sub-D0052_task-PhonemeSequencing_ieeg",
+])
+def test_round_trip(name):
+    entities = parse_entities("BIDS/sub-D0052/ieeg/" + name)
+    assert build_name(entities) == name
+
+
+def test_matches_pybids():
+    layout = pytest.importorskip("bids.layout")
+    name = "sub-D0052_task-PhonemeSequencing_acq-01_run-01_ieeg.edf"
+    ours = parse_entities(name)
+    theirs = layout.parse_file_entities("/" + name)
+    assert (ours["sub"], ours["task"], ours["acq"]) == (
+        theirs["subject"], theirs["task"], theirs["acquisition"])
+    assert int(ours["run"]) == theirs["run"]
+    assert (ours["suffix"], ours["extension"]) == (theirs["suffix"],
+                                                   theirs["extension"])
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        parse_entities("sub-01_task-a_b_ieeg.edf")
+    with pytest.raises(ValueError):
+        build_name(dict(sub="01", task="a_b", suffix="ieeg"))
@@ -0,0 +1,112 @@
+import gzip
+import json
+import os
+import stat
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from BIDS_converter.utils import fileutils as fls
+
+CONFIG = {"compress": True, "compressLevel": 6, "repetitionTimeInSec": 2.}
+
+
+def reference(img, minc4d=False):
+    # what mri_file_transfer wrote when it loaded the whole volume
+    data = np.array(img.dataobj)
+    if minc4d:
+        data = np.swapaxes(data.T, 0, 1)
+    ref = nib.Nifti1Image(data, np.array(img.affine), img.header)
+    if minc4d:
+        ref.header.set_xyzt_units(xyz="mm", t="sec")
+        zooms = np.array(ref.header.get_zooms())
+        zooms[3] = CONFIG["repetitionTimeInSec"]
+        ref.header.set_zooms(zooms)
+    return ref
+
+
+def decompressed(filename):
+    with gzip.open(filename, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name, shape, dtype, slope", [
+    ("T1.mgz", (9, 8, 7), np.float32, None),
+    ("T1.mgz", (9, 8, 7), np.uint8, None),
+    # float data from a scaled image is scaled again to fit int16
+    ("T1.mgz", (9, 8, 7), np.int16, .5),
+    ("bold.mnc", (5, 4, 3, 6), np.float32, None),
+])
+def test_streamed_conversion(tmp_path, monkeypatch, name, shape, dtype,
+                             slope):
+    rng = np.random.default_rng(0)
+    data = (rng.random(shape) * 100).astype(dtype)
+    affine = np.diag([1., 2., 3., 1.])
+    if slope is None:
+        img = nib.MGHImage(data, affine)
+        src = tmp_path / "src.mgz"
+    else:
+        img = nib.Nifti1Image(data, affine)
+        img.header.set_slope_inter(slope, 1.)
+        src = tmp_path / "src.nii"
+    nib.save(img, src)
+    img = nib.load(src)
+    # nibabel cannot write MINC, so any image can stand in for one
+    monkeypatch.setattr(fls.nib, "load", lambda f: img)
+    monkeypatch.setattr(fls, "SLAB_BYTES", 256)
+
+    out = fls.mri_file_transfer(str(tmp_path / name), str(tmp_path), "out",
+                                CONFIG)
+    ref = reference(img, name.endswith(".mnc"))
+    nib.save(ref, tmp_path / "ref.nii.gz")
+    assert decompressed(out) == decompressed(tmp_path / "ref.nii.gz")
+
+
+def test_nii_compressed_in_one_pass(tmp_path):
+    img = nib.Nifti1Image(np.ones((3, 3, 3), np.int16), np.eye(4))
+    nib.save(img, tmp_path / "T1.nii")
+    out = fls.mri_file_transfer(str(tmp_path / "T1.nii"), str(tmp_path),
+                                "sub-01_T1w", CONFIG)
+    assert out == str(tmp_path / "sub-01_T1w.nii.gz")
+    assert not (tmp_path / "sub-01_T1w.nii").exists()
+    assert decompressed(out) == (tmp_path / "T1.nii").read_bytes()
+
+
+@pytest.mark.parametrize("size", [0, 1000, 10 ** 5])
+def test_parallel_gzip(tmp_path, size):
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 8, size, np.uint8).tobytes()
+    out = tmp_path / "data.bin.gz"
+    # small blocks so several are deflated and stitched together
+    with fls.ParallelGzipWriter(out, 6, n_threads=3, block_size=4096) as f:
+        for start in range(0, size, 3000):
+            f.write(data[start:start + 3000])
+    assert gzip.decompress(out.read_bytes()) == data
+    with gzip.open(out) as f:
+        assert f.read() == data
+
+
+def test_parallel_gzip_nifti(tmp_path, monkeypatch):
+    monkeypatch.setattr(fls, "GZIP_BLOCK", 1024)
+    img = nib.Nifti1Image(np.arange(4000, dtype=np.int16).reshape(
+        20, 20, 10), np.eye(4))
+    nib.save(img, tmp_path / "T1.nii")
+    fls.gzip_file(tmp_path / "T1.nii", tmp_path / "T1.nii.gz", 6, 4)
+    assert np.array_equal(nib.load(tmp_path / "T1.nii.gz").get_fdata(),
+                          img.get_fdata())
+
+
+@pytest.mark.parametrize("umask", [0o022, 0o027])
+def test_write_json_mode(tmp_path, umask):
+    # shared BIDS trees are read by the whole lab
+    old = os.umask(umask)
+    try:
+        fls.write_json(tmp_path / "sidecar.json", {"a": 1})
+    finally:
+        os.umask(old)
+    mode = stat.S_IMODE(os.stat(tmp_path / "sidecar.json").st_mode)
+    assert mode == 0o666 & ~umask
+    with open(tmp_path / "sidecar.json") as fst:
+        assert json.load(fst) == {"a": 1}
+    assert os.listdir(tmp_path) == ["sidecar.json"]
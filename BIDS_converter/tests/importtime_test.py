@@ -0,0 +1,50 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+root = Path(__file__).resolve().parents[2]
+
+# imported on first use by data2bids, see utils.lazy_import
+HEAVY = ("bids", "matgrab", "nibabel", "numpy", "pandas", "pydicom",
+         "pyedflib", "scipy")
+
+
+def importtime(*args) -> dict:
+    """cumulative microseconds of each module imported by a python call"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args],
+                          cwd=root, capture_output=True, text=True,
+                          check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _, cumulative, name = line.split("|")
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("args", [
+    ("-c", "import BIDS_converter.data2bids"),
+    ("-c", "import BIDS_converter.batch, BIDS_converter.stage, "
+           "BIDS_converter.worker"),
+    ("BIDS_converter/data2bids.py", "--help"),
+])
+def test_no_heavy_imports(args):
+    loaded = [name for name in importtime(*args)
+              if name.split(".")[0] in HEAVY]
+    assert not loaded
+
+
+@pytest.mark.parametrize("module", ["BIDS_converter.data2bids",
+                                    "BIDS_converter.utils.utils"])
+def test_lazy_modules_not_loaded(module):
+    # lazy_import leaves an unexecuted module under the package name, the
+    # subpackages only appear once the package is imported for real
+    proc = subprocess.run([sys.executable, "-c", """
+import sys, {}
+print(" ".join(name for name in sys.modules
+               if name.startswith(("numpy.", "pandas."))))""".format(module)],
+                          cwd=root, capture_output=True, text=True,
+                          check=True)
+    assert proc.stdout.split() == []
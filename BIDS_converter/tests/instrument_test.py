@@ -0,0 +1,38 @@
+import json
+
+from BIDS_converter.utils.instrument import Profiler
+
+
+def test_profiler(tmp_path):
+    prof = Profiler(trace_memory=True)
+    with prof.stage("split", "D0001", "a.edf"):
+        with prof.stage("sidecar", "D0001", "a.json"):
+            block = bytearray(4 << 20)
+            del block
+        (tmp_path / "a.edf").write_bytes(b"0" * 1000)
+    with prof.stage("split", "D0002"):
+        pass
+
+    inner, outer, _ = prof.records
+    assert (inner["stage"], inner["depth"], outer["depth"]) == (
+        "sidecar", 1, 0)
+    # the outer stage includes the allocations of the inner one
+    assert inner["peak_traced"] >= 4 << 20
+    assert outer["peak_traced"] >= inner["peak_traced"]
+    assert outer["wall"] >= inner["wall"]
+    if outer["write_bytes"] is not None:
+        assert outer["write_bytes"] >= 1000
+
+    prof.save(tmp_path / "profile.json")
+    with open(tmp_path / "profile.json") as fst:
+        report = json.load(fst)
+    assert report["totals"]["split"]["count"] == 2
+    assert list(report["subjects"]) == ["D0001", "D0002"]
+    assert report["subjects"]["D0002"]["split"]["count"] == 1
+
+
+def test_disabled():
+    prof = Profiler(enabled=False)
+    with prof.stage("split"):
+        pass
+    assert prof.records == []
@@ -0,0 +1,51 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from BIDS_converter.utils.inventory import Inventory, file_type
+
+src_path = "Data/Phoneme_Sequencing/sourcedata"
+config_path = "BIDS_converter/config.json"
+
+
+@pytest.fixture
+def config():
+    with open(config_path, "r") as fst:
+        return json.load(fst)
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("D52_Session001_PhonemeSequencing_201213.ieeg.dat", "dat"),
+    ("D48 200906 Cogan_PhonemeSequence_Session1.edf", "edf"),
+    ("D48 200906 Cogan_PhonemeSequence_Session1.edf.tar.xz", "edf"),
+    ("D48_T1w.nii.gz", "nii"),
+    ("D52_trialInfo.mat", "mat"),
+    ("D52_elec_locations_RAS.txt", "txt"),
+    ("notes.docx", "other")
+])
+def test_file_type(name, expected):
+    assert file_type(name) == expected
+
+
+def test_inventory(config, tmp_path):
+    data_dir = tmp_path / "D52"
+    shutil.copytree(os.path.join(src_path, "D52"), data_dir)
+    inv = Inventory.build(str(tmp_path), config, ["BIDS", "stimuli"])
+
+    roots = dict(inv.walk())
+    assert list(roots) == [str(data_dir)]
+    assert sorted(roots[str(data_dir)]) == sorted(os.listdir(data_dir))
+    assert inv.find_a_match(str(data_dir), "partLabel") == "D52"
+    assert inv.file_type(str(data_dir), "D52_Trials.mat") == "mat"
+
+    # round trip through json and check freshness
+    inv_file = tmp_path / "inventory.json"
+    inv.to_json(inv_file)
+    loaded = Inventory.from_json(inv_file)
+    assert loaded.records == inv.records
+    assert loaded.is_current(config, ["BIDS", "stimuli"])
+
+    (data_dir / "D52_new.mat").write_bytes(b"")
+    assert not loaded.is_current(config, ["BIDS", "stimuli"])
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+
+from BIDS_converter.utils.jobqueue import JobQueue
+
+
+def expire(queue, name):
+    old = time.time() - 2 * queue.lease
+    os.utime(os.path.join(queue.directory, name + ".lease"), (old, old))
+
+
+def test_claim_finish(tmp_path):
+    queue = JobQueue(tmp_path / "queue")
+    assert queue.put("Task_D1", dict(sub="D1"))
+    assert queue.put("Task_D2", dict(sub="D2"))
+    assert not queue.put("Task_D1", dict(sub="other"))
+    # the job files are written aside and linked into place
+    assert sorted(os.listdir(queue.directory)) == ["Task_D1.job",
+                                                   "Task_D2.job"]
+    first, second = queue.claim("w1"), queue.claim("w2")
+    assert (first["name"], first["job"]) == ("Task_D1", dict(sub="D1"))
+    assert second["name"] == "Task_D2"
+    assert queue.claim("w3") is None
+    queue.finish(first, dict(status="ok"))
+    states = {s["name"]: s for s in queue.status()}
+    assert states["Task_D1"]["state"] == "done"
+    assert states["Task_D1"]["status"] == "ok"
+    assert states["Task_D1"]["wall"] >= 0
+    assert states["Task_D2"]["state"] == "running"
+    assert states["Task_D2"]["worker"] == "w2"
+    assert not os.path.exists(os.path.join(queue.directory,
+                                           "Task_D1.lease"))
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    queue = JobQueue(tmp_path / "queue", lease=60)
+    queue.put("Task_D1", dict(sub="D1"))
+    crashed = queue.claim("w1")
+    assert queue.claim("w2") is None
+    expire(queue, "Task_D1")
+    assert queue.status()[0]["state"] == "expired"
+    lease = queue.claim("w2")
+    assert lease["name"] == "Task_D1"
+    assert lease["attempt"] == 2
+    # the first worker finds out it lost the job
+    assert not queue.heartbeat(crashed)
+    assert queue.heartbeat(lease)
+    queue.finish(lease, dict(status="ok"))
+    state = queue.status()[0]
+    assert (state["state"], state["worker"], state["attempt"]) == (
+        "done", "w2", 2)
+    assert sorted(os.listdir(queue.directory)) == [
+        "Task_D1.done", "Task_D1.history", "Task_D1.job"]
+
+
+def test_heartbeat_keeps_lease(tmp_path):
+    queue = JobQueue(tmp_path / "queue", lease=0.5)
+    queue.put("Task_D1", dict(sub="D1"))
+    lease = queue.claim("w1")
+    with queue.held(lease, interval=0.05):
+        time.sleep(1)
+        assert queue.claim("w2") is None
+    assert queue.status()[0]["state"] == "running"
+
+
+def compete(queue, workers):
+    barrier = threading.Barrier(workers)
+    leases = []
+
+    def claim(i):
+        barrier.wait()
+        leases.append(queue.claim("w{}".format(i)))
+
+    threads = [threading.Thread(target=claim, args=(i,))
+               for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [lease for lease in leases if lease is not None]
+
+
+def test_workers_compete(tmp_path):
+    queue = JobQueue(tmp_path / "queue", lease=60)
+    queue.put("Task_D1", dict(sub="D1"))
+    for _ in range(20):
+        assert len(compete(queue, 2)) == 1
+        expire(queue, "Task_D1")
+    # an expired lease is taken over by one worker only
+    won = compete(queue, 8)
+    assert len(won) == 1
+    assert won[0]["attempt"] == 21
+    assert queue.status()[0]["worker"] == won[0]["worker"]
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+
+from BIDS_converter.utils.journal import Journal
+
+
+def test_journal(tmp_path):
+    out = tmp_path / "sub-D0001_run-01_ieeg.edf"
+    out.write_bytes(b"edf" * 10)
+
+    journal = Journal(tmp_path, "D0001")
+    journal.commit("split", str(out), [str(out)])
+    journal.commit("read", "rec.edf", nsamples=np.int64(5))
+    # a crash while appending leaves a torn last line
+    with open(journal.filename, "a") as fst:
+        fst.write('{"kind": "split", "key": "torn"')
+
+    journal = Journal(tmp_path, "D0001")
+    assert len(journal) == 2
+    assert journal.done("split", out)
+    assert journal.get("read", "rec.edf")["nsamples"] == 5
+    assert not journal.done("split", "torn")
+
+    # a truncated output is written again
+    out.write_bytes(b"edf")
+    assert not journal.done("split", out)
+
+    journal.clear()
+    assert not os.path.exists(tmp_path / ".journal")
+    assert not Journal(tmp_path, "D0001").done("read", "rec.edf")
@@ -0,0 +1,39 @@
+import os
+
+from BIDS_converter.utils.manifest import Manifest, config_id
+
+config = {"ieeg": {"type": "SEEG", "digital": True}, "anat": {}}
+
+
+def test_manifest(tmp_path):
+    bids = tmp_path / "BIDS"
+    src = tmp_path / "D1_trialInfo.mat"
+    out = bids / "sub-D0001" / "sub-D0001_events.tsv"
+    os.makedirs(out.parent)
+    src.write_bytes(b"trials" * 100)
+    out.write_text("onset\n")
+    sources = {"D1_trialInfo.mat": str(src)}
+    ieeg = config_id(config, "ieeg")
+
+    manifest = Manifest(bids, "D0001")
+    assert not manifest.is_current("rec", sources, ieeg)
+    manifest.update("rec", sources, ieeg, [str(out)])
+    manifest.save()
+
+    manifest = Manifest(bids, "D0001")
+    assert manifest.is_current("rec", sources, ieeg)
+    assert manifest.outputs("rec") == [str(out)]
+
+    # a new mtime with the same content is still current
+    os.utime(src, (0, 0))
+    assert manifest.is_current("rec", sources, ieeg)
+    # as is a type filled in from the workbook, but not other config changes
+    assert config_id(dict(config, ieeg={"digital": True}), "ieeg") == ieeg
+    assert not manifest.is_current("rec", sources, config_id(
+        dict(config, ieeg={"digital": False}), "ieeg"))
+
+    src.write_bytes(b"trials" * 99 + b"change")
+    assert not manifest.is_current("rec", sources, ieeg)
+    src.write_bytes(b"trials" * 100)
+    os.remove(out)
+    assert not manifest.is_current("rec", sources, ieeg)
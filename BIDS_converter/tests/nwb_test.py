@@ -0,0 +1,85 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyedflib
+import pytest
+
+from BIDS_converter import synthetic
+from BIDS_converter.data2bids import Data2Bids
+from BIDS_converter.utils import edf, nwb
+
+h5py = pytest.importorskip("h5py")
+
+
+def test_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    headers = pyedflib.highlevel.make_signal_headers(
+        ["A1", "A2", "Trigger"], sample_frequency=100, physical_min=-100,
+        physical_max=300)
+    array = rng.normal(size=(3, 1050)).astype(np.float32)
+    electrodes = pd.DataFrame(dict(name=["A2", "A1"], x=[1., 2.], y=[3., 4.],
+                                   z=[5., 6.], hemisphere=["L", "R"]))
+    events = pd.DataFrame(dict(onset=[2., 3.], duration=[0.5, 0.],
+                               trial_type=["Audio", "Go"],
+                               stim_file=["a.wav", np.nan],
+                               sample=[1200, 1300]))
+    filename = str(tmp_path / "sub-01_ieeg.nwb")
+
+    files = nwb.write_nwb(filename, edf.array_blocks(array, 400), headers,
+                          100, 1050, electrodes, events, start=1000,
+                          chunk_channels=2)
+    assert files == [filename] and os.listdir(tmp_path) == [
+        "sub-01_ieeg.nwb"]
+    assert nwb.read_header(filename) == dict(
+        channels=["A1", "A2", "Trigger"], sample_rate=100, n_samples=1050)
+    with h5py.File(filename, "r") as h5:
+        data = h5["acquisition/ElectricalSeries/data"]
+        assert data.chunks == (100, 2) and data.compression == "gzip"
+        np.testing.assert_array_equal(data[()], array.T)
+        table = h5["general/extracellular_ephys/electrodes"]
+        np.testing.assert_array_equal(table["x"][()], [2., 1., np.nan])
+        assert [v.decode() for v in table["location"][()]] == [
+            "R", "L", "n/a"]
+        intervals = h5["intervals/events"]
+        np.testing.assert_allclose(intervals["start_time"][()], [2., 3.])
+        np.testing.assert_allclose(intervals["stop_time"][()], [2.5, 3.])
+        assert [v.decode() for v in intervals["stim_file"][()]] == [
+            "a.wav", "n/a"]
+
+    with pytest.raises(ValueError):
+        nwb.write_nwb(filename, edf.array_blocks(array, 400), headers, 100,
+                      1000)
+
+
+def test_convert(tmp_path):
+    dataset = synthetic.make_dataset(str(tmp_path / "data"), n_channels=4,
+                                     hours=0.01, sample_rate=256, n_blocks=2)
+    outputs = {}
+    for ieeg_format in ("edf", "nwb"):
+        out = tmp_path / ieeg_format
+        os.makedirs(out)
+        Data2Bids(input_dir=dataset["subjects"]["D1"],
+                  config=dataset["config"], stim_dir=dataset["stim_dir"],
+                  output_dir=str(out), ieeg_format=ieeg_format).run()
+        outputs[ieeg_format] = str(out / "BIDS" / "sub-D0001" / "ieeg" /
+                                   "sub-D0001_task-PhonemeSequence_acq-01_"
+                                   "run-02_")
+
+    base = outputs["nwb"]
+    assert not os.path.exists(base + "ieeg.edf")
+    with h5py.File(base + "ieeg.nwb", "r") as h5:
+        data = h5["acquisition/ElectricalSeries/data"][()].T
+        onsets = h5["intervals/events/start_time"][()]
+    signals = pyedflib.highlevel.read_edf(outputs["edf"] + "ieeg.edf")[0]
+    # EDF pads the last data record to a whole second
+    np.testing.assert_allclose(data, signals[:, :data.shape[1]], atol=1e-3)
+
+    events = pd.read_csv(base + "events.tsv", sep="\t")
+    np.testing.assert_allclose(onsets, events["sample"] / 256)
+
+    with open(base + "ieeg.json", "r") as fst:
+        sidecar = json.load(fst)
+    assert sidecar["ECOGChannelCount"] == 4
+    assert sidecar["RecordingDuration"] == data.shape[1] / 256
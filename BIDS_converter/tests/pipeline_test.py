@@ -0,0 +1,170 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from BIDS_converter import synthetic
+from BIDS_converter.data2bids import Data2Bids
+from BIDS_converter.utils import brainvision as bv
+from BIDS_converter.utils import pipeline as pl
+from BIDS_converter.utils.pipeline import (SharedArray, attach, pipeline,
+                                           prefetch)
+
+
+def slow(seconds):
+    def stage(x):
+        time.sleep(seconds * np.random.default_rng(x).uniform(0.5, 1.5))
+        return x
+    return stage
+
+
+@pytest.mark.parametrize("threaded", [True, False])
+def test_order(threaded):
+    results = pipeline(range(20), (slow(0.01), lambda x: x * 2),
+                       workers=(4, 1), threaded=threaded)
+    assert list(results) == [2 * x for x in range(20)]
+    assert list(prefetch(iter("abc"))) == ["a", "b", "c"]
+
+
+def test_overlap():
+    # sleeping stages release the GIL like blocking reads and writes do
+    times = {}
+    for threaded in (False, True):
+        start = time.perf_counter()
+        list(pipeline((slow(0.03)(x) for x in range(8)),
+                      (slow(0.03), slow(0.03)), threaded=threaded))
+        times[threaded] = time.perf_counter() - start
+    assert times[True] < 0.75 * times[False]
+
+
+def test_backpressure():
+    read = []
+
+    def items():
+        for x in range(100):
+            read.append(x)
+            yield x
+
+    results = pipeline(items(), (slow(0.01),), maxsize=2)
+    assert next(results) == 0
+    time.sleep(0.2)
+    # two queues of two, one item in the stage and one in the reader
+    assert len(read) <= 7
+    results.close()
+
+
+def test_errors():
+    threads = threading.active_count()
+
+    def fail(x):
+        if x == 3:
+            raise KeyError(x)
+        return x
+
+    results = pipeline(range(10), (fail, slow(0.001)), workers=(2, 1))
+    assert [next(results) for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(KeyError):
+        next(results)
+
+    def broken():
+        yield 1
+        raise OSError("read failed")
+
+    with pytest.raises(OSError):
+        list(pipeline(broken(), (slow(0.001),)))
+    results = pipeline(range(1000), (slow(0.001),))
+    next(results)
+    results.close()
+    assert threading.active_count() == threads
+    with pytest.raises(ValueError):
+        list(pipeline(range(3), (slow(0.001),), workers=(1, 1)))
+
+
+def test_shared_array():
+    with SharedArray((3, 4), np.int32) as buffer:
+        buffer.array[:] = np.arange(12).reshape(3, 4)
+        shared = attach(buffer.handle)
+        np.testing.assert_array_equal(shared[:, 1:3], [[1, 2], [5, 6],
+                                                       [9, 10]])
+        assert not shared.flags.writeable
+        del shared
+    assert not os.path.exists(buffer.filename)
+
+
+def test_shared_fallback(tmp_path, monkeypatch):
+    # without room in shared memory the array goes to the temporary folder
+    monkeypatch.setattr(pl, "SHARED_DIR", str(tmp_path / "missing"))
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    with SharedArray((2, 1000), np.float64) as buffer:
+        assert os.path.dirname(buffer.filename) == str(tmp_path)
+        assert os.path.getsize(buffer.filename) == 16000
+
+
+def test_shared_killed(tmp_path, monkeypatch):
+    # the array of a killed process is removed with the next one created
+    proc = subprocess.Popen([sys.executable, "-c", """
+import sys, time
+from BIDS_converter.utils import pipeline as pl
+pl.SHARED_DIR = sys.argv[1]
+buffer = pl.SharedArray((10,), "f8")
+print(buffer.filename, flush=True)
+time.sleep(60)""", str(tmp_path)], cwd=Path(__file__).resolve().parents[2],
+                            stdout=subprocess.PIPE, text=True)
+    killed = proc.stdout.readline().strip()
+    proc.kill()
+    proc.wait()
+    proc.stdout.close()
+    assert os.path.basename(killed).startswith(
+        "data2bids-{}-".format(proc.pid))
+    other = tmp_path / "data2bids-{}-x.dat".format(os.getpid())
+    other.touch()
+
+    monkeypatch.setattr(pl, "SHARED_DIR", str(tmp_path))
+    with SharedArray((10,), np.float64) as buffer:
+        assert not os.path.exists(killed)
+        # the arrays of running processes stay
+        assert other.exists()
+        assert os.path.exists(buffer.filename)
+
+
+def read_split(ieeg, ieeg_format):
+    if ieeg_format == "brainvision":
+        return {f: bv.read_brainvision(str(ieeg / f)) for f in
+                sorted(os.listdir(ieeg)) if f.endswith(".vhdr")}
+    split = {}
+    for f in sorted(os.listdir(ieeg)):
+        if f.endswith(".edf"):
+            with open(ieeg / f, "rb") as fst:
+                data = fst.read()
+            # pyedflib stamps the time of writing as the start time
+            split[f] = data[:168] + data[184:]
+    return split
+
+
+@pytest.mark.parametrize("ieeg_format", ["brainvision", "edf"])
+def test_convert(tmp_path, ieeg_format):
+    dataset = synthetic.make_dataset(str(tmp_path / "data"), n_channels=4,
+                                     hours=0.01, sample_rate=256, n_blocks=2)
+    data = {}
+    # with several jobs the runs are written by processes that map the
+    # recording from shared memory
+    for n_jobs in (1, 2, 4):
+        out = tmp_path / str(n_jobs)
+        os.makedirs(out)
+        Data2Bids(input_dir=dataset["subjects"]["D1"],
+                  config=dataset["config"], stim_dir=dataset["stim_dir"],
+                  output_dir=str(out), ieeg_format=ieeg_format,
+                  n_jobs=n_jobs).run()
+        data[n_jobs] = read_split(out / "BIDS" / "sub-D0001" / "ieeg",
+                                  ieeg_format)
+    assert len(data[1]) == 2
+    for n_jobs in (2, 4):
+        assert list(data[n_jobs]) == list(data[1])
+        for name, array in data[1].items():
+            np.testing.assert_array_equal(data[n_jobs][name], array)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from BIDS_converter.utils import utils as ut
+from BIDS_converter.utils.slicetiming import slice_times
+
+
+def reference(TR, n_slices, scheme, delay):
+    # acquisition positions stepped through one at a time like get_params
+    if scheme == "odd-interleaved":
+        positions = list(range(1, n_slices + 1, 2)) + list(
+            range(2, n_slices + 1, 2))
+    elif scheme == "even-interleaved":
+        positions = list(range(2, n_slices + 1, 2)) + list(
+            range(1, n_slices + 1, 2))
+    else:
+        positions = list(range(1, n_slices + 1))
+    timings = [None] * n_slices
+    for instance, position in enumerate(positions):
+        timings[position - 1] = ut.slice_time_calc(TR, instance, n_slices,
+                                                   delay)
+    return timings
+
+
+@pytest.mark.parametrize("scheme", ["sequential", "non-interleaved",
+                                    "odd-interleaved", "even-interleaved"])
+@pytest.mark.parametrize("n_slices", [1, 2, 35, 36])
+def test_matches_slice_time_calc(scheme, n_slices):
+    np.testing.assert_allclose(slice_times(2., n_slices, scheme, delay=.03),
+                               reference(2., n_slices, scheme, .03))
+
+
+def test_multiband():
+    times = slice_times(1., 8, "odd-interleaved", multiband=2)
+    np.testing.assert_allclose(times, [0, .5, .25, .75] * 2)
+    times = slice_times(.8, 576, "even-interleaved", multiband=8)
+    assert len(np.unique(times)) == 72
+    with pytest.raises(ValueError):
+        slice_times(1., 10, multiband=4)
+    with pytest.raises(ValueError):
+        slice_times(1., 10, "descending")
@@ -0,0 +1,107 @@
+import json
+import os
+
+import pytest
+
+from BIDS_converter import stage
+from BIDS_converter.utils import fileutils as fls
+from BIDS_converter.utils.inventory import Inventory
+
+CONFIG = os.path.join(os.path.dirname(stage.__file__), "config.json")
+
+
+@pytest.fixture
+def share(tmp_path):
+    top = tmp_path / "Box" / "CoganLab"
+    files = ["D_Data/Task/D1/D1 200101 COGAN_TASK.edf",
+             "D_Data/Task/D1/D1 200102 COGAN_TASK.edf.tar.xz",
+             "D_Data/Task/D1/experiment.mat",
+             "D_Data/Task/D1/mat/trialInfo.mat",
+             "D_Data/Task/D1/mat/Trials.mat",
+             "D_Data/Task/D1/notes.mat",
+             "ECoG_Recon_Full/D1/elec_recon/T1.nii.gz",
+             "../ECoG_Recon/D1/elec_recon/D1_elec_locations_RAS.txt",
+             "task_stimuli/task/aa.wav"]
+    for f in files:
+        path = top / f
+        os.makedirs(path.parent, exist_ok=True)
+        path.write_text(f)
+    return top
+
+
+def test_plan(share):
+    planned = stage.plan("D1", "Task", str(share))
+    assert sorted(planned) == [
+        "D1 200101 COGAN_TASK.edf", "D1 200102 COGAN_TASK.edf.tar.xz",
+        "D1_CT.nii.gz", "D1_T1w.nii.gz",
+        "D1_Trials.mat", "D1_elec_locations_RAS.txt", "D1_experiment.mat",
+        "D1_trialInfo.mat"]
+    assert stage.plan_stimuli("Task", str(share)) == {
+        "aa.wav": str(share / "task_stimuli" / "task" / "aa.wav")}
+
+
+@pytest.mark.parametrize("modes", [["hardlink"], ["symlink"], ["copy"]])
+def test_stage(share, tmp_path, modes):
+    out = tmp_path / "out"
+    result = stage.stage("D1", "Task", str(share), str(out), CONFIG,
+                         modes=modes, stimuli=True, n_jobs=2)
+    assert set(result["files"].values()) == set(modes)
+    edf = out / "D1" / "D1 200101 COGAN_TASK.edf"
+    assert edf.read_text() == "D_Data/Task/D1/D1 200101 COGAN_TASK.edf"
+    assert (out / "stimuli" / "aa.wav").exists()
+
+    with open(CONFIG) as fst:
+        config = json.load(fst)
+    inv = Inventory.from_json(result["inventory"])
+    assert inv.is_current(config, ["BIDS", "stimuli"])
+    assert sorted(name for _, names in inv.walk() for name in names) == \
+        sorted(os.listdir(out / "D1"))
+
+
+def test_link_file_falls_back(tmp_path):
+    src = tmp_path / "src.edf"
+    src.write_text("edf")
+    dst = tmp_path / "dst.edf"
+    assert fls.link_file(src, dst, ("reflink", "copy")) in ("reflink",
+                                                            "copy")
+    assert dst.read_text() == "edf"
+    with pytest.raises(OSError):
+        fls.link_file(tmp_path / "missing.edf", dst)
+
+
+def test_sync_dir(tmp_path):
+    stim = tmp_path / "stimuli"
+    os.makedirs(stim)
+    (stim / "aa.wav").write_bytes(b"aa" * 100)
+    (stim / "bb.wav").write_bytes(b"bb" * 100)
+    store = tmp_path / "store"
+    task1, task2 = tmp_path / "task1", tmp_path / "task2"
+
+    assert set(fls.sync_dir(stim, task1, store).values()) == {"hardlink"}
+    assert set(fls.sync_dir(stim, task2, store).values()) == {"hardlink"}
+    assert set(fls.sync_dir(stim, task1, store).values()) == {"skipped"}
+    # shared stimuli are stored once
+    assert os.stat(task1 / "aa.wav").st_ino == \
+        os.stat(task2 / "aa.wav").st_ino
+    assert sum(len(files) for _, _, files in os.walk(store)) == 2
+
+    # the same stimulus from another source with another mtime is linked
+    # to the same object without changing its mtime
+    other = tmp_path / "other"
+    os.makedirs(other)
+    (other / "aa.wav").write_bytes(b"aa" * 100)
+    os.utime(other / "aa.wav", (1, 1))
+    mtime = os.stat(task1 / "aa.wav").st_mtime_ns
+    assert fls.sync_dir(other, tmp_path / "task3", store) == {
+        "aa.wav": "hardlink"}
+    assert fls.sync_dir(other, tmp_path / "task3", store) == {
+        "aa.wav": "skipped"}
+    assert os.stat(task1 / "aa.wav").st_mtime_ns == mtime
+    assert set(fls.sync_dir(stim, task1, store).values()) == {"skipped"}
+
+    os.utime(stim / "aa.wav", (0, 0))
+    assert fls.sync_dir(stim, task1, check_hash=True)["aa.wav"] == "skipped"
+    (stim / "aa.wav").write_bytes(b"ab" * 100)
+    assert fls.sync_dir(stim, task1)["aa.wav"] != "skipped"
+    assert (task1 / "aa.wav").read_bytes() == b"ab" * 100
+    assert (task2 / "aa.wav").read_bytes() == b"aa" * 100
@@ -0,0 +1,179 @@
+import glob
+import json
+import os
+import time
+
+import pyedflib
+import pytest
+
+from BIDS_converter import data2bids, synthetic
+from BIDS_converter.data2bids import Data2Bids
+
+
+def test_recording_size():
+    assert synthetic.recording_size(10, 1, 1000) == 3600000 * 11 * 2
+    assert synthetic.recording_size(10, 1, 1000, "dat") == 3600000 * 11 * 4
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+@pytest.mark.parametrize("fmt", ["edf", "dat"])
+def test_convert(tmp_path, fmt, n_jobs):
+    dataset = synthetic.make_dataset(
+        str(tmp_path / "data"), n_sessions=2, n_channels=4, hours=0.01,
+        sample_rate=256, fmt=fmt, n_blocks=2)
+    assert dataset["bytes"] >= 2 * synthetic.recording_size(4, 0.01, 256,
+                                                            fmt)
+    os.makedirs(tmp_path / "out")
+    Data2Bids(input_dir=dataset["subjects"]["D1"],
+              config=dataset["config"], stim_dir=dataset["stim_dir"],
+              output_dir=str(tmp_path / "out"), n_jobs=n_jobs,
+              profile=str(tmp_path / "profile.json")).run()
+
+    ieeg = str(tmp_path / "out" / "BIDS" / "sub-D0001" / "ieeg")
+    for acq in ("01", "02"):
+        for run in ("01", "02"):
+            name = "sub-D0001_task-PhonemeSequence_acq-{}_run-{}_".format(
+                acq, run)
+            assert os.path.isfile(os.path.join(ieeg, name + "ieeg.edf"))
+            assert os.path.isfile(os.path.join(ieeg, name + "events.tsv"))
+    assert len(glob.glob(os.path.join(ieeg, "*_electrodes.tsv"))) == 1
+
+    # each session is read in its own process with two jobs, the stages
+    # profiled there are reported with the others
+    with open(tmp_path / "profile.json", "r") as fst:
+        totals = json.load(fst)["totals"]
+    assert totals["read_edf"]["count"] == 2
+    assert totals["split"]["count"] == 2
+    if fmt == "dat":
+        # the intermediate EDFs of the binary recordings are removed
+        assert not glob.glob(os.path.join(dataset["subjects"]["D1"],
+                                          "*.edf"))
+
+
+def test_out_of_range_samples(tmp_path):
+    dataset = synthetic.make_dataset(
+        str(tmp_path / "data"), n_channels=4, hours=0.01, sample_rate=256,
+        n_blocks=2)
+    with open(dataset["config"], "r") as fst:
+        config = json.load(fst)
+    config["ieeg"]["digital"] = False
+    with open(dataset["config"], "w") as fst:
+        json.dump(config, fst)
+    # narrow the digital range of the channels, not of the trigger, so
+    # that most samples scale to physical values past the header range
+    recording, = glob.glob(os.path.join(dataset["subjects"]["D1"], "*.edf"))
+    with open(recording, "r+b") as fst:
+        n_signals = int(fst.read(256)[252:256])
+        for field, value in ((3, "-1000"), (4, "1000")):
+            for i in range(4):
+                fst.seek(256 + n_signals * (16 + 80 + 8 * field) + 8 * i)
+                fst.write(value.ljust(8).encode())
+    assert abs(pyedflib.highlevel.read_edf(recording, ch_nrs=[0])[0]).max() \
+        > synthetic.PHYSICAL_MAX
+
+    os.makedirs(tmp_path / "out")
+    Data2Bids(input_dir=dataset["subjects"]["D1"],
+              config=dataset["config"], stim_dir=dataset["stim_dir"],
+              output_dir=str(tmp_path / "out")).run()
+    runs = glob.glob(str(tmp_path / "out" / "BIDS" / "sub-D0001" / "ieeg" /
+                         "*_ieeg.edf"))
+    assert len(runs) == 2
+    for run in runs:
+        signals = pyedflib.highlevel.read_edf(run)[0]
+        assert abs(signals[:4]).max() <= synthetic.PHYSICAL_MAX
+
+
+def mtimes(directory):
+    return {os.path.relpath(os.path.join(root, f), directory):
+            os.stat(os.path.join(root, f)).st_mtime_ns
+            for root, _, files in os.walk(directory) for f in files}
+
+
+def test_incremental_rerun(tmp_path):
+    dataset = synthetic.make_dataset(
+        str(tmp_path / "data"), n_sessions=2, n_channels=4, hours=0.01,
+        sample_rate=256, n_blocks=2)
+    kwargs = dict(input_dir=dataset["subjects"]["D1"],
+                  config=dataset["config"], stim_dir=dataset["stim_dir"],
+                  output_dir=str(tmp_path / "out"))
+    bids = str(tmp_path / "out" / "BIDS")
+    os.makedirs(tmp_path / "out")
+    Data2Bids(**kwargs).run()
+    first = mtimes(bids)
+
+    # nothing changed, nothing is written
+    time.sleep(0.05)
+    Data2Bids(**kwargs).run()
+    assert mtimes(bids) == first
+
+    # a changed sample of the second session only redoes its runs
+    recording, = glob.glob(os.path.join(dataset["subjects"]["D1"],
+                                        "*_Session2.edf"))
+    with open(recording, "r+b") as fst:
+        # the first sample of the first signal follows the header
+        fst.seek(184)
+        fst.seek(int(fst.read(8)))
+        value = fst.read(1)
+        fst.seek(-1, os.SEEK_CUR)
+        fst.write(bytes([value[0] ^ 1]))
+    time.sleep(0.05)
+    Data2Bids(**kwargs).run()
+    second = mtimes(bids)
+    assert set(second) == set(first)
+    runs = {f for f in first if f.endswith(("_ieeg.edf", "_events.tsv",
+                                            "_ieeg.json"))}
+    changed = {f for f in runs if second[f] != first[f]}
+    # runs of the session whose content is the same are left alone too
+    assert all("_acq-02_" in f for f in changed)
+    assert any(f.endswith("_ieeg.edf") for f in changed)
+
+
+def read_outputs(directory):
+    outputs = {}
+    for root, dirs, files in os.walk(directory):
+        # the manifest and journal are bookkeeping, not outputs
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for f in files:
+            if f.startswith("."):
+                continue
+            with open(os.path.join(root, f), "rb") as fst:
+                data = fst.read()
+            if f.endswith(".edf"):
+                # pyedflib stamps the time of writing as the start time
+                data = data[:168] + data[184:]
+            outputs[os.path.relpath(os.path.join(root, f), directory)] = data
+    return outputs
+
+
+def test_resume(tmp_path, monkeypatch):
+    dataset = synthetic.make_dataset(
+        str(tmp_path / "data"), n_sessions=2, n_channels=4, hours=0.01,
+        sample_rate=256, fmt="dat", n_blocks=2)
+    kwargs = dict(input_dir=dataset["subjects"]["D1"],
+                  config=dataset["config"], stim_dir=dataset["stim_dir"],
+                  n_jobs=1)
+    for out in ("clean", "resumed"):
+        os.makedirs(tmp_path / out)
+    Data2Bids(output_dir=str(tmp_path / "clean"), **kwargs).run()
+
+    # crash after the first session is converted, then resume
+    write_section = data2bids.write_section
+    calls = []
+
+    def crash(*args, **kw):
+        calls.append(args[0])
+        if len(calls) == 4:
+            raise RuntimeError("crash")
+        return write_section(*args, **kw)
+
+    monkeypatch.setattr(data2bids, "write_section", crash)
+    with pytest.raises(RuntimeError, match="crash"):
+        Data2Bids(output_dir=str(tmp_path / "resumed"), **kwargs).run()
+    monkeypatch.setattr(data2bids, "write_section", write_section)
+    Data2Bids(output_dir=str(tmp_path / "resumed"), **kwargs).run()
+
+    assert read_outputs(tmp_path / "resumed" / "BIDS") == read_outputs(
+        tmp_path / "clean" / "BIDS")
+    # the intermediate EDFs of the sessions converted before the crash are
+    # removed as well
+    assert not glob.glob(os.path.join(dataset["subjects"]["D1"], "*.edf"))
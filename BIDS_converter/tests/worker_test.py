@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+import time
+
+from BIDS_converter import worker
+from BIDS_converter.utils.jobqueue import JobQueue, QUEUE_DIR
+
+SUBJECTS = ["D{}".format(i) for i in range(1, 7)]
+
+
+def test_workers_share_queue(tmp_path):
+    # none of the subjects exist, so every job fails fast
+    out = tmp_path / "out"
+    queue = JobQueue(out / QUEUE_DIR)
+    # a worker that crashed while converting D3
+    queue.put("Task_D3", dict(sub="D3", task="Task", kwargs=dict(
+        input_dir=str(tmp_path / "in" / "Task" / "D3"),
+        output_dir=str(out / "Task"))))
+    queue.claim("crashed")
+    old = time.time() - 2 * queue.lease
+    os.utime(out / QUEUE_DIR / "Task_D3.lease", (old, old))
+
+    argv = [sys.executable, worker.__file__, "-s"] + SUBJECTS + [
+        "-t", "Task", "-i", str(tmp_path / "in"), "-o", str(out),
+        "--poll", "0.1"]
+    workers = [subprocess.Popen(argv, stdout=subprocess.PIPE, text=True)
+               for _ in range(2)]
+    outputs = [w.communicate(timeout=300)[0] for w in workers]
+    assert [w.returncode for w in workers] == [0, 0]
+
+    # every job was converted by exactly one of the workers
+    converted = [line.split()[2] for output in outputs
+                 for line in output.splitlines() if ", attempt " in line]
+    assert sorted(converted) == SUBJECTS
+    states = {s["name"]: s for s in queue.status()}
+    assert sorted(states) == ["Task_" + sub for sub in SUBJECTS]
+    assert all(s["state"] == "done" and s["status"] == "failed"
+               and s["wall"] >= 0 for s in states.values())
+    assert states["Task_D3"]["attempt"] == 2
+    assert states["Task_D1"]["attempt"] == 1
+
+    # a later worker finds nothing left to do
+    report = worker.main(["-s", "D1", "-t", "Task", "-i",
+                          str(tmp_path / "in"), "-o", str(out)])
+    assert (report["jobs"], report["done"], report["failed"]) == (6, 6, 6)
+    assert worker.main(["-o", str(out), "--status"])["done"] == 6
+
+
+def test_unreadable_job(tmp_path):
+    queue = JobQueue(tmp_path / QUEUE_DIR, lease=60)
+    job = tmp_path / QUEUE_DIR / "Task_D1.job"
+    job.touch()
+    # left alone while it may still be written
+    assert queue.claim("w1") is None
+    old = time.time() - 2 * queue.lease
+    os.utime(job, (old, old))
+    result, = worker.work(queue, "w1", poll=0.01)
+    assert (result["task"], result["sub"], result["status"]) == (
+        "Task", "D1", "failed")
+    state, = queue.status()
+    assert (state["state"], state["status"]) == ("done", "failed")
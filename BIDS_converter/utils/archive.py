@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import bz2
+import contextlib
+import gzip
+import lzma
+import shutil
+import subprocess
+import tarfile
+from typing import BinaryIO, Iterator, Tuple
+
+from .utils import PathLike
+
+# longest suffixes first so that ".tar.xz" wins over ".tar"
+ARCHIVE_EXTENSIONS = (".tar.xz", ".txz", ".tar.gz", ".tgz", ".tar.bz2",
+                      ".tar")
+# bytes read from the decompressor at a time
+CHUNK = 1 << 20
+
+
+def is_archive(filename: PathLike) -> bool:
+    """whether filename is a tar archive, compressed or not"""
+    return str(filename).lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def strip_archive(filename: PathLike) -> str:
+    """filename without its archive extension, a.edf.tar.xz becomes a.edf"""
+    filename = str(filename)
+    for ext in ARCHIVE_EXTENSIONS:
+        if filename.lower().endswith(ext):
+            return filename[:-len(ext)]
+    return filename
+
+
+@contextlib.contextmanager
+def decompressed(filename: PathLike, threads: int = 0, drain: bool = True
+                 ) -> Iterator[BinaryIO]:
+    """the decompressed bytes of an archive, as a stream
+
+    .xz archives are decompressed by the xz command when it is installed,
+    which uses several threads for files compressed in blocks by xz -T
+    (xz 5.4 and later) and runs alongside the reader in any case. Other
+    archives, or .xz ones without the command, are decompressed in this
+    process. The stream is read to the end on exit so that a corrupt
+    archive raises an error even if the caller stopped early.
+
+    :param filename: tar archive
+    :type filename: PathLike
+    :param threads: xz threads, 0 for one per core
+    :type threads: int
+    :param drain: whether to read the rest of the stream on exit, False to
+        stop decompressing once the caller read what it needed
+    :type drain: bool
+    """
+    name = str(filename).lower()
+    if name.endswith((".tar.xz", ".txz")) and shutil.which("xz"):
+        proc = subprocess.Popen(
+            ["xz", "--decompress", "--stdout", "--threads={}".format(threads),
+             "--", str(filename)], stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, bufsize=CHUNK)
+        try:
+            yield proc.stdout
+            if not drain:
+                proc.kill()
+                return
+            while proc.stdout.read(CHUNK):
+                pass
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            error = proc.stderr.read()
+            proc.stderr.close()
+            proc.wait()
+        if proc.returncode:
+            raise OSError("xz could not decompress {}: {}".format(
+                filename, error.decode(errors="replace").strip()))
+        return
+    if name.endswith((".tar.xz", ".txz")):
+        stream = lzma.open(filename, "rb")
+    elif name.endswith((".tar.gz", ".tgz")):
+        stream = gzip.open(filename, "rb")
+    elif name.endswith(".tar.bz2"):
+        stream = bz2.open(filename, "rb")
+    else:
+        stream = open(filename, "rb")
+    with stream:
+        yield stream
+        while drain and stream.read(CHUNK):
+            pass
+
+
+@contextlib.contextmanager
+def open_member(filename: PathLike, suffixes: Tuple[str, ...] = None,
+                threads: int = 0, drain: bool = True
+                ) -> Iterator[Tuple[tarfile.TarInfo, BinaryIO]]:
+    """the first file of an archive ending with one of suffixes
+
+    The member is read straight out of the decompressor, front to back,
+    without extracting it to disk, so it can only be read once.
+
+    :param filename: tar archive
+    :type filename: PathLike
+    :param suffixes: extensions of the member, any file by default
+    :type suffixes: tuple
+    :param threads: xz threads, 0 for one per core
+    :type threads: int
+    :param drain: whether to decompress the rest of the archive on exit
+    :type drain: bool
+    :return: the member's header and file object
+    :rtype: Iterator[Tuple[tarfile.TarInfo, BinaryIO]]
+    """
+    with decompressed(filename, threads, drain) as stream, tarfile.open(
+            fileobj=stream, mode="r|") as tar:
+        for info in tar:
+            if info.isfile() and (suffixes is None or
+                                  info.name.lower().endswith(suffixes)):
+                yield info, tar.extractfile(info)
+                return
+    raise FileNotFoundError("{} holds no {} file".format(
+        filename, " or ".join(suffixes or ())))
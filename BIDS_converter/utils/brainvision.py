@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import os.path as op
+import re
+from typing import Dict, List
+
+from .edf import to_physical
+from .fileutils import atomic_path
+from .utils import PathLike, lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# extension of each file of a recording, the header comes first
+EXTENSIONS = (".vhdr", ".vmrk", ".eeg")
+
+HEADER = """Brain Vision Data Exchange Header File Version 1.0
+; Data written by data2bids
+
+[Common Infos]
+Codepage=UTF-8
+DataFile={data}
+MarkerFile={markers}
+DataFormat=BINARY
+DataOrientation=VECTORIZED
+NumberOfChannels={n_channels}
+; Sampling interval in microseconds
+SamplingInterval={interval}
+
+[Binary Infos]
+BinaryFormat=IEEE_FLOAT_32
+
+[Channel Infos]
+; Each entry: Ch<Channel number>=<Name>,<Reference channel name>,
+; <Resolution in "Unit">,<Unit>
+"""
+
+MARKERS = """Brain Vision Data Exchange Marker File, Version 1.0
+
+[Common Infos]
+Codepage=UTF-8
+DataFile={data}
+
+[Marker Infos]
+; Each entry: Mk<Marker number>=<Type>,<Description>,<Position in data
+; points>,<Size in data points>,<Channel number (0 = marker is related to
+; all channels)>
+Mk1=New Segment,,1,1,0
+"""
+
+
+def _escape(text) -> str:
+    # commas separate the fields of an entry
+    return str(text).replace(",", r"\1")
+
+
+def brainvision_names(filename: PathLike) -> List[str]:
+    """the .vhdr, .vmrk and .eeg paths of a recording
+
+    :param filename: any of the three files, or the name without extension
+    :type filename: PathLike
+    """
+    base = re.sub(r"\.(vhdr|vmrk|eeg|edf)$", "", str(filename))
+    return [base + ext for ext in EXTENSIONS]
+
+
+def events_to_markers(events: pd.DataFrame, start: int = 0,
+                      sample_rate: float = None) -> List[tuple]:
+    """(description, position, size) of every event with a sample
+
+    :param events: events.tsv rows with sample, duration and trial_type
+    :type events: pd.DataFrame
+    :param start: sample of the recording the data begins at
+    :type start: int
+    :param sample_rate: samples per second, converts the durations
+    :type sample_rate: float
+    """
+    markers = []
+    for _, row in events.iterrows():
+        sample = pd.to_numeric(row.get("sample"), errors="coerce")
+        if pd.isna(sample):
+            continue
+        size = 1
+        duration = pd.to_numeric(row.get("duration"), errors="coerce")
+        if sample_rate and not pd.isna(duration):
+            size = max(int(round(duration * sample_rate)), 1)
+        description = row.get("trial_type", "")
+        markers.append(("" if pd.isna(description) else description,
+                        int(sample) - start + 1, size))
+    return markers
+
+
+def write_brainvision(filename: PathLike, array: np.ndarray,
+                      signal_headers: List[dict], sample_rate: float,
+                      markers: List[tuple] = (), digital: bool = False
+                      ) -> List[str]:
+    """writes a recording as BrainVision .vhdr, .vmrk and .eeg files
+
+    The payload is little endian float32 in VECTORIZED orientation, one
+    channel after the other, so every channel row is written with a single
+    tofile and no interleaving copy. Physical values are kept as they are
+    instead of being quantized to 16 bits. Each file is written atomically.
+
+    :param filename: any of the three files, or the name without extension
+    :type filename: PathLike
+    :param array: channels by samples
+    :type array: np.ndarray
+    :param signal_headers: pyedflib signal headers of the channels
+    :type signal_headers: list
+    :param sample_rate: samples per second
+    :type sample_rate: float
+    :param markers: (description, 1 based position, size) of each event
+    :type markers: list
+    :param digital: whether array holds EDF digital values, which are
+        scaled to physical values with the signal headers
+    :type digital: bool
+    :return: the .vhdr, .vmrk and .eeg paths
+    :rtype: list
+    """
+    vhdr, vmrk, eeg = brainvision_names(filename)
+    with atomic_path(eeg) as tmp, open(tmp, "wb") as fst:
+        for row, header in zip(array, signal_headers):
+            if digital:
+                row = to_physical(row[np.newaxis], [header])[0]
+            np.asarray(row, dtype="<f4").tofile(fst)
+
+    lines = [HEADER.format(data=op.basename(eeg), markers=op.basename(vmrk),
+                           n_channels=len(signal_headers),
+                           interval=1e6 / sample_rate)]
+    for i, header in enumerate(signal_headers):
+        lines.append("Ch{}={},,1,{}\n".format(
+            i + 1, _escape(header["label"]),
+            _escape(header.get("dimension") or "µV")))
+    with atomic_path(vhdr) as tmp, open(tmp, "w", encoding="utf-8") as fst:
+        fst.writelines(lines)
+
+    lines = [MARKERS.format(data=op.basename(eeg))]
+    for i, (description, position, size) in enumerate(markers):
+        lines.append("Mk{}=Stimulus,{},{},{},0\n".format(
+            i + 2, _escape(description), position, size))
+    with atomic_path(vmrk) as tmp, open(tmp, "w", encoding="utf-8") as fst:
+        fst.writelines(lines)
+    return [vhdr, vmrk, eeg]
+
+
+def read_header(filename: PathLike) -> Dict[str, object]:
+    """channels, sample rate and length of a recording from its .vhdr"""
+    vhdr, _, eeg = brainvision_names(filename)
+    fields, channels = {}, []
+    with open(vhdr, "r", encoding="utf-8") as fst:
+        for line in fst:
+            key, sep, value = line.strip().partition("=")
+            if not sep or key.startswith(";"):
+                continue
+            if re.fullmatch(r"Ch\d+", key):
+                channels.append(value.split(",")[0].replace(r"\1", ","))
+            else:
+                fields[key] = value
+    if fields.get("BinaryFormat") != "IEEE_FLOAT_32":
+        raise NotImplementedError("only IEEE_FLOAT_32 BrainVision files are"
+                                  " supported, not " + vhdr)
+    sample_rate = 1e6 / float(fields["SamplingInterval"])
+    n_samples = op.getsize(op.join(op.dirname(vhdr), fields["DataFile"])
+                           ) // (4 * len(channels))
+    return dict(channels=channels, sample_rate=sample_rate,
+                n_samples=n_samples, orientation=fields["DataOrientation"],
+                data=op.join(op.dirname(vhdr), fields["DataFile"]))
+
+
+def read_brainvision(filename: PathLike) -> np.ndarray:
+    """the channels by samples float32 data of a recording"""
+    header = read_header(filename)
+    data = np.fromfile(header["data"], dtype="<f4")
+    if header["orientation"] == "VECTORIZED":
+        return data.reshape(len(header["channels"]), -1)
+    return data.reshape(-1, len(header["channels"])).T
@@ -0,0 +1,181 @@
+import json
+import os
+import os.path as op
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
+
+from .utils import PathLike
+
+CACHE_NAME = ".dicom_index.json"
+
+# the only header fields get_params and set_DICOM look at
+TAGS = ("PatientID", "SeriesNumber", "EchoTime", "RepetitionTime",
+        "ImagesInAcquisition", "ScanningSequence", "SequenceVariant",
+        "ScanOptions", "MRAcquisitionType", "SequenceName")
+
+
+def _plain(value) -> Any:
+    """converts a pydicom value to something json can store"""
+    import pydicom as dicom
+    if isinstance(value, dicom.multival.MultiValue):
+        return [_plain(v) for v in value]
+    if isinstance(value, (int, float)):
+        return float(value) if isinstance(value, float) else int(value)
+    return str(value)
+
+
+def read_header(filename: PathLike, tags=TAGS) -> Optional[Dict[str, Any]]:
+    """reads the given tags of one DICOM file without its pixel data
+
+    :param filename: DICOM file
+    :type filename: PathLike
+    :param tags: keywords of the elements to read
+    :type tags: tuple
+    :return: keyword to value, None if the file is not DICOM
+    :rtype: dict
+    """
+    # imported here rather than lazily, the first read may be on any thread
+    import pydicom as dicom
+    fobj = None
+    # files without the DICM preamble are read with force, which succeeds on
+    # anything, so they only count if one of the tags was found
+    for force in (False, True):
+        try:
+            fobj = dicom.dcmread(str(filename), stop_before_pixels=True,
+                                 specific_tags=list(tags), force=force)
+            break
+        except dicom.errors.InvalidDicomError:
+            continue
+        except (OSError, ValueError, EOFError):
+            return None
+    if fobj is None:
+        return None
+    try:
+        header = {tag: _plain(fobj.data_element(tag).value) for tag in tags
+                  if tag in fobj}
+    except Exception:
+        return None
+    return header or None
+
+
+class DicomIndex:
+    """Series level index of a DICOM tree
+
+    The tree is walked once and the header of the first file of each
+    directory is read with stop_before_pixels in a thread pool, since
+    every file of a series shares its series level tags. The index is
+    cached in the DICOM root and reused while no directory changed.
+    """
+
+    def __init__(self, root: PathLike, dirs: Dict[str, dict] = None,
+                 converted: Dict[str, List[str]] = None):
+        self.root = str(root)
+        # directory path to its mtime, file names in walk order and header,
+        # kept in os.walk order
+        self.dirs = dirs if dirs is not None else {}
+        # subject directory to the files dcm2niix wrote into it
+        self.converted = converted if converted is not None else {}
+
+    @classmethod
+    def build(cls, root: PathLike, n_jobs: int = None) -> "DicomIndex":
+        index = cls(root)
+        for dirpath, _, files in os.walk(index.root):
+            index.dirs[dirpath] = dict(mtime=op.getmtime(dirpath),
+                                       files=files, header=None)
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            for entry, header in zip(index.dirs.values(), pool.map(
+                    index._first_header, index.dirs.items())):
+                entry["header"] = header
+        return index
+
+    @staticmethod
+    def _first_header(item) -> Optional[Dict[str, Any]]:
+        dirpath, entry = item
+        # hidden files such as .DS_Store are skipped until a DICOM is found
+        for file in sorted(entry["files"]):
+            header = read_header(op.join(dirpath, file))
+            if header is not None:
+                return header
+        return None
+
+    @classmethod
+    def load(cls, root: PathLike, cache: PathLike = None,
+             n_jobs: int = None) -> "DicomIndex":
+        """returns the cached index of a DICOM root, rebuilding it if stale
+
+        :param root: top of the DICOM tree
+        :type root: PathLike
+        :param cache: json cache file, defaults to a hidden file in root
+        :type cache: PathLike
+        :param n_jobs: number of threads reading headers
+        :type n_jobs: int
+        :return: the index
+        :rtype: DicomIndex
+        """
+        if cache is None:
+            cache = op.join(str(root), CACHE_NAME)
+        if op.isfile(cache):
+            index = cls.from_json(cache)
+            if op.abspath(index.root) == op.abspath(str(root)) and \
+                    index.is_current():
+                return index
+        index = cls.build(root, n_jobs)
+        try:
+            index.to_json(cache)
+        except OSError:
+            # read only DICOM trees are simply indexed on every run
+            pass
+        return index
+
+    def is_current(self) -> bool:
+        try:
+            return all(op.getmtime(d) == entry["mtime"] for d, entry in
+                       self.dirs.items())
+        except OSError:
+            return False
+
+    def walk(self) -> List[str]:
+        """every directory of the tree in os.walk order"""
+        return list(self.dirs.keys())
+
+    def files(self, dirpath: PathLike) -> List[str]:
+        return self.dirs[str(dirpath)]["files"]
+
+    def header(self, dirpath: PathLike) -> Optional[Dict[str, Any]]:
+        """header of the series in a directory, None if it has no DICOM"""
+        return self.dirs[str(dirpath)]["header"]
+
+    def first_header(self, folder: PathLike) -> Optional[Dict[str, Any]]:
+        """header of the first series at or below a folder"""
+        folder = op.abspath(str(folder))
+        for dirpath, entry in self.dirs.items():
+            path = op.abspath(dirpath)
+            if (path == folder or path.startswith(folder + os.sep)) and \
+                    entry["header"] is not None:
+                return entry["header"]
+        return None
+
+    def is_converted(self, sub_dir: PathLike) -> bool:
+        """checks that every file of a recorded conversion is still there"""
+        files = self.converted.get(str(sub_dir))
+        return files is not None and all(op.isfile(op.join(
+            str(sub_dir), f)) for f in files)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(root=self.root, dirs=self.dirs, converted=self.converted)
+
+    def to_json(self, filename: PathLike):
+        with open(filename, "w") as fst:
+            json.dump(self.to_dict(), fst, indent=1)
+        # the cache lives in the root, which must not make the index stale
+        if op.abspath(op.dirname(op.abspath(filename))) == op.abspath(
+                self.root):
+            self.dirs[self.root]["mtime"] = op.getmtime(self.root)
+            with open(filename, "w") as fst:
+                json.dump(self.to_dict(), fst, indent=1)
+
+    @classmethod
+    def from_json(cls, filename: PathLike) -> "DicomIndex":
+        with open(filename, "r") as fst:
+            data = json.load(fst)
+        return cls(data["root"], data["dirs"], data.get("converted"))
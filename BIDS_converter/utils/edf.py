@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+from .utils import PathLike, lazy_import
+
+np = lazy_import("numpy")
+pyedflib = lazy_import("pyedflib")
+
+# field widths of the per signal part of an EDF header, in file order
+SIGNAL_FIELDS = (("label", 16), ("transducer", 80), ("dimension", 8),
+                 ("physical_min", 8), ("physical_max", 8),
+                 ("digital_min", 8), ("digital_max", 8), ("prefilter", 80),
+                 ("samples_per_record", 8), ("reserved", 32))
+ANNOTATIONS = "EDF Annotations"
+# data records read from a stream at a time are about this many bytes
+BATCH_BYTES = 1 << 24
+
+
+def to_physical(rows: np.ndarray, signal_headers: List[dict]) -> np.ndarray:
+    """scales EDF digital values to physical ones, row by row
+
+    :param rows: channels by samples of digital values
+    :type rows: np.ndarray
+    :param signal_headers: pyedflib signal headers of the channels
+    :type signal_headers: list
+    :return: float32 physical values
+    :rtype: np.ndarray
+    """
+    out = np.empty(np.shape(rows), dtype=np.float32)
+    for i, (row, header) in enumerate(zip(rows, signal_headers)):
+        gain = (header["physical_max"] - header["physical_min"]) / (
+            header["digital_max"] - header["digital_min"])
+        out[i] = (row - header["digital_min"]) * gain + header[
+            "physical_min"]
+    return out
+
+
+def to_digital(rows: np.ndarray, signal_headers: List[dict]
+               ) -> np.ndarray:
+    """scales physical values to EDF digital ones, the inverse of
+    to_physical
+
+    :return: int32 digital values, clipped to the digital range
+    :rtype: np.ndarray
+    """
+    out = np.empty(np.shape(rows), dtype=np.int32)
+    for i, (row, header) in enumerate(zip(rows, signal_headers)):
+        gain = (header["physical_max"] - header["physical_min"]) / (
+            header["digital_max"] - header["digital_min"])
+        out[i] = np.clip(np.round((row - header["physical_min"]) / gain +
+                                  header["digital_min"]),
+                         header["digital_min"], header["digital_max"])
+    return out
+
+
+def clip_physical(rows: np.ndarray, signal_headers: List[dict]
+                  ) -> np.ndarray:
+    """clips physical values to the range of their signal headers, in place
+
+    Samples past the digital range of their header, or the rounding of the
+    scaling from digital values, give physical values past the header range,
+    which pyedflib.highlevel.write_edf rejects.
+
+    :param rows: channels by samples of physical values
+    :type rows: np.ndarray
+    :param signal_headers: pyedflib signal headers of the channels
+    :type signal_headers: list
+    :return: rows
+    :rtype: np.ndarray
+    """
+    for row, header in zip(rows, signal_headers):
+        np.clip(row, header["physical_min"], header["physical_max"], out=row)
+    return rows
+
+
+def n_samples(filename: PathLike, channel: int = 0) -> int:
+    """samples of one signal of an EDF file, without reading the data"""
+    f = pyedflib.EdfReader(str(filename))
+    try:
+        return int(f.getNSamples()[channel])
+    finally:
+        f.close()
+
+
+def header_samples(fobj: BinaryIO) -> int:
+    """samples of all the data signals of an EDF file together, from the
+    header alone
+
+    :param fobj: binary stream positioned at the start of the file
+    :type fobj: BinaryIO
+    :return: samples of every signal but the annotations
+    :rtype: int
+    """
+    main = fobj.read(256)
+    n_records, n_signals = int(main[236:244]), int(main[252:256])
+    raw = fobj.read(n_signals * 256)
+    fields, pos = {}, 0
+    for name, width in SIGNAL_FIELDS:
+        fields[name] = [raw[pos + i * width:pos + (i + 1) * width].decode(
+            "ascii", "replace").strip() for i in range(n_signals)]
+        pos += n_signals * width
+    return max(n_records, 0) * sum(
+        int(n) for label, n in zip(fields["label"],
+                                   fields["samples_per_record"])
+        if label != ANNOTATIONS)
+
+
+def read_blocks(filename: PathLike, channels: List[int] = None,
+                start: int = 0, stop: int = None, block: int = None
+                ) -> Iterator[np.ndarray]:
+    """yields the physical values of samples start to stop of an EDF file
+
+    Only one block of the selected channels is in memory at a time, so
+    recordings of any length can be streamed to a writer.
+
+    :param filename: EDF file
+    :type filename: PathLike
+    :param channels: signal indices to read, all by default. They must
+        share a sample rate
+    :type channels: list
+    :param start: first sample
+    :type start: int
+    :param stop: sample after the last one, the end of the file by default
+    :type stop: int
+    :param block: samples per block, 10 seconds by default
+    :type block: int
+    :return: float32 channels by samples blocks
+    :rtype: Iterator[np.ndarray]
+    """
+    f = pyedflib.EdfReader(str(filename))
+    try:
+        if channels is None:
+            channels = list(range(f.signals_in_file))
+        n_samples = int(f.getNSamples()[channels[0]])
+        stop = n_samples if stop is None else min(stop, n_samples)
+        if block is None:
+            block = int(f.getSampleFrequency(channels[0]) * 10)
+        for pos in range(start, stop, block):
+            count = min(block, stop - pos)
+            data = np.empty((len(channels), count), dtype=np.float32)
+            for i, chn in enumerate(channels):
+                data[i] = f.readSignal(chn, pos, count)
+            yield data
+    finally:
+        f.close()
+
+
+def read_into(filename: PathLike, channels: List[int], out: np.ndarray,
+              digital: bool = False) -> List[dict]:
+    """reads channels of an EDF file into out, one channel at a time
+
+    Like pyedflib.highlevel.read_edf, without holding the signals twice.
+
+    :param filename: EDF file
+    :type filename: PathLike
+    :param channels: signal indices to read, of the same length
+    :type channels: list
+    :param out: channels by samples array to fill
+    :type out: np.ndarray
+    :param digital: whether to read digital values instead of physical ones
+    :type digital: bool
+    :return: the signal headers of the channels
+    :rtype: list
+    """
+    f = pyedflib.EdfReader(str(filename))
+    try:
+        headers = f.getSignalHeaders()
+        for row, chn in enumerate(channels):
+            out[row] = f.readSignal(chn, digital=digital)
+        return [headers[chn] for chn in channels]
+    finally:
+        f.close()
+
+
+def array_blocks(array: np.ndarray, block: int,
+                 signal_headers: List[dict] = None
+                 ) -> Iterator[np.ndarray]:
+    """yields an in memory recording like read_blocks
+
+    :param signal_headers: headers to scale digital values with, None if
+        the array already holds physical values
+    :type signal_headers: list
+    """
+    for pos in range(0, np.shape(array)[1], block):
+        data = array[:, pos:pos + block]
+        if signal_headers is not None:
+            data = to_physical(data, signal_headers)
+        yield np.asarray(data, dtype=np.float32)
+
+
+class _Stream:
+    """the parts of the pyedflib.EdfReader interface the converter uses, for
+    a recording that can only be read front to back once"""
+
+    def __init__(self, file_name: PathLike, signal_headers: List[dict],
+                 n_samples: int):
+        self.file_name = str(file_name)
+        self.signal_headers = signal_headers
+        self.signals_in_file = len(signal_headers)
+        self._n_samples = n_samples
+
+    def getSignalLabels(self) -> List[str]:
+        return [h["label"] for h in self.signal_headers]
+
+    def getSignalHeaders(self) -> List[dict]:
+        return [dict(h) for h in self.signal_headers]
+
+    def getNSamples(self) -> np.ndarray:
+        return np.full(self.signals_in_file, self._n_samples)
+
+    def samples_in_file(self, chn: int) -> int:
+        return self._n_samples
+
+    def getSampleFrequency(self, chn: int) -> float:
+        return self.signal_headers[chn]["sample_frequency"]
+
+    def close(self):
+        pass
+
+
+class EdfStream(_Stream):
+    """an EDF file read from a stream, such as a member of an archive
+
+    The header is parsed on creation, the data records by a single call of
+    read. Annotation signals are left out like pyedflib does, and every
+    other signal must have the same sample rate.
+
+    :param fobj: binary stream positioned at the start of the file
+    :type fobj: BinaryIO
+    :param file_name: name reported for the recording
+    :type file_name: PathLike
+    """
+
+    def __init__(self, fobj: BinaryIO, file_name: PathLike = ""):
+        self._fobj = fobj
+        main = self._read(256, file_name)
+        if main[:1] != b"0":
+            raise NotImplementedError(
+                "{} is not a 16 bit EDF file".format(file_name))
+        self.header = dict(
+            patientname=main[8:88].decode("ascii", "replace").strip(),
+            recording_additional=main[88:168].decode(
+                "ascii", "replace").strip())
+        self.datarecords_in_file = int(main[236:244])
+        if self.datarecords_in_file < 0:
+            raise NotImplementedError("{} does not state its number of data "
+                                      "records".format(file_name))
+        self.datarecord_duration = float(main[244:252])
+        n_signals = int(main[252:256])
+        fields = {}
+        raw = self._read(n_signals * 256, file_name)
+        pos = 0
+        for name, width in SIGNAL_FIELDS:
+            fields[name] = [raw[pos + i * width:pos + (i + 1) * width].decode(
+                "ascii", "replace").strip() for i in range(n_signals)]
+            pos += n_signals * width
+        self._per_record = [int(n) for n in fields["samples_per_record"]]
+        self._signals = [i for i, label in enumerate(fields["label"])
+                         if label != ANNOTATIONS]
+        headers = []
+        for i in self._signals:
+            rate = self._per_record[i] / self.datarecord_duration
+            headers.append(dict(
+                label=fields["label"][i], dimension=fields["dimension"][i],
+                sample_rate=rate, sample_frequency=rate,
+                physical_max=float(fields["physical_max"][i]),
+                physical_min=float(fields["physical_min"][i]),
+                digital_max=int(fields["digital_max"][i]),
+                digital_min=int(fields["digital_min"][i]),
+                prefilter=fields["prefilter"][i],
+                transducer=fields["transducer"][i]))
+        if len({self._per_record[i] for i in self._signals}) > 1:
+            raise NotImplementedError(
+                "the signals of {} have different sample rates".format(
+                    file_name))
+        n_samples = self._per_record[self._signals[0]] * \
+            self.datarecords_in_file if self._signals else 0
+        super().__init__(file_name, headers, n_samples)
+
+    def _read(self, size: int, file_name: PathLike) -> bytes:
+        data = self._fobj.read(size)
+        if len(data) != size:
+            raise EOFError("{} ended within its header".format(file_name))
+        return data
+
+    def read(self, channels: List[int] = None, digital: bool = False,
+             out: np.ndarray = None) -> Tuple[np.ndarray, List[dict]]:
+        """the channels by samples data of the recording
+
+        :param channels: signal indices to read, all by default
+        :type channels: list
+        :param digital: whether to keep the digital values instead of
+            scaling them like pyedflib.highlevel.read_edf
+        :type digital: bool
+        :param out: array of the returned type and shape to fill, a new one
+            by default
+        :type out: np.ndarray
+        :return: int32 digital or float64 physical values, and the signal
+            headers of the channels
+        :rtype: Tuple[np.ndarray, List[dict]]
+        """
+        if channels is None:
+            channels = list(range(self.signals_in_file))
+        offsets = np.cumsum([0] + self._per_record)
+        record = int(offsets[-1])
+        n_records = self.datarecords_in_file
+        per_record = self._per_record[self._signals[0]]
+        if out is None:
+            out = np.empty((len(channels), self._n_samples),
+                           dtype=np.int32 if digital else np.float64)
+        batch = max(BATCH_BYTES // (2 * record), 1)
+        for first in range(0, n_records, batch):
+            count = min(batch, n_records - first)
+            data = self._fobj.read(2 * record * count)
+            if len(data) != 2 * record * count:
+                raise EOFError("{} holds fewer than {} data records".format(
+                    self.file_name, n_records))
+            records = np.frombuffer(data, dtype="<i2").reshape(count, record)
+            pos = first * per_record
+            for row, chn in enumerate(channels):
+                start = offsets[self._signals[chn]]
+                out[row, pos:pos + count * per_record] = records[
+                    :, start:start + per_record].ravel()
+        headers = [dict(self.signal_headers[chn]) for chn in channels]
+        if not digital:
+            for row, header in zip(out, headers):
+                gain = (header["physical_max"] - header["physical_min"]) / (
+                    header["digital_max"] - header["digital_min"])
+                row -= header["digital_min"]
+                row *= gain
+                row += header["physical_min"]
+        return out, headers
+
+
+class BinaryStream(_Stream):
+    """a headerless binary recording read from a stream, samples by channels
+    like the .ieeg.dat files force_to_edf converts
+
+    :param fobj: binary stream positioned at the start of the file
+    :type fobj: BinaryIO
+    :param size: bytes in the stream
+    :type size: int
+    :param labels: channel names, in file order
+    :type labels: list
+    :param sample_rate: samples per second
+    :type sample_rate: float
+    :param dtype: numpy type of a value
+    :type dtype: str
+    """
+
+    def __init__(self, fobj: BinaryIO, size: int, labels: List[str],
+                 sample_rate: float, dtype: str, file_name: PathLike = ""):
+        self._fobj = fobj
+        self._size = size
+        self._dtype = np.dtype(dtype)
+        headers = pyedflib.highlevel.make_signal_headers(
+            labels, sample_frequency=sample_rate)
+        for header in headers:
+            header["sample_rate"] = sample_rate
+        super().__init__(file_name, headers, size // (
+            self._dtype.itemsize * len(labels)))
+
+    def read(self, channels: List[int] = None, digital: bool = False,
+             out: np.ndarray = None) -> Tuple[np.ndarray, List[dict]]:
+        """the channels by samples data of the recording, like EdfStream.read
+
+        The physical range of the signal headers is the range of all the
+        data, as force_to_edf sets it.
+        """
+        data = np.empty(self._size, dtype=np.uint8)
+        view = memoryview(data)
+        pos = 0
+        while pos < self._size:
+            count = self._fobj.readinto(view[pos:])
+            if not count:
+                raise EOFError("{} ended after {} of {} bytes".format(
+                    self.file_name, pos, self._size))
+            pos += count
+        n_values = self._n_samples * self.signals_in_file
+        array = data[:n_values * self._dtype.itemsize].view(
+            self._dtype).reshape(-1, self.signals_in_file).T
+        low, high = float(np.amin(array)), float(np.amax(array))
+        if channels is not None:
+            array = array[channels]
+        headers = self.getSignalHeaders() if channels is None else [
+            dict(self.signal_headers[chn]) for chn in channels]
+        for header in headers:
+            header.update(physical_min=low, physical_max=high)
+        if digital:
+            array = to_digital(array, headers)
+        elif out is None:
+            array = np.asarray(array, dtype=np.float64)
+        if out is None:
+            return array, headers
+        out[...] = array
+        return out, headers
@@ -0,0 +1,67 @@
+import os.path as op
+import re
+from typing import Dict
+
+from .utils import PathLike
+
+# a BIDS file name is key-value pairs and a suffix joined by underscores,
+# followed by an extension that may itself contain dots such as .nii.gz
+NAME = re.compile(r"(?P<stem>[^./\\]+)(?P<extension>\.[^/\\]*)?$")
+PAIR = re.compile(r"(?P<key>[a-zA-Z]+)-(?P<value>[a-zA-Z0-9]+)")
+SUFFIX = re.compile(r"[a-zA-Z0-9]+")
+
+
+def parse_entities(filename: PathLike) -> Dict[str, str]:
+    """splits a BIDS file name into its entities, suffix and extension
+
+    A drop in for bids.layout.parse_file_entities on the names the
+    converter writes, without loading the pybids configuration. Keys are
+    the short entity names of the file name, values are kept as strings
+    so zero padding survives, and the order of the name is kept.
+
+    :param filename: file name or path, only the base name is parsed
+    :type filename: PathLike
+    :return: entity to label, plus suffix and extension when present
+    :rtype: dict
+    """
+    match = NAME.search(op.basename(str(filename)))
+    if match is None:
+        raise ValueError("{} is not a BIDS file name".format(filename))
+    tokens = match.group("stem").split("_")
+    entities = {}
+    for i, token in enumerate(tokens):
+        pair = PAIR.fullmatch(token)
+        if pair is not None:
+            entities[pair.group("key")] = pair.group("value")
+        elif i == len(tokens) - 1 and SUFFIX.fullmatch(token):
+            entities["suffix"] = token
+        else:
+            raise ValueError("{} in {} is neither an entity nor a suffix"
+                             "".format(token, filename))
+    if match.group("extension"):
+        entities["extension"] = match.group("extension")
+    return entities
+
+
+def build_name(entities: Dict[str, str]) -> str:
+    """joins entities back into a file name, the inverse of parse_entities
+
+    Entities are written in the order given, then the suffix and the
+    extension. Entities set to None are left out.
+
+    :param entities: entity to label, with optional suffix and extension
+    :type entities: dict
+    :return: the file name
+    :rtype: str
+    """
+    parts = []
+    for key, value in entities.items():
+        if key in ("suffix", "extension") or value is None:
+            continue
+        if not PAIR.fullmatch("{}-{}".format(key, value)):
+            raise ValueError("{}-{} is not a valid BIDS entity".format(
+                key, value))
+        parts.append("{}-{}".format(key, value))
+    if entities.get("suffix") is not None:
+        parts.append(entities["suffix"])
+    return "_".join(parts) + (entities.get("extension") or "")
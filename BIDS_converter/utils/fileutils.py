@@ -1,59 +1,97 @@
+from __future__ import annotations
+
 import gzip
+import hashlib
+import io
+import json
 import os
 import shutil
 import stat
+import struct
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from re import match
 from typing import Union, TypeVar
 
-import nibabel as nib
-import numpy as np
+from .utils import lazy_import
+
+nib = lazy_import("nibabel")
+np = lazy_import("numpy")
 
 PathLike = TypeVar("PathLike", str, os.PathLike)
 
 
-def run_dcm2niix(subdir: PathLike, fobj: object, scan_num: str, runlist: list, sub_dir: PathLike, sub_num):
+def run_dcm2niix(subdir: PathLike, series: Union[int, str], scan_num: str,
+                 runlist: list, sub_dir: PathLike, sub_num) -> str:
+    """converts one DICOM series with dcm2niix and returns its output
+
+    dcm2niix writes into a private temporary directory inside sub_dir, so
+    several series can be converted at once without their multi echo
+    renames or outputs overlapping. Finished files are then moved into
+    sub_dir.
+
+    :param subdir: directory of the series
+    :type subdir: PathLike
+    :param series: series number from the DICOM header
+    :type series: int
+    :param scan_num: zero padded scan number
+    :type scan_num: str
+    :param runlist: series numbers of the multi echo runs
+    :type runlist: list
+    :param sub_dir: subject output directory
+    :type sub_dir: PathLike
+    :param sub_num: subject number
+    :type sub_num: str
+    :return: captured stdout and stderr of dcm2niix
+    :rtype: str
+    """
     # not including parent folder or /medata, run dcm2niix on non
     # me data
-
-    firstfile = [x[2] for x in os.walk(subdir)][0][0]
-    # running dcm2niix
-    if str(fobj[0x20, 0x11].value) in runlist:
-        proc = subprocess.Popen(
-            "dcm2niix -z y -f run{SCAN_NUM}_%p_%t_sub{SUB_NUM} -o "
-            "{OUTPUT_DIR} -s y -b y {DATA_DIR}".format(
-                OUTPUT_DIR=sub_dir, SUB_NUM=sub_num,
-                DATA_DIR=os.path.join(subdir, firstfile),
-                SCAN_NUM=scan_num), shell=True,
-            stdout=subprocess.PIPE)
-        outs, errs = proc.communicate()
-        prefix = match(".*/sub-{SUB_NUM}/(run{SCAN_NUM}".format(
-            SUB_NUM=sub_num, SCAN_NUM=scan_num
-        ) + r"[^ \(\"\\n\.]*).*", str(outs)).group(1)
-        for file in os.listdir(sub_dir):
-            mefile = match(r"run{SCAN_NUM}(\.e\d\d)\.nii"
-                           r"".format(SCAN_NUM=scan_num), file)
-            if match(r"run{SCAN_NUM}\.e\d\d.nii".format(
-                    SCAN_NUM=scan_num), file):
-                shutil.move(os.path.join(sub_dir, file),
-                            os.path.join(sub_dir, prefix + mefile.group(
-                                1) + ".nii"))
-                shutil.copy(os.path.join(sub_dir, prefix + ".json"),
-                            os.path.join(sub_dir, prefix + mefile.group(
-                                1) + ".json"))
-        os.remove(os.path.join(sub_dir, prefix + ".nii.gz"))
-        os.remove(os.path.join(sub_dir, prefix + ".json"))
-    else:
-        proc = subprocess.Popen(
-            "dcm2niix -z y -f run{SCAN_NUM}_%p_%t_sub{SUB_NUM} -o "
-            "{OUTPUT_DIR} -b y {DATA_DIR}".format(
-                OUTPUT_DIR=sub_dir, SUB_NUM=sub_num,
-                DATA_DIR=subdir, SCAN_NUM=scan_num), shell=True,
-            stdout=subprocess.PIPE)
-        outs, errs = proc.communicate()
-    sys.stdout.write(outs.decode("utf-8"))
+    name = "run{SCAN_NUM}_%p_%t_sub{SUB_NUM}".format(SCAN_NUM=scan_num,
+                                                     SUB_NUM=sub_num)
+    with tempfile.TemporaryDirectory(prefix=".dcm2niix_run{}_".format(
+            scan_num), dir=sub_dir) as out_dir:
+        if str(series) in runlist:
+            firstfile = [x[2] for x in os.walk(subdir)][0][0]
+            args = ["-s", "y", os.path.join(subdir, firstfile)]
+        else:
+            args = [str(subdir)]
+        proc = subprocess.run(["dcm2niix", "-z", "y", "-f", name, "-o",
+                               out_dir, "-b", "y"] + args,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT)
+        outs = proc.stdout.decode("utf-8", errors="replace")
+        if proc.returncode != 0:
+            raise RuntimeError("dcm2niix failed on {}:\n{}".format(subdir,
+                                                                  outs))
+        if str(series) in runlist:
+            # the multi echo images were copied from medata, they only need
+            # the name and sidecar of the single file conversion
+            prefix = [os.path.splitext(f)[0] for f in os.listdir(out_dir)
+                      if f.endswith(".json")][0]
+            for file in os.listdir(sub_dir):
+                mefile = match(r"run{SCAN_NUM}(\.e\d\d)\.nii"
+                               r"".format(SCAN_NUM=scan_num), file)
+                if mefile:
+                    shutil.move(os.path.join(sub_dir, file),
+                                os.path.join(sub_dir, prefix + mefile.group(
+                                    1) + ".nii"))
+                    shutil.copy(os.path.join(out_dir, prefix + ".json"),
+                                os.path.join(sub_dir, prefix + mefile.group(
+                                    1) + ".json"))
+        else:
+            for file in os.listdir(out_dir):
+                os.replace(os.path.join(out_dir, file),
+                           os.path.join(sub_dir, file))
+    return outs
 
 
 def rot_x(alpha):
@@ -74,6 +112,194 @@ def rot_z(alpha):
                         , [0, 0, 1]])
 
 
+# uncompressed bytes deflated per task, and the window carried between them
+GZIP_BLOCK = 128 << 10
+GZIP_DICT = 32 << 10
+
+
+def _deflate(block: bytes, level: int, zdict: bytes, last: bool) -> bytes:
+    kwargs = dict(zdict=zdict) if zdict else {}
+    comp = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                            **kwargs)
+    # a sync flush ends each block on a byte boundary without ending the
+    # deflate stream, so the blocks concatenate into one gzip member
+    return comp.compress(block) + comp.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter:
+    """Write only gzip file that deflates blocks on several threads
+
+    Works like pigz: input is cut into blocks that are deflated
+    independently in a thread pool (zlib releases the GIL), each primed
+    with the last 32 KiB of the block before it so the ratio barely
+    changes, and written in order as one standard gzip member.
+    """
+
+    def __init__(self, filename: PathLike, compresslevel: int = 6,
+                 n_threads: int = None, block_size: int = None,
+                 mtime: int = None):
+        self.name = str(filename)
+        self._fobj = open(filename, "wb")
+        self._level = compresslevel
+        self._block = block_size or GZIP_BLOCK
+        self._n_threads = n_threads or os.cpu_count()
+        self._pool = ThreadPoolExecutor(self._n_threads)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._zdict = b""
+        self._crc = 0
+        self._size = 0
+        self.closed = False
+        # same header as gzip.open, with the name the member decompresses to
+        fname = os.path.basename(self.name)
+        if fname.endswith(".gz"):
+            fname = fname[:-3]
+        xfl = 2 if compresslevel == 9 else 4 if compresslevel == 1 else 0
+        self._fobj.write(b"\x1f\x8b\x08\x08" + struct.pack(
+            "<L", int(time.time() if mtime is None else mtime)) + bytes(
+            [xfl, 255]) + fname.encode("latin-1", "replace") + b"\x00")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, data) -> int:
+        data = memoryview(data).cast("B")
+        self._buffer += data
+        while len(self._buffer) >= self._block:
+            self._submit(bytes(self._buffer[:self._block]))
+            del self._buffer[:self._block]
+        return len(data)
+
+    def _submit(self, block: bytes, last: bool = False):
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        self._pending.append(self._pool.submit(
+            _deflate, block, self._level, self._zdict, last))
+        self._zdict = block[-GZIP_DICT:]
+        # bounded read ahead keeps memory flat for multi GB inputs
+        while len(self._pending) > 2 * self._n_threads:
+            self._fobj.write(self._pending.popleft().result())
+
+    def tell(self) -> int:
+        return self._size + len(self._buffer)
+
+    def seek(self, offset: int, whence: int = 0):
+        raise io.UnsupportedOperation("seek")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._submit(bytes(self._buffer), last=True)
+            while self._pending:
+                self._fobj.write(self._pending.popleft().result())
+            self._fobj.write(struct.pack("<LL", self._crc,
+                                         self._size & 0xffffffff))
+        finally:
+            self.closed = True
+            self._buffer = bytearray()
+            self._pool.shutdown()
+            self._fobj.close()
+
+
+def gzip_file(src: PathLike, dst: PathLike, compresslevel: int = 6,
+              n_threads: int = None):
+    """compresses src into dst with ParallelGzipWriter"""
+    with open(src, "rb") as f_in, ParallelGzipWriter(
+            dst, compresslevel, n_threads) as f_out:
+        copy_file(f_in, f_out, is_obj=True)
+
+
+# bytes of image data read from the source per slab
+SLAB_BYTES = 64 << 20
+
+
+def _slabs(nib_img, transpose: bool = False, slab_bytes: int = None):
+    """yields the image data in slabs along its last output axis
+
+    With transpose, the 4D MINC reorientation (the full transpose then
+    swap of the first two axes) is applied to each slab, which reads the
+    source along its first axis instead.
+    """
+    dataobj = nib_img.dataobj
+    shape = nib_img.shape
+    slab_bytes = slab_bytes or SLAB_BYTES
+    axis = 0 if transpose else len(shape) - 1
+    unit = max(int(np.prod(shape)) // shape[axis], 1) * 8
+    step = max(slab_bytes // unit, 1)
+    for start in range(0, shape[axis], step):
+        index = [slice(None)] * len(shape)
+        index[axis] = slice(start, start + step)
+        slab = np.asanyarray(dataobj[tuple(index)])
+        yield slab.transpose(2, 3, 1, 0) if transpose else slab
+
+
+def save_nifti_slabs(nifti_img, filename: PathLike, slabs,
+                     compresslevel: int = 1):
+    """nib.save for images that should never be held in memory at once
+
+    nifti_img only needs the shape and dtype of the data, for example a
+    np.broadcast_to placeholder. The data comes from slabs, a function
+    returning an iterator of arrays along the last axis. Scaling and
+    header match what nib.save would write for the whole array, for which
+    the data range is found in a first pass when scaling is needed.
+    .nii.gz files are compressed on all cores, at nibabel's default level.
+    """
+    from nibabel import arraywriters, volumeutils
+    nifti_img.update_header()
+    img_dtype = nifti_img.get_data_dtype()
+    try:
+        nifti_img.get_data_dtype(finalize=True)
+    except TypeError:
+        # nibabel < 4 has no alias data types to finalize
+        pass
+    hdr = nifti_img.header
+    in_dtype = nifti_img.dataobj.dtype
+    out_dtype = hdr.get_data_dtype()
+    try:
+        # the writer is made from a stand in with the range and NaNs of the
+        # whole image, then fed the real slabs
+        if np.can_cast(in_dtype, out_dtype, "safe"):
+            sample = np.zeros(1, in_dtype)
+        else:
+            mn, mx, has_nan = np.inf, -np.inf, False
+            for slab in slabs():
+                s_mn, s_mx, s_nan = volumeutils.finite_range(slab, True)
+                mn, mx, has_nan = min(mn, s_mn), max(mx, s_mx), \
+                    has_nan or s_nan
+            sample = [mn, mx] if mn <= mx else []
+            sample = np.array(sample + [np.nan] * has_nan, in_dtype)
+        slope = hdr["scl_slope"].item() if hdr.has_data_slope else np.nan
+        inter = hdr["scl_inter"].item() if hdr.has_data_intercept else np.nan
+        scale_me = np.all(np.isnan((slope, inter)))
+        if scale_me:
+            writer = arraywriters.make_array_writer(
+                sample, out_dtype, hdr.has_data_slope, hdr.has_data_intercept)
+            hdr.set_slope_inter(*arraywriters.get_slope_inter(writer))
+        else:
+            writer = arraywriters.ArrayWriter(sample, out_dtype,
+                                              check_scaling=False)
+        if str(filename).endswith(".gz"):
+            fobj = ParallelGzipWriter(filename, compresslevel)
+        else:
+            fobj = open(filename, "wb")
+        with fobj:
+            hdr.write_to(fobj)
+            volumeutils.seek_tell(fobj, hdr.get_data_offset(), write0=True)
+            for slab in slabs():
+                writer._array = np.asanyarray(slab)
+                writer.to_fileobj(fobj, order="F")
+    finally:
+        nifti_img.set_data_dtype(img_dtype)
+
+
 def mri_file_transfer(source: PathLike, destination: PathLike,
                       new_name: str, config: dict):
     file = os.path.basename(source)
@@ -82,10 +308,14 @@ def mri_file_transfer(source: PathLike, destination: PathLike,
     # we convert it using nibabel
     if not any(file.endswith(ext) for ext in [".nii", ".nii.gz"]):
         # check if .nii listed in config file, not if file ends with .nii
-        # loading the original image
+        # loading the original image, the data stays in the array proxy and
+        # is streamed to the output in slabs
         nib_img = nib.load(source)
         nib_affine = np.array(nib_img.affine)
-        nib_data = np.array(nib_img.dataobj)
+        first = tuple(slice(0, 1) for _ in nib_img.shape)
+        in_dtype = np.asanyarray(nib_img.dataobj[first]).dtype
+        transpose = False
+        shape = nib_img.shape
 
         # create the nifti1 image
         # if minc format, invert the data and change the affine
@@ -96,40 +326,45 @@ def mri_file_transfer(source: PathLike, destination: PathLike,
                 rot_z(np.pi / 2)
                 rot_y(np.pi)
                 rot_x(np.pi / 2)
-                nib_data = nib_data.T
-                nib_data = np.swapaxes(nib_data, 0, 1)
+                # data.T swapped on its first two axes
+                transpose = True
+                shape = tuple(shape[i] for i in (2, 3, 1, 0))
 
-                nifti_img = nib.Nifti1Image(nib_data, nib_affine,
-                                            nib_img.header)
+                nifti_img = nib.Nifti1Image(
+                    np.broadcast_to(np.zeros((), in_dtype), shape),
+                    nib_affine, nib_img.header)
                 nifti_img.header.set_xyzt_units(xyz="mm", t="sec")
                 zooms = np.array(nifti_img.header.get_zooms())
                 zooms[3] = config["repetitionTimeInSec"]
                 nifti_img.header.set_zooms(zooms)
             elif len(nib_img.shape) == 3:
-                nifti_img = nib.Nifti1Image(nib_data, nib_affine,
-                                            nib_img.header)
+                nifti_img = nib.Nifti1Image(
+                    np.broadcast_to(np.zeros((), in_dtype), shape),
+                    nib_affine, nib_img.header)
                 nifti_img.header.set_xyzt_units(xyz="mm")
         else:
-            nifti_img = nib.Nifti1Image(nib_data, nib_affine,
-                                        nib_img.header)
+            nifti_img = nib.Nifti1Image(
+                np.broadcast_to(np.zeros((), in_dtype), shape), nib_affine,
+                nib_img.header)
 
         # saving the image
-        nib.save(nifti_img, final_file + ".gz")
+        save_nifti_slabs(nifti_img, final_file + ".gz",
+                         lambda: _slabs(nib_img, transpose))
+        return final_file + ".gz"
 
     # if it is already a nifti file, no need to convert it so we just copy
     # rename
     if file.endswith(".nii.gz"):
         copy_file(source, final_file + ".gz")
+        return final_file + ".gz"
     elif file.endswith(".nii"):
-        copy_file(source, final_file)
-        # compression just if .nii files
+        # compression just if .nii files, straight from the source
         if compress is True:
             print("zipping " + file)
-            with open(final_file, 'rb') as f_in:
-                with gzip.open(final_file + ".gz", 'wb',
-                               config["compressLevel"]) as f_out:
-                    copy_file(f_in, f_out, is_obj=True)
-            os.remove(final_file)
+            gzip_file(source, final_file + ".gz", config["compressLevel"])
+            return final_file + ".gz"
+        copy_file(source, final_file)
+        return final_file
 
 
 def force_remove(mypath: PathLike):
@@ -185,3 +420,211 @@ def copy_file(src: Union[PathLike, object], dst: Union[PathLike, object], is_obj
             raise TypeError("Inputs given are not objects")
     else:
         shutil.copyfile(src, dst)
+
+
+# ioctl request to share the blocks of one file with another (btrfs, xfs)
+FICLONE = 0x40049409
+LINK_MODES = ("hardlink", "reflink", "symlink", "copy")
+
+
+def reflink(src: PathLike, dst: PathLike):
+    """copy on write clone of src, raises OSError if not supported"""
+    import fcntl
+    with open(src, "rb") as f_in, open(dst, "wb") as f_out:
+        try:
+            fcntl.ioctl(f_out.fileno(), FICLONE, f_in.fileno())
+        except OSError:
+            f_out.close()
+            os.remove(dst)
+            raise
+
+
+def link_file(src: PathLike, dst: PathLike, modes: tuple = LINK_MODES) -> str:
+    """makes dst a view of src with the first link type the filesystem allows
+
+    Hardlinks and reflinks need src and dst on the same filesystem, symlinks
+    need the platform to allow them. Copying always works.
+
+    :param src: existing file
+    :type src: PathLike
+    :param dst: new file, replaced if it exists
+    :type dst: PathLike
+    :param modes: link types to try in order
+    :type modes: tuple
+    :return: the link type used
+    :rtype: str
+    """
+    if not os.path.isfile(src):
+        raise FileNotFoundError(src)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    error = None
+    for mode in modes:
+        try:
+            if mode == "hardlink":
+                os.link(src, dst)
+            elif mode == "reflink":
+                reflink(src, dst)
+            elif mode == "symlink":
+                os.symlink(os.path.abspath(src), dst)
+            elif mode == "copy":
+                shutil.copyfile(src, dst)
+            else:
+                raise ValueError("Unknown link type " + mode)
+            return mode
+        except (OSError, ImportError) as e:
+            error = e
+    raise OSError("Could not link or copy {} to {}".format(src, dst)
+                  ) from error
+
+
+def file_hash(filename: PathLike, algorithm: str = "sha256",
+              block: int = 1 << 20) -> str:
+    """hex digest of the whole content of a file"""
+    h = hashlib.new(algorithm)
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def store_file(src: PathLike, store: PathLike) -> str:
+    """adds a file to a content addressed store once and returns its path
+
+    Objects are named by the sha256 of their content, so identical files
+    from different sources share one object. Objects are copied, never
+    linked to src, so later edits of src cannot change them. A new object
+    takes the mtime of src and is never touched again, since every BIDS
+    directory it is hardlinked into shares it.
+    """
+    obj = _store_object(store, file_hash(src))
+    if not os.path.isfile(obj):
+        st = os.stat(src)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        with atomic_path(obj) as tmp:
+            link_file(src, tmp, ("reflink", "copy"))
+            os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return obj
+
+
+def _store_object(store: PathLike, digest: str) -> str:
+    return os.path.join(store, digest[:2], digest)
+
+
+def sync_file(src: PathLike, dst: PathLike, store: PathLike = None,
+              check_hash: bool = False) -> str:
+    """brings dst up to date with src, skipping it when unchanged
+
+    dst is unchanged when its size and mtime equal those of src, when it
+    is the store object of the content of src, or with check_hash when its
+    content hash does. Changed files are hardlinked from the store if one
+    is given and copied otherwise.
+
+    :param src: source file
+    :type src: PathLike
+    :param dst: destination file
+    :type dst: PathLike
+    :param store: content addressed store directory
+    :type store: PathLike
+    :param check_hash: compare content when size matches but mtime doesn't
+    :type check_hash: bool
+    :return: skipped, or the link type used
+    :rtype: str
+    """
+    st = os.stat(src)
+    try:
+        dst_st = os.stat(dst)
+    except FileNotFoundError:
+        dst_st = None
+    if dst_st is not None and dst_st.st_size == st.st_size:
+        if dst_st.st_mtime == st.st_mtime:
+            return "skipped"
+        if store is not None and dst_st.st_nlink > 1:
+            # hardlinked from the store for a source with another mtime
+            try:
+                obj_st = os.stat(_store_object(store, file_hash(src)))
+            except FileNotFoundError:
+                obj_st = None
+            if obj_st is not None and os.path.samestat(dst_st, obj_st):
+                return "skipped"
+        if check_hash and file_hash(src) == file_hash(dst):
+            return "skipped"
+    # replaced atomically since concurrent conversions share BIDS/stimuli
+    with atomic_path(dst) as tmp:
+        if store is not None:
+            mode = link_file(store_file(src, store), tmp,
+                             ("hardlink", "reflink", "copy"))
+        else:
+            mode = link_file(src, tmp, ("reflink", "copy"))
+        if mode != "hardlink":
+            # a fresh copy, which no other file shares
+            os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return mode
+
+
+def sync_dir(src_dir: PathLike, dst_dir: PathLike, store: PathLike = None,
+             check_hash: bool = False) -> dict:
+    """syncs every file under src_dir into dst_dir with sync_file
+
+    :return: relative file names mapped to what was done with them
+    :rtype: dict
+    """
+    done = {}
+    for root, _, files in os.walk(src_dir):
+        for f in files:
+            rel = os.path.relpath(os.path.join(root, f), src_dir)
+            dst = os.path.join(dst_dir, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            done[rel] = sync_file(os.path.join(root, f), dst, store,
+                                  check_hash)
+    return done
+
+
+@contextmanager
+def atomic_path(filename: PathLike):
+    """yields a temporary name next to filename that replaces it on success
+
+    Whatever is written to the temporary name only appears under filename
+    once complete, so a crash never leaves a truncated output behind. The
+    extension is kept for writers that check it.
+    """
+    dirname, base = os.path.split(os.path.abspath(filename))
+    tmp = os.path.join(dirname, ".tmp_{}_{}_{}".format(
+        os.getpid(), threading.get_ident(), base))
+    try:
+        yield tmp
+        os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def write_json(filename: PathLike, data, **kwargs):
+    """writes a json file through a temporary file and an atomic rename
+
+    Readers in other processes never see a half written file. The file is
+    created like any other, with the permissions the umask allows.
+    """
+    kwargs.setdefault("ensure_ascii", False)
+    kwargs.setdefault("indent", 4)
+    with atomic_path(filename) as tmp:
+        with open(tmp, "w") as fst:
+            json.dump(data, fst, **kwargs)
+
+
+def update_json(filename: PathLike, data, **kwargs) -> bool:
+    """writes a json file with write_json unless it already holds data
+
+    An unchanged rerun then leaves the file and its mtime alone.
+
+    :return: whether the file was written
+    :rtype: bool
+    """
+    try:
+        with open(filename, "r") as fst:
+            if json.load(fst) == json.loads(json.dumps(data)):
+                return False
+    except (OSError, ValueError):
+        pass
+    write_json(filename, data, **kwargs)
+    return True
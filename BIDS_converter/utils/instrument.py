@@ -0,0 +1,231 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from .fileutils import write_json
+from .utils import PathLike
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# the totals kept for every stage
+METRICS = ("wall", "cpu", "read_bytes", "write_bytes")
+
+
+def io_counters() -> Optional[Dict[str, int]]:
+    """bytes read and written by this process so far, None if unknown
+
+    rchar and wchar count every read and write call, cached or not, which
+    is what the converter itself asked for.
+    """
+    try:
+        with open("/proc/self/io", "r") as fst:
+            fields = dict(line.split(":") for line in fst if ":" in line)
+        return dict(read_bytes=int(fields["rchar"]),
+                    write_bytes=int(fields["wchar"]))
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def max_rss() -> Optional[int]:
+    """peak resident set size of this process in bytes, None if unknown"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def process_tree(pid: int = None) -> List[int]:
+    """a process and every process it started, on Linux
+
+    :param pid: root of the tree, this process by default
+    :type pid: int
+    """
+    pid = os.getpid() if pid is None else pid
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(entry), "r") as fst:
+                # the name in parentheses may hold spaces
+                ppid = int(fst.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):  # exited meanwhile
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, todo = [], [pid]
+    while todo:
+        tree.append(todo.pop())
+        todo.extend(children.get(tree[-1], ()))
+    return tree
+
+
+def tree_memory(pid: int = None) -> Optional[int]:
+    """proportional set size of a process and its descendants in bytes,
+    None if unknown
+
+    Pages the processes share, like a SharedArray mapped by every split
+    process, are divided between them instead of counted once each.
+    """
+    try:
+        tree = process_tree(pid)
+    except OSError:
+        return None
+    total = None
+    for member in tree:
+        try:
+            with open("/proc/{}/smaps_rollup".format(member), "r") as fst:
+                for line in fst:
+                    if line.startswith("Pss:"):
+                        total = (total or 0) + int(line.split()[1]) * 1024
+                        break
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class PeakMemory:
+    """Samples tree_memory in a thread while open, for the peak memory of
+    a job together with the processes it starts
+
+    Where /proc is missing the peak is max_rss of this process instead.
+
+    :param interval: seconds between samples
+    :type interval: float
+    """
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def __enter__(self) -> "PeakMemory":
+        self.peak = None
+        self._done.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        if self.peak is None:
+            self.peak = max_rss()
+
+    def _sample(self):
+        while True:
+            memory = tree_memory()
+            if memory is None:
+                return
+            self.peak = max(self.peak or 0, memory)
+            if self._done.wait(self.interval):
+                return
+
+
+class Profiler:
+    """Records the cost of each named stage of a conversion
+
+    Every stage records its wall and CPU time, the bytes the process read
+    and wrote, the process peak RSS when it ended and, with trace_memory,
+    the peak of memory Python allocated on top of what was allocated when
+    the stage started. Stages may be nested, in which case the outer stage
+    includes the inner ones. A disabled profiler records nothing and costs
+    nothing.
+    """
+
+    def __init__(self, enabled: bool = True, trace_memory: bool = False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.records = []
+        self._stack = []
+        self._started = time.time()
+
+    @contextmanager
+    def stage(self, name: str, subject: str = None, file: PathLike = None):
+        """measures the enclosed block as one record of a stage
+
+        :param name: stage name, such as read_edf or split
+        :type name: str
+        :param subject: subject the work was for
+        :type subject: str
+        :param file: source or output file the work was for
+        :type file: PathLike
+        """
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # the peak so far belongs to the enclosing stages
+            self._propagate_peak()
+            tracemalloc.reset_peak()
+        record = dict(stage=name, subject=subject,
+                      file=None if file is None else str(file),
+                      depth=len(self._stack), peak_traced=0)
+        traced_start = tracemalloc.get_traced_memory()[0] if \
+            self.trace_memory else 0
+        self._stack.append(record)
+        io_start = io_counters()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record["wall"] = time.perf_counter() - wall_start
+            record["cpu"] = time.process_time() - cpu_start
+            io_end = io_counters()
+            for key in ("read_bytes", "write_bytes"):
+                record[key] = None if io_start is None else \
+                    io_end[key] - io_start[key]
+            record["max_rss"] = max_rss()
+            if self.trace_memory:
+                self._propagate_peak()
+                record["peak_traced"] -= traced_start
+            else:
+                del record["peak_traced"]
+            self._stack.pop()
+            self.records.append(record)
+
+    def _propagate_peak(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self._stack:
+            record["peak_traced"] = max(record["peak_traced"], peak)
+
+    def totals(self, records: List[dict] = None) -> Dict[str, dict]:
+        """sums the metrics of each stage over its records"""
+        totals = {}
+        for record in self.records if records is None else records:
+            total = totals.setdefault(record["stage"], dict(
+                count=0, **{m: 0 for m in METRICS}))
+            total["count"] += 1
+            for m in METRICS:
+                if record.get(m) is not None:
+                    total[m] += record[m]
+            for m in ("max_rss", "peak_traced"):
+                if record.get(m) is not None:
+                    total[m] = max(total.get(m, 0), record[m])
+        return totals
+
+    def report(self) -> dict:
+        """the records with totals per stage and per subject and stage"""
+        subjects = {}
+        for record in self.records:
+            if record["subject"] is not None:
+                subjects.setdefault(record["subject"], []).append(record)
+        return dict(started=self._started, pid=os.getpid(),
+                    argv=sys.argv, totals=self.totals(),
+                    subjects={sub: self.totals(records) for sub, records in
+                              subjects.items()},
+                    records=self.records)
+
+    def save(self, filename: PathLike):
+        write_json(filename, self.report())
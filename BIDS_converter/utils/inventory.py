@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import os.path as op
+from typing import Dict, List, Iterator, Tuple, Any
+
+from .archive import strip_archive
+from .organize import match_regexp
+from .utils import PathLike
+
+# longest suffixes first so that ".edf.gz" wins over ".gz"
+FILE_TYPES = {".edf.gz": "edf", ".edf": "edf",
+              ".ieeg.dat.gz": "dat", ".ieeg.dat": "dat",
+              ".dat.gz": "dat", ".dat": "dat",
+              ".mat": "mat",
+              ".txt": "txt",
+              ".nii.gz": "nii", ".nii": "nii", ".mgz": "nii", ".mnc": "nii"}
+
+# config keys classified for every file during the scan
+ENTITIES = ("partLabel", "task", "sessLabel", "runIndex", "acq")
+
+
+def file_type(filename: str) -> str:
+    """classifies a file by its extension, archives by the extension they
+    are named after, so a.edf.tar.xz is an edf
+
+    :param filename: name of the file
+    :type filename: str
+    :return: one of edf, dat, mat, txt, nii or other
+    :rtype: str
+    """
+    name = strip_archive(filename.lower())
+    for ext, f_type in FILE_TYPES.items():
+        if name.endswith(ext):
+            return f_type
+    return "other"
+
+
+def classify(config: dict, filename: str) -> Dict[str, str]:
+    """matches every entity config key against a filename
+
+    :param config: Data2Bids configuration
+    :type config: dict
+    :param filename: name of the file
+    :type filename: str
+    :return: matched value for each entity found in the filename
+    :rtype: dict
+    """
+    entities = {}
+    for key in ENTITIES:
+        if key not in config:
+            continue
+        subtype = isinstance(config[key]["content"][0], list)
+        try:
+            entities[key] = match_regexp(config[key], filename, subtype)
+        except AssertionError:
+            continue
+    return entities
+
+
+def config_hash(config: dict, keys: Tuple[str, ...] = ENTITIES) -> str:
+    """hashes the parts of a config that change file classification"""
+    section = {k: config.get(k) for k in keys}
+    return hashlib.sha1(json.dumps(section, sort_keys=True).encode()
+                        ).hexdigest()
+
+
+class Inventory:
+    """Single pass listing of every file in a Data2Bids input tree
+
+    Each file is recorded with its type, size, mtime and classified
+    entities so that channel discovery and the conversion loop never have to
+    walk the tree or match the config patterns again. Inventories can be
+    saved to and loaded from json so batch runs can reuse them.
+    """
+
+    def __init__(self, data_dir: PathLike, records: Dict[str, List[dict]] =
+                 None, dirs: Dict[str, float] = None, exclude: List[str] =
+                 None, config_id: str = None, cache: Dict[str, Any] = None):
+        self.data_dir = str(data_dir)
+        self.records = records if records is not None else {}
+        self.dirs = dirs if dirs is not None else {}
+        self.exclude = list(exclude) if exclude is not None else []
+        self.config_id = config_id
+        # results derived from the files, such as the channels of each
+        # participant, that stay valid as long as the inventory does
+        self.cache = cache if cache is not None else {}
+
+    @classmethod
+    def build(cls, data_dir: PathLike, config: dict,
+              exclude: List[str] = ()) -> "Inventory":
+        """scans a directory tree once with os.scandir
+
+        :param data_dir: top of the input tree
+        :type data_dir: PathLike
+        :param config: Data2Bids configuration
+        :type config: dict
+        :param exclude: directory names to skip, such as BIDS and stimuli
+        :type exclude: list
+        :return: the filled inventory
+        :rtype: Inventory
+        """
+        inv = cls(data_dir, exclude=exclude, config_id=config_hash(config))
+        inv._scan(inv.data_dir, config)
+        return inv
+
+    def _scan(self, root: str, config: dict):
+        # same top down order as os.walk so downstream matching is unchanged
+        files, dirs = [], []
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.is_dir():
+                    if entry.name not in self.exclude:
+                        dirs.append(entry.path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files.append(dict(name=entry.name,
+                                      type=file_type(entry.name),
+                                      size=st.st_size,
+                                      mtime=st.st_mtime,
+                                      entities=classify(config, entry.name)))
+        self.dirs[root] = op.getmtime(root)
+        if files:
+            self.records[root] = files
+        for sub in dirs:
+            self._scan(sub, config)
+
+    def walk(self) -> Iterator[Tuple[str, List[str]]]:
+        """yields (root, file names) pairs like os.walk for non-empty roots"""
+        for root, records in self.records.items():
+            yield root, [r["name"] for r in records]
+
+    def get(self, root: PathLike, name: str) -> dict:
+        for record in self.records.get(str(root), []):
+            if record["name"] == name:
+                return record
+        raise KeyError(op.join(root, name))
+
+    def file_type(self, root: PathLike, name: str) -> str:
+        try:
+            return self.get(root, name)["type"]
+        except KeyError:
+            return file_type(name)
+
+    def find_a_match(self, root: PathLike, config_key: str,
+                     files: List[str] = None) -> str:
+        """returns the first entity matched for a config key in a root
+
+        :param root: directory the files are in
+        :type root: PathLike
+        :param config_key: config key classified during the scan
+        :type config_key: str
+        :param files: optional ordered subset of file names to search
+        :type files: list
+        :return: matched entity
+        :rtype: str
+        """
+        records = {r["name"]: r for r in self.records.get(str(root), [])}
+        if files is None:
+            files = list(records.keys())
+        for file in files:
+            record = records.get(file)
+            if record is not None and config_key in record["entities"]:
+                return record["entities"][config_key]
+        raise FileNotFoundError("There was no file matching the config key {}"
+                                "".format(config_key), files)
+
+    def is_current(self, config: dict = None, exclude: List[str] = None
+                   ) -> bool:
+        """checks the stored tree against the disk without rescanning it
+
+        Directory mtimes catch added or removed files and file size and
+        mtime catch modified ones.
+        """
+        if config is not None and config_hash(config) != self.config_id:
+            return False
+        if exclude is not None and sorted(exclude) != sorted(self.exclude):
+            return False
+        try:
+            for root, mtime in self.dirs.items():
+                if op.getmtime(root) != mtime:
+                    return False
+            for root, records in self.records.items():
+                for record in records:
+                    st = os.stat(op.join(root, record["name"]))
+                    if (st.st_size, st.st_mtime) != (record["size"],
+                                                     record["mtime"]):
+                        return False
+        except OSError:
+            return False
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(data_dir=self.data_dir, config_id=self.config_id,
+                    exclude=self.exclude, dirs=self.dirs,
+                    records=self.records, cache=self.cache)
+
+    def to_json(self, filename: PathLike):
+        with open(filename, "w") as fst:
+            json.dump(self.to_dict(), fst, indent=1)
+        # saving inside the scanned tree must not make the inventory stale
+        parent = op.dirname(op.abspath(filename))
+        for root in self.dirs.keys():
+            if op.abspath(root) == parent:
+                self.dirs[root] = op.getmtime(root)
+                with open(filename, "w") as fst:
+                    json.dump(self.to_dict(), fst, indent=1)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Inventory":
+        return cls(data["data_dir"], data["records"], data["dirs"],
+                   data["exclude"], data["config_id"], data.get("cache"))
+
+    @classmethod
+    def from_json(cls, filename: PathLike) -> "Inventory":
+        with open(filename, "r") as fst:
+            return cls.from_dict(json.load(fst))
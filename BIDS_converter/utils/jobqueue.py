@@ -0,0 +1,239 @@
+import contextlib
+import json
+import os
+import os.path as op
+import socket
+import threading
+import time
+import uuid
+from typing import Iterator, List, Optional
+
+from .fileutils import write_json
+from .utils import PathLike
+
+QUEUE_DIR = ".queue"
+
+
+def _read_json(filename: PathLike) -> Optional[dict]:
+    try:
+        with open(filename, "r") as fst:
+            return json.load(fst)
+    except (OSError, ValueError):
+        # gone meanwhile, or a lease still being written
+        return None
+
+
+def worker_name() -> str:
+    """host and process of this worker, as recorded in its leases"""
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+class JobQueue:
+    """Jobs shared through a directory by workers on any number of nodes
+
+    Only files are used, no service and no database, so the directory can
+    be on a network file system like NFS that the nodes share. A job is a
+    name.job file. A worker claims it by creating name.lease exclusively and
+    keeps the lease alive by touching it. A lease not touched for lease
+    seconds belongs to a crashed worker: the next claim renames it away,
+    which only one worker can do, and takes the job over. Every claim is
+    appended to name.history by the worker holding the lease, and a
+    finished job gets a name.done file with its status and timing, failed
+    or not.
+
+    Expiry compares file times with this node's clock, so the clocks of the
+    nodes have to agree to well within the lease.
+
+    :param directory: the queue, created if missing
+    :type directory: PathLike
+    :param lease: seconds a lease lasts without a heartbeat
+    :type lease: float
+    """
+
+    def __init__(self, directory: PathLike, lease: float = 600.):
+        self.directory = str(directory)
+        self.lease = lease
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _file(self, name: str, kind: str) -> str:
+        return op.join(self.directory, "{}.{}".format(name, kind))
+
+    def put(self, name: str, job: dict) -> bool:
+        """adds a job unless it is already queued
+
+        :param name: unique name of the job, usable as a file name
+        :type name: str
+        :param job: what the job is, as json
+        :type job: dict
+        :return: whether the job was added
+        :rtype: bool
+        """
+        tmp = op.join(self.directory, ".{}.{}.tmp".format(
+            name, uuid.uuid4().hex))
+        with open(tmp, "w") as fst:
+            json.dump(job, fst)
+        try:
+            # linked once written, so that a claim never reads part of a
+            # job, and only if no job of that name is queued
+            os.link(tmp, self._file(name, "job"))
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp)
+        return True
+
+    def names(self) -> List[str]:
+        """names of the queued jobs, sorted"""
+        return sorted(f[:-len(".job")] for f in os.listdir(self.directory)
+                      if f.endswith(".job") and not f.startswith("."))
+
+    def _age(self, filename: str) -> Optional[float]:
+        try:
+            return time.time() - os.stat(filename).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def claim(self, worker: str = None) -> Optional[dict]:
+        """leases the first job that is neither done nor leased
+
+        A job file that cannot be read is left to whoever may still be
+        writing it for lease seconds, then leased with None as its job, for
+        the worker to record it as failed.
+
+        :param worker: name recorded in the lease, worker_name by default
+        :type worker: str
+        :return: the lease, with the job, or None if no job is free
+        :rtype: dict
+        """
+        for name in self.names():
+            lease_file = self._file(name, "lease")
+            if op.exists(self._file(name, "done")):
+                continue
+            job = _read_json(self._file(name, "job"))
+            if job is None and (self._age(self._file(name, "job")) or 0) \
+                    <= self.lease:
+                continue
+            age = self._age(lease_file)
+            if age is not None:
+                if age <= self.lease:
+                    continue
+                # only one worker can rename the expired lease away
+                expired = "{}.{}.expired".format(lease_file,
+                                                 uuid.uuid4().hex)
+                try:
+                    os.rename(lease_file, expired)
+                except FileNotFoundError:
+                    continue
+                if self._age(expired) <= self.lease:
+                    # another worker took the job over after the age was
+                    # read
+                    with contextlib.suppress(FileExistsError):
+                        os.link(expired, lease_file)
+                    os.remove(expired)
+                    continue
+                os.remove(expired)
+            try:
+                fd = os.open(lease_file,
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            lease = dict(name=name, token=uuid.uuid4().hex,
+                         worker=worker or worker_name(), claimed=time.time())
+            with open(self._file(name, "history"), "a+") as fst:
+                fst.seek(0)
+                lease["attempt"] = sum(1 for _ in fst) + 1
+                fst.write(json.dumps(dict(lease, token=None)) + "\n")
+            lease["job"] = job
+            with os.fdopen(fd, "w") as fst:
+                json.dump(lease, fst)
+                fst.flush()
+                os.fsync(fst.fileno())
+            if op.exists(self._file(name, "done")):
+                # finished by the previous holder after all
+                self._release(lease)
+                continue
+            return lease
+        return None
+
+    def _owns(self, lease: dict) -> bool:
+        held = _read_json(self._file(lease["name"], "lease"))
+        return held is not None and held.get("token") == lease["token"]
+
+    def _release(self, lease: dict):
+        if self._owns(lease):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._file(lease["name"], "lease"))
+
+    def heartbeat(self, lease: dict) -> bool:
+        """renews a lease
+
+        :return: False if the lease expired and another worker took it
+        :rtype: bool
+        """
+        if not self._owns(lease):
+            return False
+        try:
+            os.utime(self._file(lease["name"], "lease"))
+        except FileNotFoundError:
+            return False
+        return True
+
+    @contextlib.contextmanager
+    def held(self, lease: dict, interval: float = None) -> Iterator[dict]:
+        """renews the lease in a thread while the job runs
+
+        :param interval: seconds between heartbeats, a quarter of the lease
+            by default
+        :type interval: float
+        """
+        done = threading.Event()
+        interval = self.lease / 4 if interval is None else interval
+
+        def beat():
+            while not done.wait(interval) and self.heartbeat(lease):
+                pass
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield lease
+        finally:
+            done.set()
+            thread.join()
+
+    def finish(self, lease: dict, result: dict = None):
+        """records a job as done and releases its lease
+
+        :param result: status and anything else to keep about the job
+        :type result: dict
+        """
+        finished = time.time()
+        write_json(self._file(lease["name"], "done"), dict(
+            result or {}, name=lease["name"], worker=lease["worker"],
+            attempt=lease["attempt"], claimed=lease["claimed"],
+            finished=finished,
+            wall=round(finished - lease["claimed"], 3)))
+        self._release(lease)
+
+    def status(self) -> List[dict]:
+        """the state of every job: pending, running, expired or done
+
+        Done jobs come with their recorded result, leased ones with their
+        lease.
+        """
+        states = []
+        for name in self.names():
+            done = _read_json(self._file(name, "done"))
+            if done is not None:
+                states.append(dict(done, state="done"))
+                continue
+            lease_file = self._file(name, "lease")
+            age = self._age(lease_file)
+            lease = _read_json(lease_file) if age is not None else None
+            if lease is None:
+                states.append(dict(name=name, state="pending"))
+                continue
+            del lease["token"]
+            states.append(dict(lease, heartbeat=round(age, 3), state=(
+                "running" if age <= self.lease else "expired")))
+        return states
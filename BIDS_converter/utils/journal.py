@@ -0,0 +1,104 @@
+import json
+import os
+import os.path as op
+from typing import List, Tuple
+
+from .utils import PathLike
+
+JOURNAL_DIR = ".journal"
+
+
+def _plain(obj):
+    # numpy scalars in edf signal headers
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError(repr(obj))
+
+
+class Journal:
+    """Write ahead log of the finished units of work of one subject
+
+    Every unit (a recording read, a run split written, a sidecar) is
+    appended as one json line and synced to disk once its outputs are in
+    place, so a restarted conversion can continue after the last committed
+    unit. The journal is removed once the subject finished and is recorded
+    in the manifest.
+    """
+
+    def __init__(self, bids_dir: PathLike, subject: str):
+        self.filename = op.join(str(bids_dir), JOURNAL_DIR,
+                                "sub-{}.jsonl".format(subject))
+        self.entries = {}
+        if op.isfile(self.filename):
+            with open(self.filename, "r") as fst:
+                for line in fst:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn last line of a crashed run, never committed
+                        continue
+                    self.entries[(entry["kind"], entry["key"])] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, kind: str, key: str) -> dict:
+        return self.entries.get((kind, str(key)), {})
+
+    def done(self, kind: str, key: str) -> bool:
+        """checks that a unit was committed and its outputs are unchanged
+
+        :param kind: type of unit, such as read, split or sidecar
+        :type kind: str
+        :param key: name of the unit, usually a file path
+        :type key: str
+        :return: True if the unit can be skipped
+        :rtype: bool
+        """
+        entry = self.entries.get((kind, str(key)))
+        if entry is None:
+            return False
+        for path, size in entry["outputs"].items():
+            if not op.isfile(path) or op.getsize(path) != size:
+                return False
+        return True
+
+    def commit(self, kind: str, key: str, outputs: List[PathLike] = (),
+               **extra):
+        """appends a finished unit of work and syncs it to disk
+
+        :param kind: type of unit, such as read, split or sidecar
+        :type kind: str
+        :param key: name of the unit, usually a file path
+        :type key: str
+        :param outputs: files the unit wrote, they must already be complete
+        :type outputs: list
+        """
+        entry = dict(kind=kind, key=str(key), outputs={
+            str(f): op.getsize(f) for f in outputs}, **extra)
+        os.makedirs(op.dirname(self.filename), exist_ok=True)
+        line = (json.dumps(entry, default=_plain) + "\n").encode()
+        # a single O_APPEND write keeps lines from parallel workers whole
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.entries[(kind, str(key))] = entry
+
+    def outputs(self, kind: str) -> List[str]:
+        """every output committed for one kind of unit"""
+        return [f for (k, _), entry in self.entries.items() if k == kind
+                for f in entry["outputs"]]
+
+    def keys(self, kind: str) -> List[Tuple[str, str]]:
+        return [key for (k, key) in self.entries.keys() if k == kind]
+
+    def clear(self):
+        if op.isfile(self.filename):
+            os.remove(self.filename)
+        if op.isdir(op.dirname(self.filename)) and not os.listdir(
+                op.dirname(self.filename)):
+            os.rmdir(op.dirname(self.filename))
+        self.entries = {}
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import os.path as op
+from typing import Dict, List
+
+from .fileutils import write_json
+from .utils import PathLike
+
+MANIFEST_DIR = ".manifest"
+
+# config keys each kind of output depends on, any change to these forces a
+# reconversion of the matching units
+CONFIG_SECTIONS = {
+    "ieeg": ("ieeg", "eventFormat", "eventFiles", "split", "partLabel",
+             "task", "sessLabel", "runIndex", "acq", "ce", "institution",
+             "coordsystem", "JSON_files"),
+    "anat": ("anat", "compress", "compressLevel", "partLabel", "task",
+             "sessLabel", "runIndex", "acq", "ce", "echo",
+             "pulseSequenceType"),
+    "func": ("func", "compress", "compressLevel", "repetitionTimeInSec",
+             "delayTimeInSec", "series", "partLabel", "task", "sessLabel",
+             "runIndex", "acq", "ce", "echo", "pulseSequenceType")
+}
+
+HASH_BLOCK = 1 << 20
+
+
+def fast_hash(filename: PathLike, block: int = HASH_BLOCK) -> str:
+    """hashes the size and the first, middle and last blocks of a file
+
+    Reading three blocks keeps the cost constant for multi GB recordings
+    while still catching rewritten files.
+    """
+    size = os.path.getsize(filename)
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(filename, "rb") as f:
+        for offset in sorted({0, max(size // 2 - block // 2, 0),
+                              max(size - block, 0)}):
+            f.seek(offset)
+            h.update(f.read(block))
+    return h.hexdigest()
+
+
+def config_id(config: dict, section: str = None) -> str:
+    """hash of the config keys a data type depends on, or the whole config"""
+    if section not in CONFIG_SECTIONS:
+        part = config
+    else:
+        part = {k: config.get(k) for k in CONFIG_SECTIONS[section]}
+    # the ieeg type is filled in from the workbook during conversion
+    part = json.loads(json.dumps(part))
+    if isinstance(part.get("ieeg"), dict):
+        part["ieeg"].pop("type", None)
+    return hashlib.sha1(json.dumps(part, sort_keys=True).encode()).hexdigest()
+
+
+class Manifest:
+    """Record of what was converted from what, for incremental conversions
+
+    One json file per subject is kept in BIDS/.manifest so that subjects
+    converted in parallel never write the same file. Each unit of work maps
+    to the size, mtime and fast hash of its source files, the hash of the
+    config section used and the output files it produced.
+    """
+
+    def __init__(self, bids_dir: PathLike, subject: str):
+        self.bids_dir = str(bids_dir)
+        self.filename = op.join(self.bids_dir, MANIFEST_DIR,
+                                "sub-{}.json".format(subject))
+        self.units = {}
+        if op.isfile(self.filename):
+            with open(self.filename, "r") as fst:
+                self.units = json.load(fst)
+
+    def get(self, key: str) -> dict:
+        return self.units.get(key, {})
+
+    def outputs(self, key: str) -> List[str]:
+        """absolute paths of the outputs recorded for a unit"""
+        return [op.join(self.bids_dir, f) for f in self.get(key).get(
+            "outputs", [])]
+
+    def is_current(self, key: str, sources: Dict[str, PathLike],
+                   config_hash: str) -> bool:
+        """checks if a unit can be skipped
+
+        :param key: name of the unit of work
+        :type key: str
+        :param sources: source file labels mapped to their paths
+        :type sources: dict
+        :param config_hash: hash of the config section the unit depends on
+        :type config_hash: str
+        :return: True if sources, config and outputs are all unchanged
+        :rtype: bool
+        """
+        entry = self.units.get(key)
+        if entry is None or entry["config"] != config_hash:
+            return False
+        if set(entry["sources"].keys()) != set(sources.keys()):
+            return False
+        for label, path in sources.items():
+            old = entry["sources"][label]
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            if st.st_size != old["size"]:
+                return False
+            # only read the file when the mtime moved, e.g. after a re-copy
+            if st.st_mtime != old["mtime"] and fast_hash(path) != old["hash"]:
+                return False
+        return all(op.exists(f) for f in self.outputs(key))
+
+    def update(self, key: str, sources: Dict[str, PathLike],
+               config_hash: str, outputs: List[PathLike], **extra):
+        """records a unit of work after it was converted"""
+        signatures = {}
+        for label, path in sources.items():
+            st = os.stat(path)
+            signatures[label] = dict(size=st.st_size, mtime=st.st_mtime,
+                                     hash=fast_hash(path))
+        self.units[key] = dict(
+            sources=signatures, config=config_hash,
+            outputs=sorted({op.relpath(f, self.bids_dir) for f in outputs}),
+            **extra)
+
+    def save(self):
+        os.makedirs(op.dirname(self.filename), exist_ok=True)
+        write_json(self.filename, self.units, indent=1)
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import datetime
+import importlib
+import uuid
+from typing import Dict, Iterable, List
+
+from .fileutils import atomic_path
+from .utils import PathLike, lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+NWB_VERSION = "2.6.0"
+# volts per unit of the EDF signal dimensions
+CONVERSION = {"v": 1., "mv": 1e-3, "uv": 1e-6, "µv": 1e-6, "nv": 1e-9}
+# events.tsv columns that are stored as interval times instead
+TIME_COLUMNS = ("onset", "duration", "sample")
+
+
+def _h5py():
+    """h5py, which is only needed for NWB output"""
+    try:
+        return importlib.import_module("h5py")
+    except ImportError as e:
+        raise ImportError("h5py is required to write NWB files, install it "
+                          "with pip install h5py") from e
+
+
+def _typed(h5obj, neurodata_type: str, **attrs):
+    h5obj.attrs.update(namespace="core", neurodata_type=neurodata_type,
+                       object_id=str(uuid.uuid4()), **attrs)
+    return h5obj
+
+
+def _column(table, name: str, values, description: str = ""):
+    values = list(values)
+    if values and isinstance(values[0], str):
+        data = table.create_dataset(name, data=values,
+                                    dtype=_h5py().string_dtype())
+    else:
+        data = table.create_dataset(name, data=np.asarray(values, float))
+    _typed(data, "VectorData", description=description)
+    return data
+
+
+def _table(group, description: str, columns: Dict[str, Iterable],
+           neurodata_type: str = "DynamicTable"):
+    """writes the columns of an hdmf DynamicTable into group"""
+    _typed(group, neurodata_type, description=description,
+           colnames=list(columns))
+    n_rows = 0
+    for name, values in columns.items():
+        n_rows = len(_column(group, name, values))
+    _typed(group.create_dataset("id", data=np.arange(n_rows)),
+           "ElementIdentifiers")
+    return group
+
+
+def electrode_columns(labels: List[str], electrodes: pd.DataFrame = None
+                      ) -> Dict[str, list]:
+    """electrode table columns of the channels from the electrodes.tsv rows
+
+    Channels without coordinates, such as the trigger, get NaN positions.
+
+    :param labels: channel names in recording order
+    :type labels: list
+    :param electrodes: name, x, y, z and hemisphere of each electrode, as
+        written from the RAS file by org.prep_coordsystem
+    :type electrodes: pd.DataFrame
+    """
+    rows = {} if electrodes is None else electrodes.set_index(
+        "name").to_dict("index")
+    columns = dict(x=[], y=[], z=[], location=[], group_name=[], label=[])
+    for label in labels:
+        row = rows.get(label, {})
+        for axis in ("x", "y", "z"):
+            columns[axis].append(row.get(axis, np.nan))
+        location = row.get("hemisphere", "n/a")
+        columns["location"].append("n/a" if pd.isna(location) else
+                                   str(location))
+        columns["group_name"].append("ieeg")
+        columns["label"].append(label)
+    return columns
+
+
+def event_columns(events: pd.DataFrame, start: int, sample_rate: float
+                  ) -> Dict[str, list]:
+    """TimeIntervals columns of events.tsv rows of a section
+
+    :param start: sample of the recording the section begins at
+    :type start: int
+    """
+    events = events[pd.to_numeric(events["sample"], errors="coerce").notna()]
+    onset = (pd.to_numeric(events["sample"]) - start) / sample_rate
+    duration = pd.to_numeric(events["duration"], errors="coerce").fillna(0)
+    columns = dict(start_time=onset.tolist(),
+                   stop_time=(onset + duration).tolist())
+    for name in events.columns:
+        if name in TIME_COLUMNS:
+            continue
+        values = events[name]
+        if pd.api.types.is_numeric_dtype(values):
+            columns[name] = values.astype(float).tolist()
+        else:
+            columns[name] = values.fillna("n/a").astype(str).tolist()
+    return columns
+
+
+def write_nwb(filename: PathLike, blocks: Iterable[np.ndarray],
+              signal_headers: List[dict], sample_rate: float, n_samples: int,
+              electrodes: pd.DataFrame = None, events: pd.DataFrame = None,
+              start: int = 0, identifier: str = None,
+              description: str = "iEEG recording converted by data2bids",
+              start_time: datetime.datetime = None,
+              chunk_seconds: float = 1., chunk_channels: int = 16,
+              compression_level: int = 1, shuffle: bool = False
+              ) -> List[str]:
+    """streams a recording into an NWB style HDF5 file
+
+    The samples are stored as float32 physical values in the data of
+    /acquisition/ElectricalSeries, time by channels like NWB, in chunks of
+    chunk_seconds by chunk_channels compressed with gzip, so time windows of
+    a subset of channels can be read without decompressing the rest of the
+    file. Higher levels and the shuffle filter cost much more time than
+    they save space on quantized EDF values. Electrodes are rows of the
+    /general/extracellular_ephys/electrodes table and events rows of the
+    /intervals/events table. The file is written atomically.
+
+    :param filename: .nwb file to write
+    :type filename: PathLike
+    :param blocks: channels by samples blocks, as from edf.read_blocks.
+        Blocks that are a multiple of the time chunk are fastest
+    :type blocks: Iterable[np.ndarray]
+    :param signal_headers: pyedflib signal headers of the channels
+    :type signal_headers: list
+    :param sample_rate: samples per second
+    :type sample_rate: float
+    :param n_samples: total samples in blocks
+    :type n_samples: int
+    :param electrodes: electrodes.tsv rows of the subject
+    :type electrodes: pd.DataFrame
+    :param events: events.tsv rows of the recording
+    :type events: pd.DataFrame
+    :param start: sample of the recording the first block begins at
+    :type start: int
+    :param compression_level: gzip level of the data chunks
+    :type compression_level: int
+    :param shuffle: whether to byte shuffle the data chunks before gzip
+    :type shuffle: bool
+    :return: the written file
+    :rtype: list
+    """
+    h5py = _h5py()
+    labels = [h["label"] for h in signal_headers]
+    n_channels = len(labels)
+    start_time = (start_time or datetime.datetime(
+        1900, 1, 1, tzinfo=datetime.timezone.utc)).isoformat()
+    chunks = (max(min(int(chunk_seconds * sample_rate), n_samples), 1),
+              max(min(chunk_channels, n_channels), 1))
+    unit = str(signal_headers[0].get("dimension") or "uV").lower()
+
+    with atomic_path(filename) as tmp, h5py.File(tmp, "w") as h5:
+        _typed(h5, "NWBFile", nwb_version=NWB_VERSION)
+        h5["identifier"] = identifier or str(uuid.uuid4())
+        h5["session_description"] = description
+        h5["session_start_time"] = start_time
+        h5["timestamps_reference_time"] = start_time
+        h5.create_dataset("file_create_date", data=[
+            datetime.datetime.now().astimezone().isoformat()],
+                          dtype=h5py.string_dtype())
+
+        _typed(h5.create_group("general/devices/ieeg"), "Device",
+               description="iEEG amplifier")
+        ecephys = h5.create_group("general/extracellular_ephys")
+        group = _typed(ecephys.create_group("ieeg"), "ElectrodeGroup",
+                       description="iEEG electrodes", location="n/a")
+        group["device"] = h5py.SoftLink("/general/devices/ieeg")
+        table = _table(ecephys.create_group("electrodes"),
+                       "metadata about extracellular electrodes",
+                       electrode_columns(labels, electrodes))
+        table.attrs["colnames"] = list(table.attrs["colnames"]) + ["group"]
+        _typed(table.create_dataset("group", data=[group.ref] * n_channels,
+                                    dtype=h5py.ref_dtype), "VectorData",
+               description="reference to the ElectrodeGroup")
+
+        series = _typed(h5.create_group("acquisition/ElectricalSeries"),
+                        "ElectricalSeries", description="iEEG channels",
+                        comments="no comments")
+        data = series.create_dataset(
+            "data", shape=(n_samples, n_channels), dtype="<f4",
+            chunks=chunks, compression="gzip",
+            compression_opts=compression_level, shuffle=shuffle)
+        data.attrs.update(unit="volts", conversion=CONVERSION.get(unit, 1.),
+                          resolution=-1., offset=0.)
+        timing = series.create_dataset("starting_time", data=0.)
+        timing.attrs.update(rate=float(sample_rate), unit="seconds")
+        _typed(series.create_dataset("electrodes",
+                                     data=np.arange(n_channels)),
+               "DynamicTableRegion", description="the channels of the series",
+               table=table.ref)
+
+        pos = 0
+        for block in blocks:
+            count = block.shape[1]
+            if pos + count > n_samples:
+                raise ValueError("blocks hold more than {} samples".format(
+                    n_samples))
+            data[pos:pos + count] = block.T
+            pos += count
+        if pos != n_samples:
+            raise ValueError("{} samples were written, {} expected".format(
+                pos, n_samples))
+
+        if events is not None and len(events):
+            _table(h5.create_group("intervals/events"),
+                   "events of the events.tsv file",
+                   event_columns(events, start, sample_rate),
+                   "TimeIntervals")
+    return [str(filename)]
+
+
+def read_header(filename: PathLike) -> Dict[str, object]:
+    """channels, sample rate and length of an NWB file from write_nwb"""
+    h5py = _h5py()
+    with h5py.File(filename, "r") as h5:
+        series = h5["acquisition/ElectricalSeries"]
+        labels = h5["general/extracellular_ephys/electrodes/label"]
+        return dict(channels=[s.decode() if isinstance(s, bytes) else s
+                              for s in labels[()]],
+                    sample_rate=float(series["starting_time"].attrs["rate"]),
+                    n_samples=series["data"].shape[0])
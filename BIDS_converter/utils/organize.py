@@ -1,15 +1,23 @@
+from __future__ import annotations
+
 import os.path as op
 import re
 from os import listdir
 from typing import List, Dict, Union, Any
 
-import exrex as ex
-import pandas as pd
-from matgrab import mat2df
-from scipy.io import wavfile
-from numpy import nan
+from .utils import is_number, PathLike, str2num, lazy_import
+
+# deferred until first use, see utils.lazy_import
+ex = lazy_import("exrex")
+matgrab = lazy_import("matgrab")
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
 
-from .utils import is_number, PathLike, str2num
+def mat2df(mat_file: PathLike, var: str = None, filepath: str = None
+           ) -> pd.DataFrame:
+    """matgrab.mat2df, imported on the first call"""
+    return matgrab.mat2df(mat_file, var, filepath)
 
 
 def gather_metadata(mat_files: List[PathLike]) -> pd.DataFrame:
@@ -119,6 +127,7 @@ def reframe_events(df_in: pd.DataFrame, events: Union[list, dict],
                         else:
                             raise FileNotFoundError("stim_dir required for"
                             " .wav files")
+                        from scipy.io import wavfile
                         try:
                             frames, data = wavfile.read(fname)
                         except FileNotFoundError as e:
@@ -424,8 +433,9 @@ def eval_df(df: pd.DataFrame, exp: str) -> pd.Series:
 
 def wavfile_dur(filename: Union[PathLike, None], dir: PathLike = None) -> float:
     """"""
+    from scipy.io import wavfile
     if filename is None:
-        return nan
+        return np.nan
     if dir is not None:
         filename = op.join(dir, filename)
     frames, data = wavfile.read(filename)
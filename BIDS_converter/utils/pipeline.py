@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import contextlib
+import multiprocessing
+import os
+import os.path as op
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Sequence, Tuple
+
+from .utils import PathLike, lazy_import
+
+np = lazy_import("numpy")
+
+# queue entry that ends a stage
+_END = object()
+# seconds between checks for a stopped pipeline while a queue is blocked
+_POLL = 0.1
+# memory backed file system for the arrays shared with pool processes
+SHARED_DIR = "/dev/shm"
+# bytes left free in SHARED_DIR, writing past its end crashes the process
+SHARED_MARGIN = 1 << 26
+# start of the SharedArray file names, followed by the pid of the owner
+SHARED_PREFIX = "data2bids-"
+
+
+def _done(value=None, error: BaseException = None) -> Future:
+    future = Future()
+    if error is None:
+        future.set_result(value)
+    else:
+        future.set_exception(error)
+    return future
+
+
+def pipeline(items: Iterable, stages: Sequence[Callable] = (),
+             workers: Sequence[int] = None, maxsize: int = 2,
+             threaded: bool = True) -> Iterator:
+    """runs every item through the stages, each stage on its own threads
+
+    items is iterated on a reader thread, so a generator that reads files
+    prefetches the next item while the stages work on the current ones.
+    Each stage hands its results to the next through a queue of at most
+    maxsize items, so a slow stage holds up the ones before it instead of
+    letting results pile up in memory. A stage with several workers works
+    on that many items at once and results still come out in input order.
+
+    The first exception of the reader or of a stage is raised by the
+    iterator. Closing the iterator early stops every thread. Without
+    threads, every item goes through all the stages in the caller's thread
+    before the next one is read, which is faster when there is nothing to
+    overlap, such as on a single core with local disks.
+
+    :param items: inputs of the first stage
+    :type items: Iterable
+    :param stages: functions of one argument, each called with the result
+        of the one before it
+    :type stages: Sequence[Callable]
+    :param workers: threads of each stage, one by default
+    :type workers: Sequence[int]
+    :param maxsize: items each queue holds before blocking its producer
+    :type maxsize: int
+    :param threaded: whether to run the reader and stages on threads
+    :type threaded: bool
+    :return: results of the last stage
+    :rtype: Iterator
+    """
+    workers = list(workers or [1] * len(stages))
+    if len(workers) != len(stages):
+        raise ValueError("{} worker counts given for {} stages".format(
+            len(workers), len(stages)))
+    if not threaded:
+        yield from _inline(items, stages)
+        return
+    stop = threading.Event()
+    queues = [queue.Queue(max(maxsize, 1)) for _ in range(len(stages) + 1)]
+
+    def put(q: queue.Queue, entry) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(entry, timeout=_POLL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q: queue.Queue):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=_POLL)
+            except queue.Empty:
+                continue
+        return _END
+
+    def read():
+        it = iter(items)
+        try:
+            for item in it:
+                if not put(queues[0], _done(item)):
+                    return
+        except BaseException as e:
+            put(queues[0], _done(error=e))
+        finally:
+            if hasattr(it, "close"):
+                it.close()
+        put(queues[0], _END)
+
+    def run(k: int, pool: ThreadPoolExecutor):
+        while True:
+            future = get(queues[k])
+            if future is _END:
+                put(queues[k + 1], _END)
+                return
+            try:
+                value = future.result()
+            except BaseException:
+                # failures travel down to the caller in order
+                if not put(queues[k + 1], future):
+                    return
+                continue
+            if not put(queues[k + 1], pool.submit(stages[k], value)):
+                return
+
+    pools = [ThreadPoolExecutor(max(n, 1), thread_name_prefix="pipeline")
+             for n in workers]
+    threads = [threading.Thread(target=read, daemon=True)] + [
+        threading.Thread(target=run, args=(k, pool), daemon=True)
+        for k, pool in enumerate(pools)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            future = queues[-1].get()
+            if future is _END:
+                return
+            yield future.result()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for pool in pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _inline(items: Iterable, stages: Sequence[Callable]) -> Iterator:
+    for item in items:
+        for stage in stages:
+            item = stage(item)
+        yield item
+
+
+def prefetch(items: Iterable, maxsize: int = 2) -> Iterator:
+    """iterates items on a reader thread, up to maxsize items ahead
+
+    :param items: items that are slow to produce, such as blocks read from
+        a file
+    :type items: Iterable
+    :param maxsize: items read ahead of the caller
+    :type maxsize: int
+    """
+    return pipeline(items, maxsize=maxsize)
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # of another user
+        pass
+    return True
+
+
+def remove_stale(directory: PathLike):
+    """removes the SharedArray files of processes that no longer run
+
+    A process that is killed, or runs out of memory, cannot close its
+    arrays, and their files would hold the memory of /dev/shm until the
+    next reboot.
+
+    :param directory: where the arrays are created
+    :type directory: PathLike
+    """
+    if os.name != "posix":  # os.kill would end the process on Windows
+        return
+    with contextlib.suppress(FileNotFoundError):
+        for f in os.listdir(directory):
+            pid = f[len(SHARED_PREFIX):].split("-", 1)[0]
+            if not f.startswith(SHARED_PREFIX) or not pid.isdigit() or \
+                    _running(int(pid)):
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(op.join(directory, f))
+
+
+class SharedArray:
+    """an array in a memory mapped file, that pool processes open by its
+    handle to read the parts they need without a copy
+
+    The file is in /dev/shm where it exists and has room for the array, so
+    that only memory holds it, and in the temporary directory otherwise.
+    It is removed by close, or else by the next SharedArray created after
+    the process ended, see remove_stale.
+
+    :param shape: shape of the array
+    :type shape: tuple
+    :param dtype: numpy type of the values
+    :type dtype: str
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype):
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype).str
+        nbytes = int(np.prod(self.shape)) * np.dtype(dtype).itemsize
+        directory = None
+        if op.isdir(SHARED_DIR) and shutil.disk_usage(
+                SHARED_DIR).free > nbytes + SHARED_MARGIN:
+            directory = SHARED_DIR
+        remove_stale(tempfile.gettempdir() if directory is None else
+                     directory)
+        fd, self.filename = tempfile.mkstemp(
+            prefix="{}{}-".format(SHARED_PREFIX, os.getpid()),
+            suffix=".dat", dir=directory)
+        try:
+            os.ftruncate(fd, max(nbytes, 1))
+        finally:
+            os.close(fd)
+        self.array = np.memmap(self.filename, self.dtype, "r+",
+                               shape=self.shape)
+
+    @property
+    def handle(self) -> Tuple[str, str, Tuple[int, ...]]:
+        """what attach needs to open the array in another process"""
+        return self.filename, self.dtype, self.shape
+
+    def close(self):
+        self.array = None
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.filename)
+
+    def __enter__(self) -> SharedArray:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(handle: Tuple[str, str, Tuple[int, ...]]) -> np.ndarray:
+    """the read only array of a SharedArray handle, mapped into memory"""
+    filename, dtype, shape = handle
+    return np.memmap(filename, dtype, "r", shape=shape)
+
+
+def process_pool(workers: int, initializer: Callable = None,
+                 initargs: tuple = ()) -> ProcessPoolExecutor:
+    """a pool of processes started from a clean server process
+
+    The converter runs threads, and a process forked while another thread
+    holds a lock, such as the one of stdout, can hang on it. Where the
+    forkserver start method exists the processes are forked from a server
+    without threads instead.
+
+    :param workers: processes of the pool
+    :type workers: int
+    :param initializer: called with initargs in each process as it starts
+    :type initializer: Callable
+    """
+    context = None
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+    return ProcessPoolExecutor(workers, context, initializer, initargs)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from .utils import lazy_import
+
+np = lazy_import("numpy")
+
+# names accepted in the config "series" key
+SCHEMES = ("sequential", "non-interleaved", "odd-interleaved",
+           "even-interleaved")
+
+
+def acquisition_order(n_slices: int, scheme: str = "sequential"
+                      ) -> np.ndarray:
+    """slice indices in the order they are acquired
+
+    Slices are numbered from 0 at the bottom of the stack, so
+    odd-interleaved acquires the 1st, 3rd, 5th... slice positions first.
+
+    :param n_slices: number of slices excited one after another
+    :type n_slices: int
+    :param scheme: one of SCHEMES
+    :type scheme: str
+    :return: slice index of each excitation
+    :rtype: np.ndarray
+    """
+    if scheme in ("sequential", "non-interleaved"):
+        return np.arange(n_slices)
+    elif scheme == "odd-interleaved":
+        return np.concatenate((np.arange(0, n_slices, 2),
+                               np.arange(1, n_slices, 2)))
+    elif scheme == "even-interleaved":
+        return np.concatenate((np.arange(1, n_slices, 2),
+                               np.arange(0, n_slices, 2)))
+    raise ValueError("Unknown slice acquisition scheme {}, expected one of {}"
+                     "".format(scheme, ", ".join(SCHEMES)))
+
+
+def slice_times(TR: float, n_slices: int, scheme: str = "sequential",
+                multiband: int = 1, delay: float = 0.) -> np.ndarray:
+    """acquisition time of every slice for BIDS SliceTiming
+
+    Excitations are spread evenly over TR - delay like
+    utils.slice_time_calc. With multiband, the stack is split into
+    multiband bands acquired simultaneously, each following the scheme.
+
+    :param TR: repetition time in seconds
+    :type TR: float
+    :param n_slices: total number of slices
+    :type n_slices: int
+    :param scheme: one of SCHEMES
+    :type scheme: str
+    :param multiband: number of slices excited at once
+    :type multiband: int
+    :param delay: time before the first excitation in seconds
+    :type delay: float
+    :return: time of each slice in spatial order
+    :rtype: np.ndarray
+    """
+    if n_slices % multiband:
+        raise ValueError("{} slices cannot be split into {} bands".format(
+            n_slices, multiband))
+    n_excitations = n_slices // multiband
+    band = np.empty(n_excitations)
+    band[acquisition_order(n_excitations, scheme)] = delay + np.arange(
+        n_excitations) * (TR - delay) / n_excitations
+    return np.tile(band, multiband)
@@ -1,17 +1,48 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import importlib.util
 import os
 import subprocess
+import sys
 from pathlib import Path
+from types import ModuleType
 from typing import Union, TypeVar
 
-import numpy as np
-import pandas as pd
-
 PathLike = TypeVar("PathLike", str, os.PathLike)
 
 
+def lazy_import(name: str) -> ModuleType:
+    """imports a module when one of its attributes is first used
+
+    The scientific stack takes most of a second to import, which --help,
+    argument errors and the batch and stage drivers should not pay for.
+    Only top level packages should be given, since finding a submodule
+    imports its parents right away.
+
+    :param name: absolute module name
+    :type name: str
+    :return: the module, loaded on first attribute access
+    :rtype: ModuleType
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError("No module named {!r}".format(name),
+                                  name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+
 class DisplayablePath:
     """this code creates a tree visual to explain the BIDS file organization
 
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import os.path as op
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from BIDS_converter import batch
+from BIDS_converter.utils.jobqueue import JobQueue, QUEUE_DIR, worker_name
+
+
+def get_parser():  # parses flags at onset of command
+    parser = argparse.ArgumentParser(
+        prog="data2bids worker",
+        formatter_class=argparse.RawDescriptionHelpFormatter, description="""
+        Converts the jobs of a queue in the output root, one at a time, until
+        every job of the queue is done. The same command can be run on any
+        number of nodes that share the input and output directories, for
+        example over NFS, without any service running.
+
+        Each worker first adds the jobs its arguments define to the queue,
+        skipping those already queued, then claims jobs with a lease it
+        renews while converting. The job of a crashed worker is taken over
+        by another worker once its lease expires. The status and timing of
+        every job is kept in {output_root}/.queue, see --status.""",
+        epilog="""
+        Made by Aaron Earle-Richardson (ae166@duke.edu)
+        """)
+
+    batch.add_job_arguments(parser, required=False)
+    parser.add_argument("--lease", type=float, default=600.,
+                        help="seconds without a heartbeat after which a job "
+                             "is taken from its worker. Default: 600")
+    parser.add_argument("--poll", type=float, default=30.,
+                        help="seconds between looks for expired leases once "
+                             "the remaining jobs are all claimed. Default: "
+                             "30")
+    parser.add_argument("--status", action='store_true',
+                        help="only print the state of every queued job")
+    return parser
+
+
+def job_name(job: dict) -> str:
+    return "{}_{}".format(job["task"], job["sub"])
+
+
+def work(queue: JobQueue, worker: str = None, poll: float = 30.
+         ) -> List[dict]:
+    """converts the jobs of a queue until none is pending or leased
+
+    :param queue: queue of batch jobs
+    :type queue: JobQueue
+    :param worker: name recorded in the leases, worker_name by default
+    :type worker: str
+    :param poll: seconds to wait for leases of other workers to expire or
+        be released
+    :type poll: float
+    :return: results of the jobs this worker converted
+    :rtype: list
+    """
+    results = []
+    while True:
+        lease = queue.claim(worker)
+        if lease is None:
+            if all(job["state"] == "done" for job in queue.status()):
+                return results
+            time.sleep(poll)
+            continue
+        if lease["job"] is None:
+            # a job file that cannot be read fails instead of the worker
+            task, _, sub = lease["name"].rpartition("_")
+            result = dict(sub=sub, task=task, status="failed",
+                          error="unreadable job file", seconds=0.)
+        else:
+            with queue.held(lease):
+                result = batch.convert(lease["job"])
+        queue.finish(lease, result)
+        results.append(result)
+        print("{status:>6} {task} {sub} ({seconds}s, attempt {attempt})"
+              .format(attempt=lease["attempt"], **result))
+
+
+def main(argv: List[str] = None) -> dict:
+    args = get_parser().parse_args(argv)
+    queue = JobQueue(op.join(args.output_root, QUEUE_DIR), args.lease)
+    if not args.status:
+        if args.input_root is None:
+            raise ValueError("--input_root is needed to convert")
+        # one job at a time, with every core of the node
+        jobs = batch.build_jobs(args)
+        for task in dict.fromkeys(job["task"] for job in jobs):
+            batch.prepare_output(op.join(args.output_root, task, "BIDS"))
+        added = sum(queue.put(job_name(job), job) for job in jobs)
+        print("{} of {} jobs added to {}".format(added, len(jobs),
+                                                  queue.directory))
+        work(queue, worker_name(), args.poll)
+    states = queue.status()
+    for state in states:
+        print("{:>8} {} ({})".format(state["state"], state["name"], ", ".join(
+            "{}={}".format(key, state[key]) for key in (
+                "status", "worker", "attempt", "wall") if key in state)))
+    failed = [s for s in states if s.get("status", "ok") != "ok"]
+    return dict(jobs=len(states), done=sum(
+        s["state"] == "done" for s in states), failed=len(failed),
+        states=states)
+
+
+if __name__ == '__main__':
+    main()